@@ -0,0 +1,208 @@
+"""
+Batch processing of several configurations in a single pass over the comb data.
+Configurations sharing a comb directory (and how its files are read) are processed together:
+each comb file is fixed, found and parsed once and its data is processed for the DO setups of every configuration that includes its date.
+Outputs, statistics, auto files and events of processing are kept separate for each configuration
+(events of fixing and parsing the shared comb files are logged in the output directory of the batch run).
+
+"""
+
+import os
+
+from tqdm import tqdm
+
+from super_auto_comb.events import EVENTS_FILE, thread_event_log
+from super_auto_comb.load_files import prefetch
+from super_auto_comb.readers import reader_patterns
+from super_auto_comb.save_files import append_table
+from super_auto_comb.shm import open_writers
+from super_auto_comb.utils import generate_dates
+
+
+def load_key(args):
+    """Return the options of a configuration that determine how comb files are read."""
+    return (
+        os.path.abspath(args.comb_dir),
+        args.reader,
+        args.max_columns,
+        args.gate_time,
+        args.do_not_fix_summer_time,
+        args.timezone,
+        args.merge_counters,
+        args.merge_tolerance,
+    )
+
+
+def batch_runs(config_files):
+    """Parse configuration files and return the runs to be processed.
+
+    Parameters
+    ----------
+    config_files : list of str
+        Configuration files (as for super-auto-comb -c).
+
+    Returns
+    -------
+    list of dict
+        For each configuration, its file, parsed arguments, start and stop (MJD), dates saved in the auto file and dates to be processed
+        (as {YYMMDD: datetime}).
+    """
+    from super_auto_comb.cli import date_range, parse_args
+
+    runs = []
+    for file in config_files:
+        args = parse_args(["-c", file])
+        for option in ["stream", "shard", "plan", "sweep", "batch"]:
+            if getattr(args, option):
+                tqdm.write(f"{file}: --{option} is ignored in batch mode.")
+                setattr(args, option, None)
+        if not args.do:
+            tqdm.write(f"{file}: no DO to be processed.")
+            continue
+
+        start, stop, auto_list = date_range(args)
+        dates = {d.strftime("%y%m%d"): d for d in generate_dates(start, stop)}
+        runs += [{"config": file, "args": args, "start": start, "stop": stop, "auto_list": auto_list, "dates": dates}]
+
+    return runs
+
+
+def run_batch(config_files):
+    """Process several configurations, reading each comb file once.
+
+    Parameters
+    ----------
+    config_files : list of str
+        Configuration files (as for super-auto-comb -c).
+
+    Returns
+    -------
+    list of dict
+        The processed runs (see batch_runs), with the names of their comb files.
+    """
+    runs = batch_runs(config_files)
+
+    groups = {}
+    for run in runs:
+        groups.setdefault(load_key(run["args"]), []).append(run)
+
+    for group in groups.values():
+        process_group(group)
+
+    return runs
+
+
+def process_group(group):
+    """Process runs of configurations sharing how comb files are read, in a single pass over the union of their files.
+
+    Parameters
+    ----------
+    group : list of dict
+        Runs as returned by batch_runs. The names of the comb files of each run are added as run["files"].
+    """
+    from super_auto_comb.cli import (
+        DIAGNOSTICS_FILE,
+        STATS_FILE,
+        comb_loader,
+        find_comb_files,
+        group_comb_files,
+        update_auto_file,
+    )
+
+    first = group[0]["args"]
+
+    # LOOP 1: fix and find files on the union of the dates of all runs
+    dates = {}
+    for run in group:
+        dates.update(run["dates"])
+    files = find_comb_files(first.comb_dir, [dates[k] for k in sorted(dates)], reader_patterns(first.reader))
+
+    active = []
+    for run in group:
+        run["files"] = [f for f in files if f[:6] in run["dates"]]
+        if run["files"]:
+            active += [run]
+        else:
+            tqdm.write(f"{run['config']}: no files to be processed.")
+
+    if not active:
+        return
+
+    # pandas and tintervals are slow to import, so only load them when needed
+    from super_auto_comb.process import (
+        compact_setups,
+        load_setups,
+        process_data,
+        publish_outputs,
+        save_outputs,
+        setup_channels,
+    )
+
+    # LOOP 2: load DOs info of each run
+    usecols = set()
+    for run in active:
+        args = run["args"]
+        run["in_setups"], run["out_setups"] = load_setups(args, (run["start"], run["stop"]))
+        run["writers"] = open_writers(args.shm, args.do, size=args.shm_size) if args.shm else {}
+        run["data_out"] = [[] for d in args.do]
+        usecols.update(setup_channels(run["in_setups"]))
+
+    # only the channels used by the setups of any run are read and kept
+    usecols = sorted(usecols)
+    for run in active:
+        run["in_setups"] = compact_setups(run["in_setups"], usecols)
+
+    # LOOP 3: read each file once and process it for every run including its date
+    names, fnames = group_comb_files(first, sorted(set().union(*[run["files"] for run in active])))
+    read, load = comb_loader(first, usecols)
+    loaded = prefetch(load if first.prefetch_parse else read, fnames, depth=first.prefetch)
+
+    file_bar = tqdm(names)
+    for fili, content in zip(file_bar, loaded):
+        basename = os.path.basename(fili)[:-4]
+        file_bar.set_description("Processing " + basename)
+
+        alldata = content if first.prefetch_parse else load(content)
+
+        for run in active:
+            if fili[:6] not in run["dates"]:
+                continue
+            args = run["args"]
+            diagnostics = [] if args.diagnostics else None
+            with thread_event_log(os.path.join(args.dir, EVENTS_FILE)):
+                file_out = process_data(
+                    alldata,
+                    args,
+                    run["in_setups"],
+                    run["start"],
+                    run["stop"],
+                    basename=basename,
+                    diagnostics=diagnostics,
+                )
+            for doi, out in enumerate(file_out):
+                run["data_out"][doi] += out
+
+            if args.diagnostics:
+                append_table(os.path.join(args.dir, DIAGNOSTICS_FILE), diagnostics)
+
+            if run["writers"]:
+                publish_outputs(file_out, args, run["in_setups"], run["writers"])
+
+    # LOOP 4: save files of each run
+    for run in active:
+        args = run["args"]
+        for writer in run["writers"].values():
+            writer.close()
+
+        with thread_event_log(os.path.join(args.dir, EVENTS_FILE)):
+            stats_rows = save_outputs(
+                run["data_out"], args, run["in_setups"], run["out_setups"], run["start"], run["stop"]
+            )
+        # processed data is no longer needed
+        run["data_out"] = None
+
+        if args.stats:
+            append_table(os.path.join(args.dir, STATS_FILE), stats_rows)
+
+        if args.auto:
+            update_auto_file(args, run["auto_list"])
@@ -58,3 +58,34 @@ def beat2y(f_beat, nominal, N, f_rep, f0, f_beat_sign=1, k_scale=1, f0_scale=1,
     y = -(f_beat + f_cor) / f_nom
 
     return y
+
+
+def decimate(data, base):
+    """Average data in time bins, only considering valid data.
+
+    Parameters
+    ----------
+    data : ndarray
+        Input data (timetags, y, flag), sorted by timetags.
+    base : float
+        Bin size in s. Bins are aligned to multiples of base from the epoch (e.g., to UTC midnight for 86400 s).
+
+    Returns
+    -------
+    ndarray
+        Averaged data (bin start, mean y, minimum flag, number of valid points), only for bins with valid data.
+    """
+    valid = data[:, 2] > 0
+    t, y, flag = data[valid].T
+    if len(t) == 0:
+        return np.empty((0, 4))
+
+    # data is sorted, so that each bin is a contiguous slice
+    bins = np.floor(t / base)
+    starts = np.flatnonzero(np.r_[True, np.diff(bins) > 0])
+    count = np.diff(np.r_[starts, len(bins)])
+
+    mean = np.add.reduceat(y, starts) / count
+    min_flag = np.minimum.reduceat(flag, starts)
+
+    return np.column_stack((bins[starts] * base, mean, min_flag, count))
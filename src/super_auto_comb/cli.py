@@ -1,35 +1,24 @@
 import os
 import os.path
 import sys
+from functools import partial
 
 import configargparse
-import matplotlib.pyplot as plt
 import numpy as np
-import tintervals as ti
-import tintervals.rocitlinks as rl
 from tqdm import tqdm
 
-from super_auto_comb.calc import beat2y
-from super_auto_comb.deglitch import (
-    deglitch_from_bounds,
-    deglitch_from_double_counting,
-    deglitch_from_f0,
-    deglitch_from_median_filter,
-)
+from super_auto_comb.events import EVENTS_FILE, event_log
 from super_auto_comb.fix_files import find_files, fix_files
-from super_auto_comb.load_files import genfromkk
-from super_auto_comb.track_changes import (
-    df_add_name,
-    df_extract,
-    df_from_cirt,
-    df_limit,
-    df_merge,
-    df_reduce,
-    format_possibly_changing_info,
-    load_do_setup,
-)
+from super_auto_comb.load_files import counter_number, genfromkk_counters, prefetch
+from super_auto_comb.readers import READERS, load_comb, reader_for, reader_patterns
+from super_auto_comb.save_files import append_table
+from super_auto_comb.scheduler import run_shards
+from super_auto_comb.shm import open_writers
 from super_auto_comb.utils import generate_dates, parse_input_date, today
 
+STATS_FILE = "super-auto-stats.txt"
+DIAGNOSTICS_FILE = "super-auto-diagnostics.txt"
+
 
 def parse_args(args):
     """Utility for Configargparse arguments."""
@@ -49,6 +38,7 @@ def parse_args(args):
     # change defaults ?
     parser.add_argument('--dir',  help='Directory for storing results', default='./Outputs') 
     parser.add_argument('--fig-dir',  help='Directory for storing figures', default='./Outputs/Figures') 
+    parser.add_argument('--figures', action='store_true', help='Render figures while processing (records for rendering them later with super-auto-comb figure DO DATE are always saved).')
 
 
     parser.add_argument('--comb-dir',  help='Directory of comb data', default='.') 
@@ -57,12 +47,18 @@ def parse_args(args):
     parser.add_argument('--time-format', choices=['iso', 'mjd', 'unix'], help='Output time format.',  default='mjd')
 
     parser.add_argument('--do-not-fix-summer-time', action='store_true', help='Will not attempt to fix summer time.')
+    parser.add_argument('--timezone', type=str, help='Timezone of the timetags of K+K files (e.g. Europe/Rome), by default the system local timezone.', default=None)
 
     parser.add_argument('--median-filter', action='store_true', help='Also apply a median filter.')
-    parser.add_argument('--median-filter-window', type=int, help='Number of points in the median filter.', default=60)
+    parser.add_argument('--median-filter-window', type=float, help='Length of the median filter in s.', default=60.)
     parser.add_argument('--median-filter-threshold', type=float, help='Median filter threshold.', default=250.)
 
+    parser.add_argument('--gate-time', type=float, help='Gate time of the counter in s (timetags are regularized to multiples of the gate time).', default=1.)
+
+    parser.add_argument('--reader', choices=sorted(READERS), help='Reader of comb files (default selected by the filename, kk for K+K text files as YYMMDD_N_Frequ.txt, bin for binary counter logs as YYMMDD_N_Frequ.bin).', default=None)
     parser.add_argument('--max-columns', type=int, help='Number of columns in the comb datafile.', default=12)
+    parser.add_argument('--merge-counters', action='store_true', help='Join the files of different counters for the same day, with channels of counter N numbered from (N-1)*max-columns+1.')
+    parser.add_argument('--merge-tolerance', type=float, help='Max difference in s between timetags of joined counters (default half the gate time).', default=None)
 
     parser.add_argument('--operator', type=str, help='Person in charge of the analysis.', default='')
     parser.add_argument('--flag', type=int, help='Flag for confidence level (0 = Discarded, 1 = Experimental, 2 = Operational).', default=1)
@@ -75,13 +71,55 @@ def parse_args(args):
 
     parser.add_argument('--auto', action='store_true', help='Save/recall the last date processed to automatically process new daily data.')
     parser.add_argument('--auto-file', type=str, help='File where to store the last processed date.', default = './super-auto-last.txt')
+
+    parser.add_argument('--prefetch', type=int, help='Number of comb files read in background while processing (0 to disable).', default=2)
+    parser.add_argument('--prefetch-parse', action='store_true', help='Also parse comb files in background while processing.')
+
+    parser.add_argument('--stats', action='store_true', help='Append summary statistics (uptime, mean, Allan deviation) of each output segment to a table in the output directory.')
+
+    parser.add_argument('--diagnostics', action='store_true', help='Append diagnostics (rejected points, figures of merit and processing time) of each comb file, DO and setup to a table in the output directory.')
+
+    parser.add_argument('--stream', type=str, help='Process data streamed by a K+K counter on a TCP socket, given as HOST:PORT.', default=None)
+    parser.add_argument('--stream-batch', type=int, help='Number of lines processed together from the stream.', default=60)
+
+    parser.add_argument('--ratio', nargs=2, type=str, help='Also save the frequency ratio of two of the processed DOs, aligned on common timetags.', default=None, metavar=('DO_A', 'DO_B'))
+
+    parser.add_argument('--uptime', action='store_true', help='Save intervals of valid data and coverage tables for each day and Circular T month next to the outputs.')
+    parser.add_argument('--decimate', nargs='+', type=int, help='Also save averages of the outputs in bins of these sizes in s (e.g. 10 100 86400).', default=None)
+
+    parser.add_argument('--shm', type=str, help='Publish the latest processed data of each DO to shared memory ring buffers named PREFIX_DO.', default=None, metavar='PREFIX')
+    parser.add_argument('--shm-size', type=int, help='Number of records in each shared memory ring buffer.', default=86400)
+
+    parser.add_argument('--plan', nargs='?', const='-', help='Only print (or write to the given file) the plan of the processing as JSON, without reading data.', default=None, metavar='FILE')
+
+    parser.add_argument('--sweep', action='store_true', help='Only evaluate a grid of deglitching parameters (--sweep-* options), saving rejected points, mean and Allan deviation in a table in the output directory.')
+    parser.add_argument('--sweep-median-window', nargs='+', type=float, help='Median filter windows in s to be swept (implies the median filter).', default=None)
+    parser.add_argument('--sweep-median-threshold', nargs='+', type=float, help='Median filter thresholds in Hz to be swept (implies the median filter).', default=None)
+    parser.add_argument('--sweep-f0-threshold', nargs='+', type=float, help='Thresholds in Hz on the deviation of f0 to be swept.', default=None)
+    parser.add_argument('--sweep-glitch-ext', nargs='+', type=int, help='Glitch extensions in points to be swept.', default=None)
+    parser.add_argument('--sweep-threshold', nargs='+', type=float, help='Double counting thresholds in Hz to be swept (default from the DO setup).', default=None)
+
+    parser.add_argument('--batch', nargs='+', help='Process the configurations in these config files in a single pass over the comb data.', default=None, metavar='CONFIG')
+
+    parser.add_argument('--shard', choices=['day', 'cirt'], help='Process the date range in resumable shards of days or Circular T months.', default=None)
+    parser.add_argument('--jobs', type=int, help='Number of shards processed concurrently.', default=1)
     # fmt: on
 
-    return parser.parse_args(args)
+    parsed = parser.parse_args(args)
+    if parsed.ratio and not set(parsed.ratio) <= set(parsed.do or []):
+        parser.error("DOs in --ratio should also be in --do.")
+
+    return parsed
 
 
 def cli():
     """CLI entry point. Parse arguments from sys and launch the main script if necessary."""
+    if sys.argv[1:2] == ["figure"]:
+        from super_auto_comb.figures import figure_cli
+
+        figure_cli(sys.argv[2:])
+        return True
+
     args = parse_args(sys.argv[1:])
 
     if not os.path.exists(args.dir):
@@ -90,12 +128,13 @@ def cli():
     if not os.path.exists(args.fig_dir):
         os.makedirs(args.fig_dir)
 
-    if args.do:
+    if args.do or args.batch:
         return main(args)
 
 
-def main(args):
-    """Main script for processign comb data."""
+def date_range(args):
+    """Return the (start, stop) MJD range to be processed and the dates saved in the auto file (if args.auto)."""
+    auto_list = []
     if args.auto:
         try:
             auto_list = np.loadtxt(args.auto_file, dtype=str)
@@ -111,286 +150,243 @@ def main(args):
         start = parse_input_date(args.start)
         stop = parse_input_date(args.stop)
 
-    # avoid interactive plotting
-    plt.ioff()
-
-    # LOOP 1: load DOs info
-    do_bar = tqdm(args.do)
-    # setups for reading inputs and for saving outpus (tracks different changes)
-    in_setups = []
-    out_setups = []
-
-    # bug: not enough circular t informaton if start is much later that the start in the setup
-    # cirt = load_cirt_setup(start, stop)
-    cirt = df_from_cirt(start - 40, stop)
-
-    for do in do_bar:
-        do_bar.set_description(f"Loading {do} setup.")
-        df = load_do_setup(do, dir=args.setup_dir)
-        df = df_merge(df, cirt)
-        df = df_limit(df, start, stop)
-
-        # start to worry here about what will be tracked changes
-        # nominal frequency is ALWAYS tracked on the output
-        tracked = ["nominal"]
-        if args.track_phys:
-            tracked += ["physical"]
-        if args.track_comb:
-            tracked += ["comb"]
-        if args.track_maser:
-            tracked += ["maser"]
-        if args.track_cirt:
-            tracked += ["cirt"]
-
-        df_add_name(
-            df,
-            fix=[],
-            var=[x for x in ["physical", "comb", "maser", "cirt"] if x in tracked],
-        )
+    return start, stop, auto_list
+
 
-        # output_df only has major changes tracked
-        output_df = df_reduce(df, tracked)
+def update_auto_file(args, auto_list):
+    """Append today to the dates saved in the auto file."""
+    # TODO: maybe this should be last processed date
+    np.savetxt(args.auto_file, auto_list + [today()], fmt="%s")
 
-        in_setups += [df]
-        out_setups += [output_df]
 
-    # LOOP 2: fix and find files based on date
-    date_generated = generate_dates(start, stop)
+def find_comb_files(comb_dir, dates, patterns=None):
+    """Fix conflicted files and return the sorted names of the comb files of the given dates (matching the patterns of the readers)."""
+    if patterns is None:
+        patterns = reader_patterns()
 
-    date_bar = tqdm(date_generated)
+    date_bar = tqdm(dates)
     files_to_be_processed = []
 
     for date in date_bar:
         date_bar.set_description(f"Checking {date.strftime('%Y-%m-%d')} files.")
 
-        con_files = fix_files(args.comb_dir, date)
+        con_files, counts = fix_files(comb_dir, date, return_counts=True)
+
+        for file, count in zip(con_files, counts):
+            if count is None:
+                tqdm.write(f"Conflict resolved for {os.path.basename(file)}.")
+            else:
+                tqdm.write(
+                    f"Conflict resolved for {os.path.basename(file)}: {count['original']} lines from the original file, "
+                    f"{count['conflicted']} from the conflicted file, {count['common']} in both"
+                    + (f", {count['truncated']} truncated." if count["truncated"] else ".")
+                )
+
+        for pattern in patterns:
+            files_to_be_processed += find_files(comb_dir, date, regex=pattern)
+
+    return sorted(files_to_be_processed)
+
+
+def group_comb_files(args, files):
+    """Return the names and paths of comb files to be loaded.
+    With args.merge_counters, files of the same day and format are grouped (e.g. 220321_1+2_Frequ.txt with a list of paths).
+    """
+    fnames = [os.path.join(args.comb_dir, fili.strip("\n")) for fili in files]
+
+    if args.merge_counters:
+        days = sorted({(f[:6], os.path.splitext(f)[1]) for f in files})
+        fnames = [[f for f in fnames if os.path.basename(f).startswith(day) and f.endswith(ext)] for day, ext in days]
+        files = [
+            day + "_" + "+".join(str(counter_number(f)) for f in group) + "_Frequ" + ext
+            for (day, ext), group in zip(days, fnames)
+        ]
+
+    return files, fnames
+
+
+def comb_loader(args, usecols=None):
+    """Return the functions reading (in memory) and loading (parsing) comb files, as grouped by group_comb_files.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed CLI arguments.
+    usecols : list of int, optional
+        Channels to be parsed and kept, by default None (all channels).
+        Loaded data only have the timetags and these channels, in this order (see process.compact_setups).
+
+    Returns
+    -------
+    read : callable
+        Function reading a file (or a group of files) in memory.
+    load : callable
+        Function loading a file (or a group of files), either from its path or from read.
+    """
+
+    def load(fname):
+        alldata = _load(fname)
+        # channels not used are dropped, not to keep them in memory while processing the file
+        return alldata if usecols is None else alldata[:, np.r_[0, usecols]]
+
+    def _load(fname):
+        reader = reader_for(fname[0] if args.merge_counters else fname, args.reader)
+        fix_summer_time = not args.do_not_fix_summer_time and reader["local_time"]
+        if args.merge_counters:
+            return genfromkk_counters(
+                fname,
+                fix_summer_time=fix_summer_time,
+                max_columns=args.max_columns,
+                gate_time=args.gate_time,
+                tolerance=args.merge_tolerance,
+                usecols=usecols,
+                loader=partial(reader["raw"], tz=args.timezone) if reader["local_time"] else reader["raw"],
+                tz=args.timezone,
+            )
+        return load_comb(
+            fname,
+            reader=args.reader,
+            fix_summer_time=fix_summer_time,
+            max_columns=args.max_columns,
+            gate_time=args.gate_time,
+            tz=args.timezone,
+            usecols=usecols,
+        )
+
+    def read(fname):
+        if args.merge_counters:
+            return [reader_for(f, args.reader)["read"](f) for f in fname]
+        return reader_for(fname, args.reader)["read"](fname)
+
+    return read, load
+
+
+def main(args, span=None):
+    """Main script for processign comb data.
+    Data-quality events (e.g. fixes of summer time or not unique timetags) are logged as JSON lines to a file in the output directory.
 
-        for file in con_files:
-            tqdm.write(f"Conflict resolved for {os.path.basename(file)}.")
+    Parameters
+    ----------
+    args : Namespace
+        Parsed CLI arguments.
+    span : tuple, optional
+        (start, stop) MJD of the whole range used for naming outputs, by default the processed range.
+        Used when processing shards of a longer range.
+    """
+    with event_log(os.path.join(args.dir, EVENTS_FILE)):
+        return _main(args, span)
 
-        files_to_be_processed += find_files(args.comb_dir, date)
 
-    files_to_be_processed.sort()
+def _main(args, span=None):
+    if args.batch:
+        from super_auto_comb.batch import run_batch
+
+        run_batch(args.batch)
+        return True
+
+    start, stop, auto_list = date_range(args)
+
+    if args.plan:
+        from super_auto_comb.planner import build_plan, plan_to_json
+
+        plan = plan_to_json(build_plan(args, start, stop))
+        if args.plan == "-":
+            print(plan)
+        else:
+            with open(args.plan, "w") as f:
+                f.write(plan)
+        return True
+
+    if args.sweep:
+        from super_auto_comb.sweep import run_sweep
+
+        run_sweep(args, start, stop)
+        return True
+
+    if args.stream:
+        from super_auto_comb.stream import run_stream
+
+        run_stream(args, start, stop)
+        return True
+
+    if args.shard:
+        run_shards(args, start, stop, main)
+        if args.auto:
+            update_auto_file(args, auto_list)
+        return True
+
+    if span is None:
+        span = (start, stop)
+
+    # LOOP 1: fix and find files based on date
+    files_to_be_processed = find_comb_files(args.comb_dir, generate_dates(start, stop), reader_patterns(args.reader))
+
+    # nothing new to process: return before the (slow) imports of the processing stages
+    if not files_to_be_processed:
+        tqdm.write("No files to be processed.")
+        return True
+
+    # pandas and tintervals are slow to import, so only load them when needed
+    from super_auto_comb.process import (
+        compact_setups,
+        load_setups,
+        process_data,
+        publish_outputs,
+        save_outputs,
+        setup_channels,
+    )
+
+    # LOOP 2: load DOs info
+    in_setups, out_setups = load_setups(args, span)
+
+    writers = open_writers(args.shm, args.do, size=args.shm_size) if args.shm else {}
 
     # LOOP 3: read and process files
     data_out = [[] for d in args.do]
+
+    # files of the same day are processed together with --merge-counters
+    files_to_be_processed, fnames = group_comb_files(args, files_to_be_processed)
+    # only the channels used by the setups are read and kept
+    channels = setup_channels(in_setups)
+    in_setups = compact_setups(in_setups, channels)
+    read, load = comb_loader(args, channels)
+
     file_bar = tqdm(files_to_be_processed)
+
+    # read (and optionally parse) the next files in background while processing the current one
+    loaded = prefetch(load if args.prefetch_parse else read, fnames, depth=args.prefetch)
+
     # LOOP 3a: files
-    for fili in file_bar:
+    for fili, content in zip(file_bar, loaded):
         basename = os.path.basename(fili)[:-4]
 
         file_bar.set_description("Processing " + basename)
 
-        fname = os.path.join(args.comb_dir, fili.strip("\n"))
-        alldata = genfromkk(
-            fname,
-            fix_summer_time=not args.do_not_fix_summer_time,
-            max_columns=args.max_columns,
-        )
+        alldata = content if args.prefetch_parse else load(content)
 
         # LOOP 3b: dos
-        for doi, do in enumerate(do_bar):
-            do_bar.set_description("DO: " + do)
-
-            do_setup = in_setups[doi]
-
-            # LOOP 3c: track changes
-            # pandas is stupid :(
-            # 	for x in loyb[loyb['datetime']>59900].iloc:
-            #  ...:     print(x['cirt'])
-            for s in do_setup.iloc:
-                if s["valid"] == False:  # noqa: E712 # the valid column store np.bool_ for whatever reason
-                    continue
-
-                this_start = max(start, s["datetime"])
-                this_stop = min(stop, s["datetime_end"])
-
-                # mask data
-                tstart = ti.mjd2epoch(this_start)
-                tstop = ti.mjd2epoch(this_stop)
-
-                datamask = (alldata[:, 0] >= tstart) & (alldata[:, 0] < tstop)
-                data = alldata[datamask]
-
-                if len(data) > 0:
-                    comb = s["comb"]
-                    nominal = s["nominal"]
-                    N = s["N"]  # limit between start/stop
-                    f_rep = s["frep_" + comb]
-                    f0 = s["f0_" + comb]
-                    f_beat_sign = s["fbeat_sign"]
-                    k_scale = s["kscale"]
-                    f0_scale = s["f0_scale"]
-                    f_offset = s["foffset"]
-
-                    columns = df_extract(s, ["counter", "counter1", "counter2"])
-                    columns = np.atleast_1d(columns).astype(int)
-                    bounds = (
-                        df_extract(s, ["min", "min1", "min2"]),
-                        df_extract(s, ["max", "max1", "max2"]),
-                    )
-                    los = df_extract(s, ["flo", "flo1", "flo2"])
-                    if len(los) > 1:
-                        threshold = s["threshold"]
-                    else:
-                        # threshold not needed, this is arbitrary as long as >0 (the output of np.ptp on a len 1 axis)
-                        threshold = 1
-
-                    red_data = data[:, columns]
-                    f0_meas = data[:, s["counter_f0_" + comb]]
-                    los = np.resize(np.asarray(los, dtype=float), columns.shape[0])
-                    los_data = np.abs(red_data + los)
-                    f_beat = np.mean(los_data, axis=-1)
-
-                    # deglitch(alldata,  columns, bounds=(-np.inf, np.inf), los=0., threshold=0.2, glitch_ext=3, median_window=60, median_threshold=250.):
-                    # f_beat, mask1, mask2, mask3, ptp = deglitch(
-                    #     data,
-                    #     columns,
-                    #     bounds,
-                    #     los,
-                    #     threshold,
-                    #     glitch_ext=3,
-                    #     median_window=median_window,
-                    #     median_threshold=median_threshold,
-                    # )
-
-                    mask1 = deglitch_from_bounds(red_data, bounds)
-
-                    mask2 = deglitch_from_double_counting(los_data, threshold, glitch_ext=3)
-
-                    mask3 = deglitch_from_f0(f0_meas, f0_nominal=s["f0_" + comb], threshold=0.25)
-
-                    tmask = mask1 & mask2 & mask3
-                    if args.median_filter:
-                        mask4 = deglitch_from_median_filter(
-                            f_beat,
-                            premask=tmask,
-                            median_window=args.median_filter_window,
-                            median_threshold=args.median_filter_threshold,
-                        )
-                        tmask = mask1 & mask2 & mask3 & mask4
-                    else:
-                        mask4 = np.ones_like(mask1).astype(bool)
-
-                    flag = (tmask) * args.flag
-
-                    # beat2y(f_beat,  nominal,  N, f_rep, f0, f_beat_sign=1, k_scale=1, f0_scale=1, f_offset=0.):
-                    y = beat2y(f_beat, nominal, N, f_rep, f0, f_beat_sign, k_scale, f0_scale, f_offset)
-
-                    out = np.column_stack((data[:, 0], y, flag))
-
-                    # DONE, concatenate with previous data
-                    data_out[doi] += [out]
-
-                    mjd = ti.mjd_from_epoch(data[:, 0])
-
-                    # Some Figure of merit
-                    # * measurement of channel deviation
-                    # sqrt<|diff between channels|^2>
-                    # ch_dev = np.sqrt(np.mean(ptp[tmask] ** 2))
-
-                    # f0 deviation
-                    # f0_dev = np.mean(f0_diff[tmask])
-
-                    # plot here
-                    fig, axs = plt.subplots(3, sharex=True, figsize=(6.4 * 1.5, 4.8))
-                    fig.suptitle(f"{basename} - {comb} - {do}")
-
-                    axs[0].set_ylabel("Flag")
-                    # axs[0].plot(mjd, flag, label=f'Removed points = {sum(flag==0)}')
-                    axs[0].fill_between(mjd, 3 - mask1, 2, label=f"Filter mask -> {sum(~mask1)}", step="pre")
-                    axs[0].fill_between(mjd, 2 - mask2, 1, label=f"Glitch mask -> {sum(~mask2)}", step="pre")
-                    axs[0].fill_between(mjd, 1 - mask3, 0, label=f"f0 mask -> {sum(~mask3)}", step="pre")
-                    if args.median_filter:
-                        label = f"Median mask ({args.median_filter_window} s/{args.median_filter_threshold} Hz)\n-> {sum(~mask4)}"
-                        axs[0].fill_between(mjd, 0 - mask4, -1, label=label, step="pre")
-
-                    axs[0].legend(loc="center left", bbox_to_anchor=(1, 0.5))
-                    axs[1].plot(mjd, f_beat * 1e-6, label="raw")
-                    axs[1].plot(mjd[flag > 0], f_beat[flag > 0] * 1e-6, ".", label=f"All masks -> {sum(flag==0)}")
-                    axs[1].plot(mjd[~(mask2)], f_beat[~(mask2)] * 1e-6, "o", label="Glitches")
-                    axs[1].set_ylabel("Beat /MHz")
-                    axs[1].legend(loc="center left", bbox_to_anchor=(1, 0.5))
-
-                    if sum(flag) > 0:
-                        meany = np.mean(y[flag > 0])
-                        axs[2].axhline(meany, label=f"Mean = {meany:.3}", color="black")
-
-                    axs[2].plot(mjd[flag > 0], y[flag > 0], ".", label=f"Points = {sum(flag>0)}", color="C1")
-                    # axs[2].plot(mjd[flag>0], uniform_filter1d(y[flag>0],1000), '.', label=f'Moving average')
-                    axs[2].set_ylabel("y")
-                    axs[2].set_xlabel("MJD")
-                    axs[2].set_xlim(np.min(mjd), np.min(mjd) + 1)
-                    axs[2].legend(loc="center left", bbox_to_anchor=(1, 0.5))
-
-                    plt.tight_layout()
-                    figdir = os.path.join(args.fig_dir, s["name"], do)
-
-                    if not os.path.exists(figdir):
-                        os.makedirs(figdir)
-                    figname = os.path.join(figdir, basename + ".png")
-                    plt.savefig(figname)
-
-                    plt.close()
+        diagnostics = [] if args.diagnostics else None
+        file_out = process_data(alldata, args, in_setups, start, stop, basename=basename, diagnostics=diagnostics)
+        for doi, out in enumerate(file_out):
+            data_out[doi] += out
 
-    # LOOP 4: save files
-    # LOOP 4a: dos
-    do_bar2 = tqdm(args.do)
-    for doi, do in enumerate(do_bar2):
-        do_bar2.set_description("Saving DO: " + do)
-
-        do_out_setup = out_setups[doi].fillna("")
-        do_in_setup = in_setups[doi].fillna("")
-
-        out = np.concatenate(data_out[doi])
-
-        # LOOP 4b: tracked changes
-        for s in do_out_setup.iloc:
-            if s["valid"] == False:  # noqa: E712 # the valid column store np.bool_ for whatever reason
-                continue
-
-            this_start = max(start, s["datetime"])
-            this_stop = min(stop, s["datetime_end"])
-
-            # mask info
-            infomask = (do_in_setup["datetime_end"] >= start) & (do_in_setup["datetime"] < stop)
-            # note that this_setup may have more lines for each do_out_setup
-            this_setup = do_in_setup[infomask]
-
-            # mask data
-            tstart = ti.mjd2epoch(this_start)
-            tstop = ti.mjd2epoch(this_stop)
-            datamask = (out[:, 0] >= tstart) & (out[:, 0] < tstop)
-            data = out[datamask]
-
-            if datamask.any() & infomask.any():
-                nominal = s["nominal"].strip("'")
-
-                # TODO: descriptions are no longer used by rl.save_link_to_dir
-                # I could use the "message" keyword instead
-                HM = rl.Oscillator("INRIM_HM", "1")
-                DO = rl.Oscillator("INRIM_" + do, nominal)
-
-                dodesc = (
-                    "Designed oscillator = "
-                    + format_possibly_changing_info(this_setup, "physical")
-                    + " measured on "
-                    + format_possibly_changing_info(this_setup, "comb")
-                )
-                nom = "# Nominal frequency = " + nominal
-                hm_desc = "# HM = " + format_possibly_changing_info(this_setup, "maser")
-                message = "\n".join([dodesc, nom, hm_desc])
+        if args.diagnostics:
+            append_table(os.path.join(args.dir, DIAGNOSTICS_FILE), diagnostics)
 
-                link = rl.Link(data=out[datamask], oscA=DO, oscB=HM)
-                link.drop_invalid()
+        if writers:
+            publish_outputs(file_out, args, in_setups, writers)
+
+    for writer in writers.values():
+        writer.close()
+
+    # LOOP 4: save files
+    stats_rows = save_outputs(data_out, args, in_setups, out_setups, start, stop)
 
-                out_dir = os.path.join(args.dir, s["name"])
-                rl.save_link_to_dir(out_dir, link, time_format=args.time_format, message=message)
+    if args.stats:
+        append_table(os.path.join(args.dir, STATS_FILE), stats_rows)
 
     # if I got here and was in auto, i can update the last processed date file
     if args.auto:
-        # TODO: maybe this should be last processed date
-        auto_list += [today()]
-        np.savetxt(args.auto_file, auto_list, fmt="%s")
+        update_auto_file(args, auto_list)
 
     return True
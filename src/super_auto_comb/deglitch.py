@@ -1,5 +1,6 @@
 import numpy as np
-from scipy.ndimage import median_filter, minimum_filter1d
+
+# scipy.ndimage is imported in the functions that need it, as it is slow to import
 
 
 def prepare_bounds(bounds, n):
@@ -71,6 +72,8 @@ def deglitch_from_double_counting(data, threshold=0.2, glitch_ext=3):
     # using numpy peak-to-peak function
     # note that this handles nicely both single counting (= no glitch detection)
     # and both an hypothetical triple counting, etc..
+    from scipy.ndimage import minimum_filter1d
+
     ptp = np.ptp(data, axis=-1)
     mask2 = ptp < threshold
     # deglitch extend to neighbourg datapoints
@@ -103,7 +106,29 @@ def deglitch_from_f0(f0, f0_nominal, threshold=0.25):
     return mask3
 
 
-def deglitch_from_median_filter(f_beat, premask, median_window=60, median_threshold=250.0, glitch_ext=3):
+def rolling_median(f_beat, premask, median_window=60):
+    """Return the rolling median of the data selected by premask (as used by deglitch_from_median_filter).
+
+    Parameters
+    ----------
+    f_beat : array_like
+        Input data
+    premask : array_like
+        Mask to apply to input data (from other deglitch functions)
+    median_window : int, optional
+        Number of point over calculating rolling median filter, by default 60
+
+    Returns
+    -------
+    array
+        Rolling median of f_beat[premask].
+    """
+    from scipy.ndimage import median_filter
+
+    return median_filter(f_beat[premask.astype(bool)], median_window)
+
+
+def deglitch_from_median_filter(f_beat, premask, median_window=60, median_threshold=250.0, glitch_ext=3, rolled=None):
     """Return a mask for data dissimila to neighbors.
 
     Parameters
@@ -118,18 +143,24 @@ def deglitch_from_median_filter(f_beat, premask, median_window=60, median_thresh
         Threshold value in Hz, by default 250.
     glitch_ext : int, optional
         Extend glitch to neighbourg points, by default 3
+    rolled : array_like, optional
+        Rolling median from rolling_median, by default None (calculated).
+        Allows to evaluate several thresholds with the same median.
 
     Returns
     -------
     _type_
         _description_
     """
+    from scipy.ndimage import minimum_filter1d
+
     premask = premask.astype(bool)
 
     if f_beat[premask].size == 0:
         return np.ones_like(premask, dtype=bool)
 
-    rolled = median_filter(f_beat[premask], median_window)
+    if rolled is None:
+        rolled = rolling_median(f_beat, premask, median_window)
     mask4 = (
         abs(f_beat[premask] - rolled) < median_threshold
     )  # 250 Hz correspond to a 5 sigma criteria assuming 1e-13 at 1 s
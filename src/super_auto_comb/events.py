@@ -0,0 +1,180 @@
+"""
+Machine-readable log of data-quality events (fixes of summer time, timetag irregularities, conflicted files, ...).
+Events are written as JSON lines to a file next to the outputs, buffered in memory and flushed in blocks,
+so that logging adds no measurable overhead even to long runs with many events.
+
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+
+EVENTS_FILE = "super-auto-events.jsonl"
+EVENTS_BUFFER = 1000
+
+# log of the current run (see event_log)
+_log = None
+# logs of the current thread, overriding the run log (see thread_event_log)
+_local = threading.local()
+
+
+def _default(x):
+    if isinstance(x, np.generic):
+        return x.item()
+    raise TypeError(f"Object of type {type(x).__name__} is not JSON serializable")
+
+
+class EventLog:
+    """Buffered JSON lines event log.
+
+    Parameters
+    ----------
+    path : str
+        Output file. Events are appended to existing ones.
+    buffer_size : int, optional
+        Number of events kept in memory before writing them, by default 1000
+
+    Notes
+    -----
+    Events can be written from several threads (e.g. when parsing files in background).
+    """
+
+    def __init__(self, path, buffer_size=EVENTS_BUFFER):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.pid = os.getpid()
+        self.lines = []
+        self.lock = threading.Lock()
+
+    def write(self, event):
+        """Add an event (a JSON serializable dict) to the log."""
+        line = json.dumps(event, default=_default) + "\n"
+        with self.lock:
+            self.lines.append(line)
+            if len(self.lines) >= self.buffer_size:
+                self._flush()
+
+    def flush(self):
+        """Write buffered events to the file."""
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.lines:
+            return
+        dir = os.path.dirname(self.path)
+        if dir and not os.path.exists(dir):
+            os.makedirs(dir, exist_ok=True)
+        # a single write of whole lines, so that concurrent processes appending to the same file do not mix lines
+        with open(self.path, "a") as f:
+            f.write("".join(self.lines))
+        self.lines = []
+
+
+@contextmanager
+def event_log(path, buffer_size=EVENTS_BUFFER):
+    """Context manager logging the events of a run to a file.
+    Nested runs in the same process (e.g. shards) log to the file of the outer run.
+
+    Parameters
+    ----------
+    path : str
+        Output file.
+    buffer_size : int, optional
+        Number of events kept in memory before writing them, by default 1000
+
+    Yields
+    ------
+    EventLog
+        The log used.
+    """
+    global _log
+    if _log is not None and _log.pid == os.getpid():
+        try:
+            yield _log
+        finally:
+            _log.flush()
+        return
+
+    # a log inherited from a parent process is not used (its buffered events are written by the parent)
+    previous = _log
+    _log = EventLog(path, buffer_size=buffer_size)
+    try:
+        yield _log
+    finally:
+        _log.flush()
+        _log = previous
+
+
+@contextmanager
+def thread_event_log(path, buffer_size=EVENTS_BUFFER):
+    """Context manager logging the events of the current thread to a separate file, also inside another run
+    (e.g. for each configuration of a batch). Events of other threads (e.g. parsing files in background) are still logged to the run log.
+
+    Parameters
+    ----------
+    path : str
+        Output file.
+    buffer_size : int, optional
+        Number of events kept in memory before writing them, by default 1000
+
+    Yields
+    ------
+    EventLog
+        The log used.
+    """
+    previous = getattr(_local, "log", None)
+    _local.log = EventLog(path, buffer_size=buffer_size)
+    try:
+        yield _local.log
+    finally:
+        _local.log.flush()
+        _local.log = previous
+
+
+def _current():
+    log = getattr(_local, "log", None)
+    if log is None:
+        log = _log
+    if log is None or log.pid != os.getpid():
+        return None
+    return log
+
+
+def flush_events():
+    """Write the buffered events of the current run, if a log is open."""
+    log = _current()
+    if log is not None:
+        log.flush()
+
+
+def log_event(type, file="", do=None, **fields):
+    """Log a data-quality event, if a log is open (see event_log and thread_event_log).
+
+    Parameters
+    ----------
+    type : str
+        Event type (e.g. 'summer_time', 'regularization_deviation', 'not_unique_timetags', 'conflict_resolved').
+    file : str, optional
+        File (or data source) of the event, by default ''
+    do : str, optional
+        DO of the event, by default None
+    **fields
+        Other fields of the event (e.g. counts, start and stop of the data as seconds from the epoch).
+    """
+    log = _current()
+    if log is None:
+        return
+
+    event = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "type": type,
+        "file": str(file),
+        "do": do,
+        **fields,
+    }
+    log.write(event)
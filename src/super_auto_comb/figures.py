@@ -0,0 +1,163 @@
+"""
+On-demand figures of processed segments.
+Processing saves a compact record for each comb file, DO and setup (timetags as runs of gates, beat note, y, flags and bit-packed deglitching masks),
+so that figures are only rendered when needed, without reading and deglitching comb data again.
+
+"""
+
+import argparse
+import glob
+import os
+
+import numpy as np
+
+from super_auto_comb.results import Results
+
+RECORD_SUFFIX = ".npz"
+
+
+def save_record(fname, results, f_beat, title, median_label=""):
+    """Save the record of a processed segment, for rendering its figure later.
+
+    Parameters
+    ----------
+    fname : str
+        Output filename (.npz).
+    results : Results
+        Processed data, with masks (mask1, mask2, mask3, mask4).
+    f_beat : ndarray
+        Beatnote in Hz (saved in single precision).
+    title : str
+        Figure title.
+    median_label : str, optional
+        Median filter parameters shown in the legend, by default '' (median filter not applied)
+    """
+    dir = os.path.dirname(fname)
+    if dir and not os.path.exists(dir):
+        os.makedirs(dir, exist_ok=True)
+
+    # the beatnote is only plotted, so single precision is enough
+    np.savez_compressed(
+        fname,
+        runs=results.runs,
+        step=results.step,
+        y=results.y,
+        flag=results.flag,
+        masks=results.packed_masks,
+        n_masks=results.n_masks,
+        f_beat=np.asarray(f_beat, dtype=np.float32),
+        title=title,
+        median_label=median_label,
+    )
+
+
+def load_record(fname):
+    """Load the record of a processed segment.
+
+    Parameters
+    ----------
+    fname : str
+        Record filename (.npz).
+
+    Returns
+    -------
+    results : Results
+        Processed data, with masks.
+    f_beat : ndarray
+        Beatnote in Hz.
+    title : str
+        Figure title.
+    median_label : str
+        Median filter parameters shown in the legend ('' if the median filter was not applied).
+    """
+    with np.load(fname) as rec:
+        results = Results.from_parts(
+            rec["runs"], float(rec["step"]), rec["y"], rec["flag"], rec["masks"], int(rec["n_masks"])
+        )
+        return results, rec["f_beat"], str(rec["title"]), str(rec["median_label"])
+
+
+def render_figure(fname, figname=None):
+    """Render the figure of a processed segment from its record.
+
+    Parameters
+    ----------
+    fname : str
+        Record filename (.npz).
+    figname : str, optional
+        Output figure, by default the record filename with a .png extension
+
+    Returns
+    -------
+    str
+        Output figure.
+    """
+    # matplotlib is slow to import, so only load it when needed
+    from super_auto_comb.plots import plot_segment
+
+    if figname is None:
+        figname = fname[: -len(RECORD_SUFFIX)] + ".png"
+
+    results, f_beat, title, median_label = load_record(fname)
+    masks = results.masks
+    plot_segment(
+        figname,
+        title,
+        results.t,
+        f_beat,
+        results.y,
+        results.flag,
+        masks[0],
+        masks[1],
+        masks[2],
+        masks[3] if median_label else None,
+        median_label=median_label,
+    )
+    return figname
+
+
+def find_records(fig_dir, do, date):
+    """Return the records of a DO for the comb files of a date, in all setups.
+
+    Parameters
+    ----------
+    fig_dir : str
+        Directory of figures (and records).
+    do : str
+        DO name.
+    date : datetime
+        Date of the comb files.
+
+    Returns
+    -------
+    list of str
+        Record filenames.
+    """
+    pattern = os.path.join(fig_dir, "**", do, date.strftime("%y%m%d") + "_*" + RECORD_SUFFIX)
+    return sorted(glob.glob(pattern, recursive=True))
+
+
+def figure_cli(argv):
+    """Entry point of the figure command (super-auto-comb figure DO DATE), rendering the figures of a DO for a date."""
+    import tintervals as ti
+
+    from super_auto_comb.utils import parse_input_date
+
+    parser = argparse.ArgumentParser(
+        prog="super-auto-comb figure", description="Render figures of processed comb data from their records."
+    )
+    parser.add_argument("do", help="Name of the designed oscillator.")
+    parser.add_argument("date", help="Date of the comb files as Date (YYYY-MM-DD), MJD or -n previous days.")
+    parser.add_argument("--fig-dir", help="Directory for storing figures.", default="./Outputs/Figures")
+    args = parser.parse_args(argv)
+
+    date = ti.mjd2datetime(parse_input_date(args.date))
+    records = find_records(args.fig_dir, args.do, date)
+    if not records:
+        print(f"No records of {args.do} for {date.strftime('%Y-%m-%d')} in {args.fig_dir}.")
+        return []
+
+    fignames = [render_figure(f) for f in records]
+    for figname in fignames:
+        print(figname)
+    return fignames
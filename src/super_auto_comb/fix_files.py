@@ -1,10 +1,134 @@
 import glob
 import os
-import shutil
 
+import numpy as np
 
-def fix_files(dir, date, regex_conflict="%y%m%d_?_Frequ (conflicted).txt"):
-    """Find and rename files from K+K counters conflicted by Pcloud cloud sync.
+from super_auto_comb.events import log_event
+from super_auto_comb.load_files import KK_TIME_WIDTH
+
+
+def read_kk_lines(fname):
+    """Read the header and the data lines (with line endings) of a K+K file, with the timetag of each line.
+
+    Parameters
+    ----------
+    fname : str
+        K+K file.
+
+    Returns
+    -------
+    header : bytes
+        First line of the file.
+    lines : list of bytes
+        Data lines (empty lines are skipped), all ending with the line ending of the file.
+    keys : ndarray
+        Timetags as bytes (e.g. b'220321*000000.848'), for sorting lines without parsing them.
+    truncated : bool
+        True if the last line had no line ending (e.g. a file still being written or truncated by a sync).
+    """
+    with open(fname, "rb") as f:
+        header = f.readline()
+        lines = [line for line in f if line.strip()]
+
+    # the line ending of the file, from its header
+    ending = header[len(header.rstrip(b"\r\n")) :] or b"\r\n"
+    truncated = bool(lines) and not lines[-1].endswith(b"\n")
+    if truncated:
+        lines[-1] = lines[-1].rstrip(b"\r") + ending
+
+    keys = np.array([line[:KK_TIME_WIDTH] for line in lines], dtype=f"S{KK_TIME_WIDTH}")
+    return header, lines, keys, truncated
+
+
+def acquisition_keys(keys):
+    """Return keys sorted in acquisition order, prefixing timetags with the number of times they went back so far.
+    Timetags going back (e.g. the hour repeated at the change from summer time) start a new fold,
+    so that lines are sorted by fold and by timetag within each fold.
+
+    Parameters
+    ----------
+    keys : ndarray
+        Timetags as bytes (see read_kk_lines), in file order.
+
+    Returns
+    -------
+    ndarray
+        Keys as bytes (e.g. b'00220321*000000.848').
+    """
+    fold = np.zeros(len(keys), dtype=int)
+    fold[1:] = np.cumsum(keys[1:] < keys[:-1])
+    return np.char.add(np.char.zfill(fold.astype("S2"), 2), keys)
+
+
+def merge_kk_files(original, conflicted, out):
+    """Write the union of the lines of two K+K files, merged by timetag in acquisition order (see acquisition_keys).
+
+    Parameters
+    ----------
+    original : str
+        K+K file.
+    conflicted : str
+        Conflicted copy of the file. Lines with timetags in both files are taken from this file,
+        unless the line of the conflicted file is truncated (its last line, without line ending).
+    out : str
+        Output file.
+
+    Returns
+    -------
+    dict
+        Number of lines only in the original file ('original'), only in the conflicted file ('conflicted') and in both ('common'),
+        and of truncated last lines ('truncated', kept with a line ending unless also in the other file).
+
+    Notes
+    -----
+    Both files are copies of the same daily file, so that their timetags go back at the same changes of time.
+    """
+    header_o, lines_o, keys_o, truncated_o = read_kk_lines(original)
+    header_c, lines_c, keys_c, truncated_c = read_kk_lines(conflicted)
+    keys_o = acquisition_keys(keys_o)
+    keys_c = acquisition_keys(keys_c)
+
+    # a truncated line of the conflicted file is replaced by the complete one of the original file
+    if truncated_c and np.isin(keys_c[-1:], keys_o).all():
+        lines_c = lines_c[:-1]
+        keys_c = keys_c[:-1]
+
+    common = np.isin(keys_o, keys_c)
+    only_o = np.flatnonzero(~common)
+
+    # sorted merge, with lines of the conflicted file first for equal timetags
+    keys = np.concatenate((keys_c, keys_o[only_o]))
+    order = np.argsort(keys, kind="stable")
+    lines = lines_c + [lines_o[i] for i in only_o]
+
+    with open(out, "wb") as f:
+        f.write(header_c or header_o)
+        f.writelines(lines[i] for i in order)
+
+    n_common = int(np.count_nonzero(common))
+    return {
+        "original": len(only_o),
+        "conflicted": len(lines_c) - n_common,
+        "common": n_common,
+        "truncated": int(truncated_o) + int(truncated_c),
+    }
+
+
+def _backup(fname, backup):
+    # a hardlink keeps the content of the original file after it is atomically replaced, without copying it
+    if os.path.exists(backup):
+        os.remove(backup)
+    try:
+        os.link(fname, backup)
+    except OSError:
+        # hardlinks not supported (e.g., on some network shares)
+        os.replace(fname, backup)
+
+
+def fix_files(dir, date, regex_conflict="%y%m%d_?_Frequ (conflicted).txt", return_counts=False):
+    """Find and fix files from K+K counters conflicted by Pcloud cloud sync.
+    Conflicted files are merged with the original files by timetag, and the merged file atomically replaces the original.
+    The original and the conflicted files are kept as backups with the prefix wasconflicted_ (hardlinks or renames, not copies).
 
     Parameters
     ----------
@@ -14,27 +138,47 @@ def fix_files(dir, date, regex_conflict="%y%m%d_?_Frequ (conflicted).txt"):
         Input date
     regex_conflict : str, optional
         Regex matching conflicting files, by default "%y%m%d_?_Frequ (conflicted).txt"
+    return_counts : bool, optional
+        If True, also return the number of lines taken from each file, by default False
 
     Returns
     -------
     con_files : list
         List of matching files found and hopefully fixed.
+    counts : list of dict
+        Only if return_counts. For each file, the number of lines only in the original file ('original'),
+        only in the conflicted file ('conflicted') and in both ('common'), and of truncated last lines ('truncated').
+        If there is no original file, the conflicted file is renamed as the original one, and counts is None.
     """
     # Pcloud may have conflicted files
     test = date.strftime(regex_conflict)
     con_files = [os.path.basename(_) for _ in glob.glob(os.path.join(dir, test))]
+    counts = []
 
     for con_name in con_files:
         good_name = con_name.replace(" (conflicted)", "")
-        temp_name = "wasconflicted_" + good_name
+        good = os.path.join(dir, good_name)
+        con = os.path.join(dir, con_name)
+        temp = good + ".tmp"
+
+        count = None
+        if os.path.exists(good):
+            count = merge_kk_files(good, con, temp)
+            # backup of original file
+            _backup(good, os.path.join(dir, "wasconflicted_" + good_name))
 
-        # backup of original file if needed
-        if os.path.exists(os.path.join(dir, good_name)):
-            shutil.copy2(os.path.join(dir, good_name), os.path.join(dir, temp_name))
+        if count is None:
+            # no original file: the conflicted file has all the data
+            os.replace(con, good)
+        else:
+            os.replace(temp, good)
+            os.replace(con, os.path.join(dir, "wasconflicted_" + con_name))
 
-        # rename conflicted file to normal name (conflicted file has all the data)
-        shutil.move(os.path.join(dir, con_name), os.path.join(dir, good_name))
+        log_event("conflict_resolved", con_name, merged=count is not None, **(count or {}))
+        counts += [count]
 
+    if return_counts:
+        return con_files, counts
     return con_files
 
 
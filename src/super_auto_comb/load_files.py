@@ -1,79 +1,633 @@
-from datetime import datetime
+import io
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
 
 import numpy as np
-import tintervals as ti
 from tqdm import tqdm
 
-from super_auto_comb.utils import is_summer_time_changing_between
+from super_auto_comb.events import log_event
+from super_auto_comb.utils import local_to_utc, tz_transitions
 
+# fixed widths of the timetag and of each counter channel in K+K lines
+KK_TIME_WIDTH = 17
+KK_COLUMN_WIDTH = 22
 
-def genfromkk(fname, fix_summer_time=False, max_columns=12, **kwargs):
-    """Load a single kk file.
-    Return regularized timetags, assuming data coming at regular intervals and at integer seconds.
+
+def kk_lines(fname, skip_header=1):
+    """Iterate over the lines of a kk file as bytes.
 
     Parameters
     ----------
-    fname : file or str
-            File or filename to be read
+    fname : file, str or list of str
+            File, filename or lines to be read
+    skip_header : int, optional
+            number of lines to skip at the beginning, by default 1
+
+    Yields
+    ------
+    bytes
+            Lines, without line endings.
+    """
+    if isinstance(fname, str):
+        with open(fname, "rb") as f:
+            yield from kk_lines(f, skip_header=skip_header)
+        return
+
+    for i, line in enumerate(fname):
+        if i < skip_header:
+            continue
+        if isinstance(line, str):
+            line = line.encode("UTF-8")
+        yield line.rstrip(b"\r\n")
+
+
+def parse_kk_times(times, tz=None):
+    """Convert K+K timetags (e.g. '220321*000000.848', local time) to seconds from the epoch.
+
+    Parameters
+    ----------
+    times : ndarray
+            Timetags as uint8 array of shape (n, 17).
+    tz : str, optional
+            Timezone of the timetags (e.g. "Europe/Rome"), by default None (system local timezone)
+
+    Returns
+    -------
+    t : ndarray
+            Seconds from the epoch.
+    valid : ndarray of bool
+            False for malformed timetags.
+    """
+    digits = times.astype(int) - ord("0")
+    digit_pos = [0, 1, 2, 3, 4, 5, 7, 8, 9, 10, 11, 12, 14, 15, 16]
+    valid = ((digits[:, digit_pos] >= 0) & (digits[:, digit_pos] <= 9)).all(axis=-1)
+    valid &= np.isin(times[:, 6], [ord("*"), ord(" ")]) & (times[:, 13] == ord("."))
+
+    def field(a, b):
+        return (digits[:, a:b] * 10 ** np.arange(b - a - 1, -1, -1)).sum(axis=-1)
+
+    year = 2000 + field(0, 2)
+    month = np.clip(field(2, 4), 1, 12)
+    months = (year - 1970) * 12 + month - 1
+    days = months.astype("datetime64[M]").astype("datetime64[D]").astype(int) + field(4, 6) - 1
+
+    naive = days * 86400.0 + field(7, 9) * 3600.0 + field(9, 11) * 60.0 + field(11, 13) + field(14, 17) / 1000.0
+    t = local_to_utc(naive, tz)
+
+    return t, valid
+
+
+def _to_float(x):
+    try:
+        return float(x)
+    except ValueError:
+        return np.nan
+
+
+def parse_kk_lines(lines, max_columns=12, usecols=None, tz=None):
+    """Parse K+K lines with vectorized operations on their fixed-width fields.
+
+    Parameters
+    ----------
+    lines : list of bytes
+            Lines to be parsed.
     max_columns : int, optional
             max number of columns to read, by default 12
-    fix_summer_time : bool, optional
-            If true, it will try to fix discontinuities due to summer time (will not work with gaps in the data > 1 h, by default False
+    usecols : list of int, optional
+            Counter channels (1 to max_columns) to be parsed, by default None (all channels)
+    tz : str, optional
+            Timezone of the timetags (e.g. "Europe/Rome"), by default None (system local timezone)
 
     Returns
     -------
     out : ndarray
-            Data read.
+            Data read, with timetags as seconds from the epoch in the first column.
+            Channels not in usecols are NaN.
+            Lines with less than max_columns columns or malformed values (in usecols) are discarded.
     """
-    alldata = np.genfromtxt(
-        fname,
-        delimiter=[17] + [22] * max_columns,
-        skip_header=1,
-        skip_footer=0,
-        converters={0: ti.kk2epoch},
-        invalid_raise=False,
-        encoding="UTF-8",
-        **kwargs,
-    )
+    width = KK_TIME_WIDTH + KK_COLUMN_WIDTH * max_columns
 
-    # faster but breaks on   Measurement interval (re-)synchronized!
-    # alldata = pd.read_csv(fname, sep='\s+', header=None, converters={0:ti.kk2epoch},  **kwargs)
+    lengths = np.fromiter(map(len, lines), dtype=int, count=len(lines))
+    raw = np.array(lines, dtype=f"S{width}")[lengths >= width]
+    raw = raw.view(np.uint8).reshape(-1, width)
 
-    alldata = np.atleast_2d(alldata)
+    t, valid = parse_kk_times(raw[:, :KK_TIME_WIDTH], tz=tz)
 
-    # genfromtxt do not skip lines with wrong number of columns if delimiter is given as number of chars
-    alldata = alldata[~np.isnan(alldata).any(axis=-1)]
+    columns = np.ascontiguousarray(raw[:, KK_TIME_WIDTH:]).view(f"S{KK_COLUMN_WIDTH}")
+    cols = np.arange(max_columns) if usecols is None else np.asarray(usecols, dtype=int) - 1
+    try:
+        values = columns[:, cols].astype(float)
+    except ValueError:
+        # some malformed values (e.g., messages from the counter), only convert them one by one in this case
+        values = np.vectorize(_to_float, otypes=[float])(columns[:, cols])
 
-    t = alldata[:, 0]
+    alldata = np.full((len(t), 1 + max_columns), np.nan)
+    alldata[:, 0] = t
+    alldata[:, 1 + cols] = values
+    return alldata[valid & ~np.isnan(values).any(axis=-1)]
 
-    # regularize timetags -- required if the K+K is not sync'd properly
-    # this expect data coming regularly every 1 second
-    # and assure timetags at integer seconds
-    dt = np.diff(t)
-    dt = np.around(dt)
 
-    # If I want to fix summer time and I detect the change, then I have to close gaps in dt of 1 h
+def loadkk(fname, max_columns=12, skip_header=1, chunk_size=100_000, usecols=None, tz=None):
+    """Load data from a kk file, without regularizing timetags.
+
+    Parameters
+    ----------
+    fname : file, str or list of str
+            File, filename or lines to be read
+    max_columns : int, optional
+            max number of columns to read, by default 12
+    skip_header : int, optional
+            number of lines to skip at the beginning, by default 1
+    chunk_size : int, optional
+            number of lines parsed together, by default 100_000
+    usecols : list of int, optional
+            Counter channels (1 to max_columns) to be parsed, by default None (all channels)
+    tz : str, optional
+            Timezone of the timetags (e.g. "Europe/Rome"), by default None (system local timezone)
+
+    Returns
+    -------
+    out : ndarray
+            Data read, with timetags as seconds from the epoch in the first column.
+
+    Notes
+    -----
+    Lines are parsed in chunks, so that memory use for high-rate data is bounded by the output array.
+    """
+    lines = kk_lines(fname, skip_header=skip_header)
+
+    chunks = []
+    while chunk := list(islice(lines, chunk_size)):
+        chunks += [parse_kk_lines(chunk, max_columns=max_columns, usecols=usecols, tz=tz)]
+
+    if not chunks:
+        return np.empty((0, 1 + max_columns))
+    return np.concatenate(chunks)
+
+
+def fix_summer_time_folds(t, tz=None, previous=None, name=""):
+    """Fix timetags converted from local times repeated at the end of summer time.
+    Repeated local times are converted as their first occurrence (see utils.local_to_utc), so that timetags jump back when the clock goes back.
+    Only timetags in the repeated interval after the jump back are moved forward, keeping real gaps in the data.
+
+    Parameters
+    ----------
+    t : ndarray
+            Timetags as seconds from the epoch, in the order of acquisition.
+    tz : str, optional
+            Timezone of the local times (e.g. "Europe/Rome"), by default None (system local timezone)
+    previous : float, optional
+            Last (fixed) timetag of previous data, to continue a stream, by default None
+    name : str, optional
+            Name of the data source used in messages, by default ''
+
+    Returns
+    -------
+    ndarray
+            Fixed timetags.
+
+    Notes
+    -----
+    If the data has a gap over the whole repeated interval, the jump back is not seen and timetags are not fixed.
+    """
+    t_ext = t if previous is None else np.r_[previous, t]
+    if len(t_ext) == 0:
+        return t
+
+    times, before, after = tz_transitions(np.min(t_ext), np.max(t_ext) + 86400.0, tz)
+    fixed = np.array(t_ext, dtype=float)
+    for transition, shift in zip(times, before - after):
+        if shift <= 0:
+            continue
+        # timetags of the repeated local times, and jumps back from them (by at least half the change of offset)
+        repeated = (t_ext >= transition - shift) & (t_ext < transition)
+        back = np.flatnonzero((np.diff(t_ext) < -0.5 * shift) & repeated[1:]) + 1
+        if len(back) == 0:
+            continue
+
+        after_back = repeated & (np.arange(len(t_ext)) >= back[0])
+        fixed[after_back] += shift
+        tqdm.write(f"{name}: Fixed summertime, {np.sum(after_back)} timetags moved by {shift:g} s.")
+        log_event(
+            "summer_time",
+            name,
+            count=int(np.sum(after_back)),
+            shift=shift,
+            transition=transition,
+            start=t_ext[0],
+            stop=t_ext[-1],
+        )
+
+    return fixed[len(t_ext) - len(t) :]
+
+
+def regularize_timetags(t, fix_summer_time=False, name="", previous=None, gate_time=1.0, tz=None):
+    """Regularize timetags, assuming data coming at regular intervals and at integer multiples of the gate time.
+
+    Parameters
+    ----------
+    t : ndarray
+            Input timetags.
+    fix_summer_time : bool, optional
+            If true, it will fix timetags of local times repeated at the end of summer time (see fix_summer_time_folds), by default False
+    name : str, optional
+            Name of the data source used in messages, by default ''
+    previous : tuple, optional
+            (raw, regularized) last timetag of previous data, to continue the regularization of a stream, by default None
+    gate_time : float, optional
+            Gate time of the counter in s, by default 1.
+    tz : str, optional
+            Timezone of the local times, used to fix summer time, by default None (system local timezone)
+
+    Returns
+    -------
+    t2 : ndarray
+            Regularized timetags.
+    idx : ndarray
+            Indices of the input timetags kept (not unique timetags are removed).
+    """
+    # regularize timetags -- required if the K+K is not sync'd properly
+    # this expect data coming regularly every gate time
+    # and assure timetags at integer multiples of the gate time
+    # (calculated as integer number of gates, to avoid accumulating rounding errors)
     if fix_summer_time:
-        start = datetime.fromtimestamp(t[0])
-        stop = datetime.fromtimestamp(t[-1])
-        if is_summer_time_changing_between(start, stop):
-            tqdm.write(f"{fname}: Trying to fix summertime.")
-            dt = dt % 3600.0
+        t = fix_summer_time_folds(t, tz=tz, previous=None if previous is None else previous[0], name=name)
+
+    if previous is None:
+        t_ext = t
+    else:
+        t_ext = np.concatenate(([previous[0]], t))
+    dt = np.diff(t_ext)
+    dt = np.around(dt / gate_time)
 
-    t0 = np.round(t[0])
-    t2 = np.insert(np.cumsum(dt) + t0, 0, t0)
+    if previous is None:
+        n0 = np.round(t[0] / gate_time)
+        t2 = np.insert(np.cumsum(dt) + n0, 0, n0) * gate_time
+    else:
+        t2 = (np.cumsum(dt) + np.round(previous[1] / gate_time)) * gate_time
 
     dev = t2[-1] - t[-1]
-    if dev > 0.5:
-        tqdm.write(f"{fname}: Timetags regularization deviation {dev} s")
+    if dev > 0.5 * gate_time:
+        tqdm.write(f"{name}: Timetags regularization deviation {dev} s")
+        log_event("regularization_deviation", name, deviation=dev, start=t[0], stop=t[-1])
     # check tags
     uniq, idx, count = np.unique(t2, return_index=True, return_counts=True)
     if sum(count > 1) > 0:
-        tqdm.write(f"{fname}: {sum(count>1)} not unique timetags!")
-        t2 = t2[idx]
-        alldata = alldata[idx]
+        tqdm.write(f"{name}: {sum(count>1)} not unique timetags!")
+        log_event(
+            "not_unique_timetags",
+            name,
+            count=int(np.sum(count > 1)),
+            removed=len(t2) - len(uniq),
+            first=uniq[np.argmax(count > 1)],
+            start=t[0],
+            stop=t[-1],
+        )
+    else:
+        idx = np.arange(len(t2))
+
+    if previous is not None:
+        # a stream cannot go back in time
+        idx = idx[t2[idx] > previous[1]]
+
+    return t2[idx], idx
+
+
+def genfromkk(fname, fix_summer_time=False, max_columns=12, gate_time=1.0, tz=None, **kwargs):
+    """Load a single kk file.
+    Return regularized timetags, assuming data coming at regular intervals and at integer multiples of the gate time.
+
+    Parameters
+    ----------
+    fname : file or str
+            File or filename to be read
+    max_columns : int, optional
+            max number of columns to read, by default 12
+    fix_summer_time : bool, optional
+            If true, it will fix timetags of local times repeated at the end of summer time, by default False
+    gate_time : float, optional
+            Gate time of the counter in s, by default 1.
+    tz : str, optional
+            Timezone of the timetags (e.g. "Europe/Rome"), by default None (system local timezone)
+
+    Returns
+    -------
+    out : ndarray
+            Data read.
+    """
+    # name for messages, also when reading from a prefetched file
+    name = getattr(fname, "name", fname)
+
+    alldata = loadkk(fname, max_columns=max_columns, tz=tz, **kwargs)
+
+    t2, idx = regularize_timetags(alldata[:, 0], fix_summer_time=fix_summer_time, name=name, gate_time=gate_time, tz=tz)
+    alldata = alldata[idx]
+    alldata[:, 0] = t2
+
+    return alldata
+
+
+# Binary counter logs: a 16 bytes header (magic b"SACBIN01", format version and number of channels as little-endian uint32)
+# followed by records of little-endian float64: timetag (seconds from the epoch, UTC) and the value of each channel.
+# Records can be appended while the file is being read (a partially written last record is ignored).
+BINLOG_MAGIC = b"SACBIN01"
+BINLOG_VERSION = 1
+BINLOG_HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("channels", "<u4")])
 
-    allt = t2
-    alldata[:, 0] = allt
+
+def savebin(fname, alldata, append=False):
+    """Save data to a binary counter log.
+
+    Parameters
+    ----------
+    fname : str
+            Output file.
+    alldata : ndarray
+            Data with timetags (seconds from the epoch, UTC) in the first column and a column for each channel.
+    append : bool, optional
+            If True, append records to an existing log with the same number of channels, by default False
+    """
+    alldata = np.asarray(alldata, dtype="<f8")
+    channels = alldata.shape[1] - 1
+
+    if append and os.path.exists(fname):
+        header = np.fromfile(fname, dtype=BINLOG_HEADER, count=1)[0]
+        if header["channels"] != channels:
+            raise ValueError(f"{fname} has {header['channels']} channels, not {channels}.")
+        with open(fname, "ab") as f:
+            f.write(alldata.tobytes())
+        return
+
+    header = np.array((BINLOG_MAGIC, BINLOG_VERSION, channels), dtype=BINLOG_HEADER)
+    with open(fname, "wb") as f:
+        f.write(header.tobytes())
+        f.write(alldata.tobytes())
+
+
+def loadbin(fname, max_columns=12, usecols=None):
+    """Load data from a binary counter log without copying or parsing it, and without regularizing timetags.
+
+    Parameters
+    ----------
+    fname : file or str
+            File (with a getbuffer method, as from read_file) or filename to be read.
+    max_columns : int, optional
+            Number of channels returned, by default 12
+    usecols : list of int, optional
+            Channels (1 to max_columns) to be returned, by default None (all channels)
+
+    Returns
+    -------
+    out : ndarray
+            Data read, with timetags as seconds from the epoch in the first column.
+            If usecols or max_columns select part of the channels, other channels are NaN.
+            Otherwise the output is a read-only view of the file (memory-mapped).
+    """
+    if hasattr(fname, "getbuffer"):
+        buf = np.frombuffer(fname.getbuffer(), dtype=np.uint8)
+    else:
+        buf = np.memmap(fname, dtype=np.uint8, mode="r")
+
+    name = getattr(fname, "name", fname)
+    header = buf[: BINLOG_HEADER.itemsize].view(BINLOG_HEADER)[0]
+    if header["magic"] != BINLOG_MAGIC or header["version"] != BINLOG_VERSION:
+        raise ValueError(f"{name} is not a binary counter log.")
+
+    channels = int(header["channels"])
+    record = 8 * (1 + channels)
+    n = (len(buf) - BINLOG_HEADER.itemsize) // record
+    records = buf[BINLOG_HEADER.itemsize : BINLOG_HEADER.itemsize + n * record].view("<f8").reshape(n, 1 + channels)
+
+    if usecols is None and channels == max_columns:
+        return records
+
+    cols = np.arange(1, min(channels, max_columns) + 1) if usecols is None else np.asarray(usecols, dtype=int)
+    cols = cols[cols <= channels]
+    out = np.full((n, 1 + max_columns), np.nan)
+    out[:, 0] = records[:, 0]
+    out[:, cols] = records[:, cols]
+    return out
+
+
+def genfrombin(fname, max_columns=12, gate_time=1.0, **kwargs):
+    """Load a single binary counter log.
+    Return regularized timetags, assuming data coming at regular intervals and at integer multiples of the gate time.
+
+    Parameters
+    ----------
+    fname : file or str
+            File or filename to be read
+    max_columns : int, optional
+            Number of channels returned, by default 12
+    gate_time : float, optional
+            Gate time of the counter in s, by default 1.
+
+    Returns
+    -------
+    out : ndarray
+            Data read.
+
+    Notes
+    -----
+    Timetags of binary logs are in UTC, so that no fix of summer time is needed.
+    """
+    name = getattr(fname, "name", fname)
+
+    alldata = loadbin(fname, max_columns=max_columns, **kwargs)
+
+    t2, idx = regularize_timetags(alldata[:, 0], name=name, gate_time=gate_time)
+    # a copy of the (possibly memory-mapped) data, only with the channels
+    alldata = alldata[idx]
+    alldata[:, 0] = t2
 
     return alldata
+
+
+def counter_number(fname):
+    """Return the number of the counter of a K+K file from its name (e.g. 2 for 220321_2_Frequ.txt)."""
+    name = os.path.basename(getattr(fname, "name", fname))
+    return int(name.split("_")[1])
+
+
+def merge_counters(tables, counters, max_columns=12, tolerance=0.5):
+    """Join data from several counters on their timetags, with consecutive channel numbering.
+
+    Parameters
+    ----------
+    tables : list of ndarray
+            Data of each counter, with timetags in the first column, as returned by loadkk.
+    counters : list of int
+            Counter number of each table. Channels of counter n are numbered from (n - 1) * max_columns + 1.
+    max_columns : int, optional
+            Number of channels of each counter, by default 12
+    tolerance : float, optional
+            Max difference in s between joined timetags, by default 0.5
+
+    Returns
+    -------
+    out : ndarray
+            Joined data on the sorted union of the timetags (an outer join), with NaN for channels of counters
+            without a timetag within tolerance.
+            Joined rows take the timetag of the first table with data.
+    """
+    ref = np.empty(0)
+    rows = []
+    for table in tables:
+        t = table[:, 0]
+        idx = np.full(len(t), -1)
+        if len(ref) > 0 and len(t) > 0:
+            # nearest timetag of the union for each timetag of this table
+            right = np.clip(np.searchsorted(ref, t), 0, len(ref) - 1)
+            left = np.maximum(right - 1, 0)
+            nearest = np.where(np.abs(ref[left] - t) < np.abs(ref[right] - t), left, right)
+            matched = np.abs(ref[nearest] - t) <= tolerance
+            # a row of the union is joined to a single timetag of each table
+            _, first = np.unique(nearest[matched], return_index=True)
+            joined = np.flatnonzero(matched)[first]
+            idx[joined] = nearest[joined]
+
+        # timetags not joined are new rows of the union, kept sorted
+        new = idx < 0
+        idx[new] = len(ref) + np.arange(np.sum(new))
+        ref = np.concatenate((ref, t[new]))
+        order = np.argsort(ref, kind="stable")
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+        ref = ref[order]
+        rows = [position[r] for r in rows] + [position[idx]]
+
+    out = np.full((len(ref), 1 + max_columns * max(counters)), np.nan)
+    out[:, 0] = ref
+    for table, n, r in zip(tables, counters, rows):
+        out[r, 1 + (n - 1) * max_columns : 1 + n * max_columns] = table[:, 1:]
+
+    return out
+
+
+def genfromkk_counters(
+    fnames, fix_summer_time=False, max_columns=12, gate_time=1.0, tolerance=None, usecols=None, loader=None, tz=None
+):
+    """Load the kk files of several counters for the same day, joined in a single table.
+    Return regularized timetags, assuming data coming at regular intervals and at integer multiples of the gate time.
+
+    Parameters
+    ----------
+    fnames : list of file or str
+            Files or filenames to be read (with the counter number in their name).
+    fix_summer_time : bool, optional
+            If true, it will fix timetags of local times repeated at the end of summer time, by default False
+    max_columns : int, optional
+            Number of columns of each counter, by default 12
+    gate_time : float, optional
+            Gate time of the counters in s, by default 1.
+    tolerance : float, optional
+            Max difference in s between joined timetags, by default half the gate time.
+    usecols : list of int, optional
+            Channels to be parsed, numbered consecutively across counters, by default None (all channels).
+            Files of counters without channels in usecols are not read.
+    loader : callable, optional
+            Function loading a file without regularizing its timetags, by default loadkk with timezone tz (loadbin for binary counter logs)
+    tz : str, optional
+            Timezone of the timetags (e.g. "Europe/Rome"), by default None (system local timezone)
+
+    Returns
+    -------
+    out : ndarray
+            Data read, with channels of counter n in columns from (n - 1) * max_columns + 1.
+
+    Notes
+    -----
+    Timetags are joined before regularization, so that sub-second offsets between counters do not round to different gates.
+    Timetags missing from some counters are kept, with NaN channels for those counters.
+    """
+    if tolerance is None:
+        tolerance = 0.5 * gate_time
+    if loader is None:
+        loader = partial(loadkk, tz=tz)
+
+    counters = [counter_number(f) for f in fnames]
+    tables = []
+    used = []
+    for fname, n in sorted(zip(fnames, counters), key=lambda x: x[1]):
+        if usecols is None:
+            cols = None
+        else:
+            cols = [c - (n - 1) * max_columns for c in usecols if 0 < c - (n - 1) * max_columns <= max_columns]
+            if not cols:
+                continue
+        table = loader(fname, max_columns=max_columns, usecols=cols)
+        if fix_summer_time:
+            # fixed on each counter, as the joined timetags are sorted (losing the order of acquisition)
+            table[:, 0] = fix_summer_time_folds(table[:, 0], tz=tz, name=getattr(fname, "name", fname))
+        tables += [table]
+        used += [n]
+
+    name = "+".join(str(getattr(f, "name", f)) for f in fnames)
+    if not tables:
+        raise ValueError(f"{name}: no counter with the channels to be read.")
+
+    alldata = merge_counters(tables, used, max_columns=max_columns, tolerance=tolerance)
+    if len(alldata) == 0:
+        return alldata
+
+    t2, idx = regularize_timetags(alldata[:, 0], name=name, gate_time=gate_time)
+    alldata = alldata[idx]
+    alldata[:, 0] = t2
+
+    return alldata
+
+
+def read_file(fname):
+    """Read a whole file in memory.
+
+    Parameters
+    ----------
+    fname : str
+        Filename to be read.
+
+    Returns
+    -------
+    BytesIO
+        File-like object with the file content, with the attribute name set to fname.
+    """
+    with open(fname, "rb") as f:
+        buf = io.BytesIO(f.read())
+    buf.name = fname
+    return buf
+
+
+def prefetch(function, items, depth=2):
+    """Apply a function to items, computing the next results in background threads.
+
+    Parameters
+    ----------
+    function : callable
+        Function to be applied to each item (e.g., reading or loading a file).
+    items : iterable
+        Input items.
+    depth : int, optional
+        Number of results computed in advance, by default 2.
+        Memory use is bounded to depth + 1 results. If 0, results are computed only when requested.
+
+    Yields
+    ------
+    Results of function(item), in the same order as items.
+    """
+    if depth < 1:
+        for item in items:
+            yield function(item)
+        return
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        pending = deque(executor.submit(function, item) for _, item in zip(range(depth), items))
+
+        while pending:
+            res = pending.popleft().result()
+            for item in items:
+                pending.append(executor.submit(function, item))
+                break
+            yield res
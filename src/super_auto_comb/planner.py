@@ -0,0 +1,238 @@
+"""
+Dry-run planning of a processing run.
+The plan is built from the setup files and the listing of the comb directory only, without reading data,
+and reports files, setup segments, output segments, figures and an estimated cost of each stage.
+
+"""
+
+import glob
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from super_auto_comb.fix_files import find_files
+from super_auto_comb.load_files import counter_number
+from super_auto_comb.utils import generate_dates
+
+# rough cost of each stage in s per unit (rows or figures)
+# calibrated timing each stage on the sample data (tests/samples: a file of 3600 rows of 12 channels, one DO,
+# without median filter) on a laptop; absolute costs depend on the machine, fractions of the total are more reliable
+STAGE_COSTS = {
+    "parse": 9e-6,  # per row of each file read
+    "process": 5e-7,  # per row and DO setup segment
+    "figures": 1.0,  # per figure
+    "save": 1e-5,  # per row and DO
+}
+
+
+def estimate_rows(file, max_columns=12):
+    """Estimate the number of rows in a K+K file from its size and the length of its first data line.
+
+    Parameters
+    ----------
+    file : str
+        K+K file.
+    max_columns : int, optional
+        Number of columns in the comb datafile, used if the file has no complete line, by default 12
+
+    Returns
+    -------
+    int
+        Estimated number of rows.
+    """
+    size = os.path.getsize(file)
+    with open(file, "rb") as f:
+        head = f.read(4096).splitlines(keepends=True)
+
+    # the first line of K+K files is a header
+    lines = [x for x in head[1:] if x.endswith(b"\n")]
+    line_length = len(lines[0]) if lines else 17 + 22 * max_columns + 2
+    return round(size / line_length)
+
+
+def file_span(fname):
+    """Return the (start, stop) MJD span of a K+K file from its name (e.g. 220321_1_Frequ.txt covers the local day 2022-03-21)."""
+    import tintervals as ti
+
+    start = ti.datetime2mjd(datetime.strptime(os.path.basename(fname)[:6], "%y%m%d"))
+    return start, start + 1.0
+
+
+def merge_plan_files(files, channels, max_columns=12):
+    """Group planned files of the same day as joined by --merge-counters.
+
+    Parameters
+    ----------
+    files : list of dict
+        Planned files (see build_plan).
+    channels : list of int
+        Channels used by the setups, numbered consecutively across counters.
+    max_columns : int, optional
+        Number of channels of each counter, by default 12
+
+    Returns
+    -------
+    list of dict
+        Planned files, one for each day and format (e.g. 220321_1+2_Frequ.txt), with the files joined ('counters')
+        and those read ('read', only counters with channels used by the setups).
+        Rows are the rows of the largest file, as the files are joined on their timetags.
+    """
+    used = {(c - 1) // max_columns + 1 for c in channels}
+
+    groups = {}
+    for f in files:
+        groups.setdefault((f["file"][:6], os.path.splitext(f["file"])[1]), []).append(f)
+
+    res = []
+    for (day, ext), group in sorted(groups.items()):
+        read = [f for f in group if counter_number(f["file"]) in used]
+        res += [
+            {
+                "file": day + "_" + "+".join(str(counter_number(f["file"])) for f in group) + "_Frequ" + ext,
+                "date": group[0]["date"],
+                "counters": [f["file"] for f in group],
+                "read": [f["file"] for f in read],
+                "conflicted": any(f["conflicted"] for f in group),
+                "span": group[0]["span"],
+                "rows": max((f["rows"] for f in read), default=0),
+                "rows_in_range": max((f["rows_in_range"] for f in read), default=0),
+                "parsed_rows": sum(f["rows"] for f in read),
+                "segments": {},
+            }
+        ]
+    return res
+
+
+def _overlap(a, b):
+    return max(0.0, min(a[1], b[1]) - max(a[0], b[0])) / (a[1] - a[0])
+
+
+def build_plan(args, start, stop):
+    """Build the plan of processing data from start to stop.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed CLI arguments.
+    start : float
+        Start date as MJD.
+    stop : float
+        Stop date as MJD.
+
+    Returns
+    -------
+    dict
+        Plan with files (estimated rows and setup segments hit by each file, or by each group of files joined with
+        args.merge_counters), output segments for each DO, number of figures, estimated cost of each stage and,
+        if args.shard, estimated rows of each shard.
+    """
+    from super_auto_comb.process import load_setups, setup_channels
+    from super_auto_comb.readers import reader_for, reader_patterns
+
+    files = []
+    for date in generate_dates(start, stop):
+        names = []
+        for pattern in reader_patterns(args.reader):
+            names += find_files(args.comb_dir, date, regex=pattern)
+        # conflicted K+K files are fixed before processing
+        if args.reader in [None, "kk"]:
+            conflicted = glob.glob(os.path.join(args.comb_dir, date.strftime("%y%m%d_?_Frequ (conflicted).txt")))
+            names += [os.path.basename(x).replace(" (conflicted)", "") for x in conflicted]
+        for name in sorted(set(names)):
+            fname = os.path.join(args.comb_dir, name)
+            path = fname if os.path.exists(fname) else fname[:-4] + " (conflicted).txt"
+            span = file_span(name)
+            rows = int(reader_for(name, args.reader)["rows"](path, args.max_columns))
+            files += [
+                {
+                    "file": name,
+                    "date": date.strftime("%Y-%m-%d"),
+                    "conflicted": path != fname,
+                    "span": span,
+                    "rows": rows,
+                    "rows_in_range": round(rows * _overlap(span, (start, stop))),
+                    "segments": {},
+                }
+            ]
+
+    in_setups, out_setups = load_setups(args, (start, stop)) if files else ([], [])
+
+    # with --merge-counters, files of the same day are joined and only counters with used channels are read
+    if args.merge_counters and files:
+        files = merge_plan_files(files, setup_channels(in_setups), args.max_columns)
+
+    dos = {}
+    n_figures = 0
+    process_units = 0
+    for doi, do in enumerate(args.do if files else []):
+        df = in_setups[doi]
+        valid = df[df["valid"] == True]
+        out = out_setups[doi]
+        out = out[(out["valid"] == True) & (out["datetime_end"] >= start) & (out["datetime"] < stop)]
+
+        for f in files:
+            lo, hi = max(f["span"][0], start), min(f["span"][1], stop)
+            hit = valid[(valid["datetime_end"] > lo) & (valid["datetime"] < hi)]
+            f["segments"][do] = [str(x) for x in hit["name"]]
+            # a figure for each segment with data, only rendered while processing with --figures
+            n_figures += len(hit) if f["rows_in_range"] > 0 and args.figures else 0
+            process_units += f["rows_in_range"] * len(hit)
+
+        dos[do] = {
+            "setup_segments": len(valid),
+            "output_segments": [str(x) for x in out["name"]],
+        }
+
+    rows = sum(f["rows"] for f in files)
+    rows_in_range = sum(f["rows_in_range"] for f in files)
+    units = {
+        "parse": sum(f.get("parsed_rows", f["rows"]) for f in files),
+        "process": process_units,
+        "figures": n_figures,
+        "save": rows_in_range * len(dos),
+    }
+    costs = {k: units[k] * STAGE_COSTS[k] for k in STAGE_COSTS}
+    total = sum(costs.values())
+
+    plan = {
+        "start": start,
+        "stop": stop,
+        "files": files,
+        "dos": dos,
+        "rows": rows,
+        "rows_in_range": rows_in_range,
+        "figures": n_figures,
+        "stages": {
+            k: {"units": units[k], "cost": round(costs[k], 3), "fraction": round(costs[k] / total, 3) if total else 0.0}
+            for k in STAGE_COSTS
+        },
+        "cost": round(total, 3),
+    }
+
+    if args.shard:
+        from super_auto_comb.scheduler import generate_shards
+
+        plan["shards"] = [
+            {
+                "label": label,
+                "start": s,
+                "stop": e,
+                "rows": sum(round(f["rows"] * _overlap(f["span"], (s, e))) for f in files),
+            }
+            for label, s, e in generate_shards(start, stop, args.shard)
+        ]
+
+    return plan
+
+
+def plan_to_json(plan):
+    """Return a plan as JSON (numpy numbers as python numbers)."""
+
+    def default(x):
+        if isinstance(x, np.generic):
+            return x.item()
+        raise TypeError(f"Object of type {type(x).__name__} is not JSON serializable")
+
+    return json.dumps(plan, indent=1, default=default)
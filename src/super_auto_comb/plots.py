@@ -0,0 +1,74 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import tintervals as ti
+
+# avoid interactive plotting
+plt.ioff()
+
+
+def plot_segment(figname, title, t, f_beat, y, flag, mask1, mask2, mask3, mask4=None, median_label=""):
+    """Plot masks, beatnote and fractional frequency of a processed segment and save the figure.
+
+    Parameters
+    ----------
+    figname : str
+        Output filename.
+    title : str
+        Figure title.
+    t : ndarray
+        Timetags in s.
+    f_beat : ndarray
+        Beatnote in Hz.
+    y : ndarray
+        Fractional frequency.
+    flag : ndarray
+        Data flags.
+    mask1, mask2, mask3 : ndarray
+        Masks from bounds, double counting and f0 deglitching.
+    mask4 : ndarray, optional
+        Mask from the median filter, if applied, by default None
+    median_label : str, optional
+        Median filter parameters shown in the legend, by default ''
+    """
+    mjd = ti.mjd_from_epoch(t)
+
+    fig, axs = plt.subplots(3, sharex=True, figsize=(6.4 * 1.5, 4.8))
+    fig.suptitle(title)
+
+    axs[0].set_ylabel("Flag")
+    # axs[0].plot(mjd, flag, label=f'Removed points = {sum(flag==0)}')
+    axs[0].fill_between(mjd, 3 - mask1, 2, label=f"Filter mask -> {sum(~mask1)}", step="pre")
+    axs[0].fill_between(mjd, 2 - mask2, 1, label=f"Glitch mask -> {sum(~mask2)}", step="pre")
+    axs[0].fill_between(mjd, 1 - mask3, 0, label=f"f0 mask -> {sum(~mask3)}", step="pre")
+    if mask4 is not None:
+        label = f"Median mask ({median_label})\n-> {sum(~mask4)}"
+        axs[0].fill_between(mjd, 0 - mask4, -1, label=label, step="pre")
+
+    axs[0].legend(loc="center left", bbox_to_anchor=(1, 0.5))
+    axs[1].plot(mjd, f_beat * 1e-6, label="raw")
+    axs[1].plot(mjd[flag > 0], f_beat[flag > 0] * 1e-6, ".", label=f"All masks -> {sum(flag==0)}")
+    axs[1].plot(mjd[~(mask2)], f_beat[~(mask2)] * 1e-6, "o", label="Glitches")
+    axs[1].set_ylabel("Beat /MHz")
+    axs[1].legend(loc="center left", bbox_to_anchor=(1, 0.5))
+
+    if np.any(flag > 0):
+        meany = np.mean(y[flag > 0])
+        axs[2].axhline(meany, label=f"Mean = {meany:.3}", color="black")
+
+    axs[2].plot(mjd[flag > 0], y[flag > 0], ".", label=f"Points = {sum(flag>0)}", color="C1")
+    # axs[2].plot(mjd[flag>0], uniform_filter1d(y[flag>0],1000), '.', label=f'Moving average')
+    axs[2].set_ylabel("y")
+    axs[2].set_xlabel("MJD")
+    axs[2].set_xlim(np.min(mjd), np.min(mjd) + 1)
+    axs[2].legend(loc="center left", bbox_to_anchor=(1, 0.5))
+
+    plt.tight_layout()
+
+    figdir = os.path.dirname(figname)
+    if figdir and not os.path.exists(figdir):
+        os.makedirs(figdir)
+    plt.savefig(figname)
+
+    plt.close()
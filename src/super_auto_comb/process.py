@@ -0,0 +1,818 @@
+"""
+Processing stages of comb data, shared by the file and the stream pipelines:
+loading setups, deglitching and converting data for each DO setup, and saving outputs for each output segment.
+Setups are the Dataframes (or their rows) from track_changes.
+
+"""
+
+import os
+import time
+
+import numpy as np
+import tintervals as ti
+import tintervals.rocitlinks as rl
+from tqdm import tqdm
+
+from super_auto_comb.calc import beat2y, decimate
+from super_auto_comb.deglitch import (
+    deglitch_from_bounds,
+    deglitch_from_double_counting,
+    deglitch_from_f0,
+    deglitch_from_median_filter,
+)
+from super_auto_comb.events import log_event
+from super_auto_comb.figures import RECORD_SUFFIX, render_figure, save_record
+from super_auto_comb.results import Results, concatenate
+from super_auto_comb.save_files import update_link_to_dir
+from super_auto_comb.stats import summary
+from super_auto_comb.track_changes import (
+    df_add_name,
+    df_extract,
+    df_from_cirt,
+    df_limit,
+    df_merge,
+    df_reduce,
+    format_possibly_changing_info,
+    load_do_setup,
+)
+from super_auto_comb.uptime import update_uptime, valid_intervals
+
+
+def load_setups(args, span):
+    """Load DO setups for inputs and outputs.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed CLI arguments.
+    span : tuple
+        (start, stop) MJD of the range to be processed.
+
+    Returns
+    -------
+    in_setups : list of DataFrame
+        Setups for reading inputs of each DO (all changes tracked).
+    out_setups : list of DataFrame
+        Setups for saving outputs of each DO (only changes selected in args tracked).
+    """
+    do_bar = tqdm(args.do)
+    # setups for reading inputs and for saving outpus (tracks different changes)
+    in_setups = []
+    out_setups = []
+
+    # bug: not enough circular t informaton if start is much later that the start in the setup
+    # cirt = load_cirt_setup(start, stop)
+    cirt = df_from_cirt(span[0] - 40, span[1])
+
+    for do in do_bar:
+        do_bar.set_description(f"Loading {do} setup.")
+        df = load_do_setup(do, dir=args.setup_dir)
+        df = df_merge(df, cirt)
+        df = df_limit(df, *span)
+
+        # start to worry here about what will be tracked changes
+        # nominal frequency is ALWAYS tracked on the output
+        tracked = ["nominal"]
+        if args.track_phys:
+            tracked += ["physical"]
+        if args.track_comb:
+            tracked += ["comb"]
+        if args.track_maser:
+            tracked += ["maser"]
+        if args.track_cirt:
+            tracked += ["cirt"]
+
+        df_add_name(
+            df,
+            fix=[],
+            var=[x for x in ["physical", "comb", "maser", "cirt"] if x in tracked],
+        )
+
+        # output_df only has major changes tracked
+        output_df = df_reduce(df, tracked)
+
+        in_setups += [df]
+        out_setups += [output_df]
+
+    return in_setups, out_setups
+
+
+def setup_channels(in_setups):
+    """Return the counter channels used by the valid setups of all DOs.
+
+    Parameters
+    ----------
+    in_setups : list of DataFrame
+        Setups for reading inputs of each DO.
+
+    Returns
+    -------
+    list of int
+        Sorted channels (beat notes and f0 of the combs).
+    """
+    channels = set()
+    for df in in_setups:
+        for s in df.iloc:
+            if s["valid"] == False:
+                continue
+            channels.update(int(c) for c in df_extract(s, ["counter", "counter1", "counter2"]))
+            channels.add(int(s["counter_f0_" + s["comb"]]))
+    return sorted(channels)
+
+
+def compact_setups(in_setups, channels):
+    """Return setups reading comb data with only some channels, as loaded by cli.comb_loader.
+    Channels used by valid setups are renumbered as their column in the compact data (the i-th channel in column i).
+
+    Parameters
+    ----------
+    in_setups : list of DataFrame
+        Setups for reading inputs of each DO.
+    channels : list of int
+        Sorted channels kept in the comb data, including all the channels of the valid setups (see setup_channels).
+
+    Returns
+    -------
+    list of DataFrame
+        Copies of the setups, with renumbered channels.
+    """
+    column = {c: i + 1 for i, c in enumerate(channels)}
+
+    res = []
+    for df in in_setups:
+        df = df.copy()
+        for i, s in zip(df.index, df.iloc):
+            if not s["valid"]:
+                continue
+            for col in [c for c in ["counter", "counter1", "counter2"] if c in df] + ["counter_f0_" + s["comb"]]:
+                df.loc[i, col] = column[int(s[col])]
+        res += [df]
+    return res
+
+
+def setup_segments(alldata, do_setup, start, stop):
+    """Split comb data in the valid setups of a DO.
+
+    Parameters
+    ----------
+    alldata : ndarray
+        Comb data (timetags and counter channels), as returned by genfromkk.
+    do_setup : DataFrame
+        Setup for reading inputs of the DO.
+    start : float
+        Start date as MJD.
+    stop : float
+        Stop date as MJD.
+
+    Yields
+    ------
+    s : Series
+        Setup.
+    data : ndarray
+        Comb data in the setup (a view if timetags are sorted).
+    """
+    # segments of sorted data are selected as views
+    t = alldata[:, 0]
+    is_sorted = np.all(np.diff(t) > 0)
+
+    # pandas is stupid :(
+    # 	for x in loyb[loyb['datetime']>59900].iloc:
+    #  ...:     print(x['cirt'])
+    for s in do_setup.iloc:
+        if s["valid"] == False:  # noqa: E712 # the valid column store np.bool_ for whatever reason
+            continue
+
+        this_start = max(start, s["datetime"])
+        this_stop = min(stop, s["datetime_end"])
+
+        # mask data
+        tstart = ti.mjd2epoch(this_start)
+        tstop = ti.mjd2epoch(this_stop)
+
+        if is_sorted:
+            yield s, alldata[np.searchsorted(t, tstart) : np.searchsorted(t, tstop)]
+        else:
+            yield s, alldata[(t >= tstart) & (t < tstop)]
+
+
+def process_data(alldata, args, in_setups, start, stop, basename=None, diagnostics=None):
+    """Process comb data for all DOs and their setups.
+
+    Parameters
+    ----------
+    alldata : ndarray
+        Comb data (timetags and counter channels), as returned by genfromkk.
+    args : Namespace
+        Parsed CLI arguments.
+    in_setups : list of DataFrame
+        Setups for reading inputs of each DO.
+    start : float
+        Start date as MJD.
+    stop : float
+        Stop date as MJD.
+    basename : str, optional
+        Name of the comb file, used for figures and their records, by default None (no figures)
+    diagnostics : list, optional
+        If given, a row of diagnostics (see diagnostics_row) is appended for each DO and setup, by default None
+
+    Returns
+    -------
+    list
+        For each DO, a list of processed Results, one for each setup.
+    """
+    data_out = [[] for d in args.do]
+
+    for doi, do in enumerate(args.do):
+        # LOOP 3c: track changes
+        for s, data in setup_segments(alldata, in_setups[doi], start, stop):
+            if len(data) > 0:
+                tic = time.perf_counter()
+                res = process_segment(
+                    data,
+                    s,
+                    flag=args.flag,
+                    median_filter=args.median_filter,
+                    median_window=args.median_filter_window,
+                    median_threshold=args.median_filter_threshold,
+                    gate_time=args.gate_time,
+                )
+                y = res["y"]
+                flag = res["flag"]
+
+                out = Results(
+                    data[:, 0],
+                    y,
+                    flag,
+                    step=args.gate_time,
+                    masks=(res["mask1"], res["mask2"], res["mask3"], res["mask4"]),
+                )
+
+                # DONE, concatenate with previous data
+                data_out[doi] += [out]
+
+                if diagnostics is not None:
+                    diagnostics += [
+                        diagnostics_row(basename, do, s, data, res, time.perf_counter() - tic, args.gate_time)
+                    ]
+
+                # records for rendering figures later, and figures only if requested
+                if basename is not None:
+                    title = f"{basename} - {s['comb']} - {do}"
+                    median_label = (
+                        f"{args.median_filter_window:g} s/{args.median_filter_threshold} Hz"
+                        if args.median_filter
+                        else ""
+                    )
+                    figname = os.path.join(args.fig_dir, s["name"], do, basename + ".png")
+                    record = figname[:-4] + RECORD_SUFFIX
+                    save_record(record, out, res["f_beat"], title, median_label=median_label)
+
+                    if args.figures:
+                        # rendered from the record, as figures rendered later
+                        render_figure(record, figname)
+
+    return data_out
+
+
+def diagnostics_row(basename, do, s, data, res, elapsed, step=1.0):
+    """Return a row of the diagnostics table for a comb file, DO and setup.
+
+    Parameters
+    ----------
+    basename : str
+        Name of the comb file.
+    do : str
+        DO name.
+    s : Series
+        Setup.
+    data : ndarray
+        Comb data of the setup.
+    res : dict
+        Results of process_segment.
+    elapsed : float
+        Processing time in s.
+    step : float, optional
+        Time step of the data in s, by default 1.
+
+    Returns
+    -------
+    dict
+        Points rejected by each mask, valid points, figures of merit of valid data (channel deviation as the rms of
+        the peak-to-peak of double counting, mean deviation of f0, mean beat note, mean y) and processing time.
+    """
+    valid = res["flag"] > 0
+    nvalid = int(np.sum(valid))
+
+    def mean(x):
+        return np.mean(x[valid]) if nvalid > 0 else np.nan
+
+    return {
+        "file": basename,
+        "do": do,
+        "name": s["name"],
+        "start": np.round(ti.epoch2mjd(data[0, 0]), 6),
+        "stop": np.round(ti.epoch2mjd(data[-1, 0] + step), 6),
+        "points": len(data),
+        "rejected_bounds": int(np.sum(~res["mask1"])),
+        "rejected_double_counting": int(np.sum(~res["mask2"])),
+        "rejected_f0": int(np.sum(~res["mask3"])),
+        "rejected_median": int(np.sum(~res["mask4"])),
+        "valid": nvalid,
+        "ch_dev": np.sqrt(mean(res["ptp"] ** 2)),
+        "f0_dev": mean(res["f0_diff"]),
+        "mean_beat": mean(res["f_beat"]),
+        "mean_y": mean(res["y"]),
+        "time": round(elapsed, 6),
+    }
+
+
+def output_segments(out, do_in_setup, do_out_setup, start, stop):
+    """Split processed data of a DO in output segments.
+
+    Parameters
+    ----------
+    out : Results
+        Processed data.
+    do_in_setup : DataFrame
+        Setup for reading inputs of the DO.
+    do_out_setup : DataFrame
+        Setup for saving outputs of the DO.
+    start : float
+        Start date as MJD.
+    stop : float
+        Stop date as MJD.
+
+    Yields
+    ------
+    s : Series
+        Output setup of the segment.
+    this_setup : DataFrame
+        Input setups of the segment.
+    data : ndarray
+        Processed data (timetags, y, flag) of the segment.
+    """
+    do_out_setup = do_out_setup.fillna("")
+    do_in_setup = do_in_setup.fillna("")
+
+    # LOOP 4b: tracked changes
+    for s in do_out_setup.iloc:
+        if s["valid"] == False:  # noqa: E712 # the valid column store np.bool_ for whatever reason
+            continue
+
+        this_start = max(start, s["datetime"])
+        this_stop = min(stop, s["datetime_end"])
+
+        # mask info
+        infomask = (do_in_setup["datetime_end"] >= start) & (do_in_setup["datetime"] < stop)
+        # note that this_setup may have more lines for each do_out_setup
+        this_setup = do_in_setup[infomask]
+
+        # mask data
+        tstart = ti.mjd2epoch(this_start)
+        tstop = ti.mjd2epoch(this_stop)
+        data = out.between(tstart, tstop)
+
+        if len(data) > 0 and infomask.any():
+            yield s, this_setup, data.to_array()
+
+
+def stats_row(do, s, data, step=1.0):
+    """Return a row of the summary statistics table for an output segment."""
+    return {
+        "do": do,
+        "name": s["name"],
+        "start": np.round(ti.epoch2mjd(data[0, 0]), 6),
+        "stop": np.round(ti.epoch2mjd(data[-1, 0] + step), 6),
+        **summary(data[:, 0], data[:, 1], data[:, 2], step=step),
+    }
+
+
+def save_outputs(data_out, args, in_setups, out_setups, start, stop, save=update_link_to_dir):
+    """Save processed data for all DOs, one link for each output segment.
+
+    Parameters
+    ----------
+    data_out : list
+        For each DO, a list of processed Results.
+    args : Namespace
+        Parsed CLI arguments.
+    in_setups : list of DataFrame
+        Setups for reading inputs of each DO.
+    out_setups : list of DataFrame
+        Setups for saving outputs of each DO.
+    start : float
+        Start date as MJD.
+    stop : float
+        Stop date as MJD.
+    save : callable, optional
+        Function saving a link to a directory, by default update_link_to_dir (only writing changed files)
+
+    Returns
+    -------
+    list of dict
+        Summary statistics for each output segment (if args.stats).
+    """
+    stats_rows = []
+
+    # LOOP 4a: dos
+    do_bar2 = tqdm(args.do)
+    for doi, do in enumerate(do_bar2):
+        do_bar2.set_description("Saving DO: " + do)
+
+        if not data_out[doi]:
+            continue
+        out = concatenate(data_out[doi])
+
+        for s, this_setup, data in output_segments(out, in_setups[doi], out_setups[doi], start, stop):
+            if args.stats:
+                stats_rows += [stats_row(do, s, data, step=args.gate_time)]
+
+            link, message = output_link(data, do, s, this_setup, step=args.gate_time)
+            link.drop_invalid()
+
+            out_dir = os.path.join(args.dir, s["name"])
+            save_link(out_dir, link, args, message, data_span(data, args.gate_time), save=save)
+
+    if args.ratio:
+        stats_rows += save_ratio(data_out, args, in_setups, out_setups, start, stop, save=save)
+
+    return stats_rows
+
+
+def data_span(data, step=1.0):
+    """Return the (start, stop) MJD range of processed data."""
+    return tuple(ti.epoch2mjd(np.array([data[0, 0], data[-1, 0] + step])))
+
+
+def save_link(out_dir, link, args, message, span, save=update_link_to_dir):
+    """Save a link and its decimated versions (args.decimate) in subdirectories named as the bin size (e.g. 100s).
+    Also update the uptime intervals of the link (if args.uptime).
+
+    Parameters
+    ----------
+    out_dir : str
+        Output directory.
+    link : Link
+        Link to be saved.
+    args : Namespace
+        Parsed CLI arguments.
+    message : str
+        Message to be written in the header.
+    span : tuple
+        (start, stop) MJD range of the processed data of the link (including invalid data), where uptime is updated.
+    save : callable, optional
+        Function saving a link to a directory, by default update_link_to_dir
+    """
+    save(out_dir, link, time_format=args.time_format, message=message)
+
+    if args.uptime:
+        intervals = ti.epoch2mjd(valid_intervals(link.t, link.flag, step=link.step))
+        update_uptime(out_dir, link.name, intervals, span)
+
+    for base in args.decimate or []:
+        dec = rl.Link(data=decimate(link.data, base), oscA=link.oscA, oscB=link.oscB, step=base)
+        if len(dec.data) > 0:
+            dec.name = link.name
+            save(
+                os.path.join(out_dir, f"{base}s"),
+                dec,
+                extra_names=["count"],
+                time_format=args.time_format,
+                message=message + f"\n# Average of valid data in {base} s bins (count = number of averaged points)",
+            )
+
+
+def ratio_data(out_a, out_b):
+    """Time-align processed data of two DOs and return their frequency ratio.
+
+    Parameters
+    ----------
+    out_a : Results
+        Processed data of DO A.
+    out_b : Results
+        Processed data of DO B.
+
+    Returns
+    -------
+    Results
+        Data (timetags, delta, flag) at common timetags, where delta is the fractional deviation of the ratio B/A from the ratio of nominal frequencies
+        and flag is the minimum of the flags of A and B.
+    """
+    gates, ia, ib = np.intersect1d(out_a.gates, out_b.gates, assume_unique=True, return_indices=True)
+    ya = out_a.y[ia]
+    yb = out_b.y[ib]
+
+    delta = (ya - yb) / (1 + yb)
+    flag = np.minimum(out_a.flag[ia], out_b.flag[ib])
+
+    return Results(gates * out_a.step, delta, flag, step=out_a.step)
+
+
+def save_ratio(data_out, args, in_setups, out_setups, start, stop, save=update_link_to_dir):
+    """Save the frequency ratio of two DOs (args.ratio), one link for each output segment of the first DO.
+
+    Parameters
+    ----------
+    data_out : list
+        For each DO, a list of processed Results.
+    args : Namespace
+        Parsed CLI arguments.
+    in_setups : list of DataFrame
+        Setups for reading inputs of each DO.
+    out_setups : list of DataFrame
+        Setups for saving outputs of each DO.
+    start : float
+        Start date as MJD.
+    stop : float
+        Stop date as MJD.
+    save : callable, optional
+        Function saving a link to a directory, by default update_link_to_dir
+
+    Returns
+    -------
+    list of dict
+        Summary statistics for each output segment (if args.stats).
+    """
+    do_a, do_b = args.ratio
+    ia = args.do.index(do_a)
+    ib = args.do.index(do_b)
+
+    stats_rows = []
+    if not data_out[ia] or not data_out[ib]:
+        return stats_rows
+
+    out = ratio_data(concatenate(data_out[ia]), concatenate(data_out[ib]))
+    setup_b = in_setups[ib].fillna("")
+
+    for s, this_setup, data in output_segments(out, in_setups[ia], out_setups[ia], start, stop):
+        mjd = ti.epoch2mjd(data[[0, -1], 0])
+        # setups of B in the segment
+        infomask_b = (setup_b["datetime_end"] > mjd[0]) & (setup_b["datetime"] <= mjd[1])
+        infomask_b &= setup_b["valid"] == True
+        this_setup_b = setup_b[infomask_b]
+        if len(this_setup_b) == 0:
+            continue
+
+        if args.stats:
+            stats_rows += [stats_row(f"{do_b}/{do_a}", s, data, step=args.gate_time)]
+
+        link, message = ratio_link(data, do_a, do_b, s, this_setup, this_setup_b, step=args.gate_time)
+        link.drop_invalid()
+
+        out_dir = os.path.join(args.dir, s["name"])
+        save_link(out_dir, link, args, message, data_span(data, args.gate_time), save=save)
+
+    return stats_rows
+
+
+def publish_outputs(data_out, args, in_setups, writers):
+    """Publish the latest processed data of each DO to shared memory ring buffers.
+
+    Parameters
+    ----------
+    data_out : list
+        For each DO, a list of processed Results.
+    args : Namespace
+        Parsed CLI arguments.
+    in_setups : list of DataFrame
+        Setups for reading inputs of each DO.
+    writers : dict
+        RingWriter for each DO.
+    """
+    for doi, do in enumerate(args.do):
+        if not data_out[doi]:
+            continue
+        out = concatenate(data_out[doi])
+
+        # nominal frequency of the setup of the latest data
+        df = in_setups[doi]
+        last = ti.epoch2mjd(out.t[-1])
+        current = df[(df["datetime"] <= last) & (df["datetime_end"] > last)]
+        nominal = current["nominal"].iloc[-1].strip("'") if len(current) > 0 else None
+
+        writers[do].write(out.to_array(), nominal=nominal)
+
+
+# threshold in Hz on the deviation of f0 from its nominal value
+F0_THRESHOLD = 0.25
+
+
+def default_glitch_ext(gate_time=1.0):
+    """Return the number of points of a glitch extended by 1 s on each side (3 points for 1 s gate time)."""
+    return 2 * max(1, round(1 / gate_time)) + 1
+
+
+def segment_inputs(data, s):
+    """Return the quantities of a segment of comb data that do not depend on deglitching parameters.
+
+    Parameters
+    ----------
+    data : ndarray
+        Comb data (timetags and counter channels), as returned by genfromkk.
+    s : Series
+        DO and comb setup valid for the data.
+
+    Returns
+    -------
+    dict
+        red_data (beat note channels), los_data (beat notes after the local oscillators), f_beat (mean beat note),
+        f0_meas, f0_nominal, bounds, threshold (double counting) and y.
+    """
+    comb = s["comb"]
+    nominal = s["nominal"]
+    N = s["N"]  # limit between start/stop
+    f_rep = s["frep_" + comb]
+    f0 = s["f0_" + comb]
+    f_beat_sign = s["fbeat_sign"]
+    k_scale = s["kscale"]
+    f0_scale = s["f0_scale"]
+    f_offset = s["foffset"]
+
+    columns = df_extract(s, ["counter", "counter1", "counter2"])
+    columns = np.atleast_1d(columns).astype(int)
+    bounds = (
+        df_extract(s, ["min", "min1", "min2"]),
+        df_extract(s, ["max", "max1", "max2"]),
+    )
+    los = df_extract(s, ["flo", "flo1", "flo2"])
+    if len(los) > 1:
+        threshold = s["threshold"]
+    else:
+        # threshold not needed, this is arbitrary as long as >0 (the output of np.ptp on a len 1 axis)
+        threshold = 1
+
+    red_data = data[:, columns]
+    f0_meas = data[:, s["counter_f0_" + comb]]
+    los = np.resize(np.asarray(los, dtype=float), columns.shape[0])
+    los_data = np.abs(red_data + los)
+    f_beat = np.mean(los_data, axis=-1)
+
+    # beat2y(f_beat,  nominal,  N, f_rep, f0, f_beat_sign=1, k_scale=1, f0_scale=1, f_offset=0.):
+    y = beat2y(f_beat, nominal, N, f_rep, f0, f_beat_sign, k_scale, f0_scale, f_offset)
+
+    return {
+        "red_data": red_data,
+        "los_data": los_data,
+        "f_beat": f_beat,
+        "f0_meas": f0_meas,
+        "f0_nominal": f0,
+        "bounds": bounds,
+        "threshold": threshold,
+        "y": y,
+    }
+
+
+def process_segment(data, s, flag=1, median_filter=False, median_window=60.0, median_threshold=250.0, gate_time=1.0):
+    """Deglitch comb data and calculate the fractional frequency of a DO.
+
+    Parameters
+    ----------
+    data : ndarray
+        Comb data (timetags and counter channels), as returned by genfromkk.
+    s : Series
+        DO and comb setup valid for the data.
+    flag : int, optional
+        Flag assigned to valid data, by default 1
+    median_filter : bool, optional
+        If True, also apply a median filter, by default False
+    median_window : float, optional
+        Length of the median filter in s, by default 60.
+    median_threshold : float, optional
+        Median filter threshold in Hz, by default 250.
+    gate_time : float, optional
+        Gate time of the counter in s, by default 1.
+
+    Returns
+    -------
+    dict
+        f_beat, y, flag, the masks mask1 (bounds), mask2 (double counting), mask3 (f0), mask4 (median filter),
+        ptp (peak-to-peak of double counting) and f0_diff (deviation of f0 from nominal).
+    """
+    q = segment_inputs(data, s)
+    f_beat = q["f_beat"]
+
+    mask1 = deglitch_from_bounds(q["red_data"], q["bounds"])
+
+    glitch_ext = default_glitch_ext(gate_time)
+
+    mask2 = deglitch_from_double_counting(q["los_data"], q["threshold"], glitch_ext=glitch_ext)
+
+    mask3 = deglitch_from_f0(q["f0_meas"], f0_nominal=q["f0_nominal"], threshold=F0_THRESHOLD)
+
+    tmask = mask1 & mask2 & mask3
+    if median_filter:
+        mask4 = deglitch_from_median_filter(
+            f_beat,
+            premask=tmask,
+            median_window=max(1, round(median_window / gate_time)),
+            median_threshold=median_threshold,
+            glitch_ext=glitch_ext,
+        )
+        tmask = mask1 & mask2 & mask3 & mask4
+    else:
+        mask4 = np.ones_like(mask1).astype(bool)
+
+    return {
+        "f_beat": f_beat,
+        "y": q["y"],
+        "flag": tmask * flag,
+        "mask1": mask1,
+        "mask2": mask2,
+        "mask3": mask3,
+        "mask4": mask4,
+        "ptp": np.ptp(q["los_data"], axis=-1),
+        "f0_diff": q["f0_meas"] - np.abs(float(q["f0_nominal"])),
+    }
+
+
+def output_link(data, do, s, this_setup, step=1.0):
+    """Return the ROCIT link and the header message of an output segment.
+
+    Parameters
+    ----------
+    data : ndarray
+        Processed data (timetags, y, flag).
+    do : str
+        DO name.
+    s : Series
+        Output setup of the segment.
+    this_setup : DataFrame
+        Input setups of the segment (may have more rows than the output).
+    step : float, optional
+        Time step of the data in s, by default 1.
+
+    Returns
+    -------
+    link : Link
+        Link HM/DO with the processed data.
+    message : str
+        Description of the segment.
+    """
+    nominal = s["nominal"].strip("'")
+
+    # TODO: descriptions are no longer used by rl.save_link_to_dir
+    # I could use the "message" keyword instead
+    HM = rl.Oscillator("INRIM_HM", "1")
+    DO = rl.Oscillator("INRIM_" + do, nominal)
+
+    dodesc = (
+        "Designed oscillator = "
+        + format_possibly_changing_info(this_setup, "physical")
+        + " measured on "
+        + format_possibly_changing_info(this_setup, "comb")
+    )
+    nom = "# Nominal frequency = " + nominal
+    hm_desc = "# HM = " + format_possibly_changing_info(this_setup, "maser")
+    message = "\n".join([dodesc, nom, hm_desc])
+
+    link = rl.Link(data=data, oscA=DO, oscB=HM, step=step)
+    return link, message
+
+
+def ratio_link(data, do_a, do_b, s, this_setup_a, this_setup_b, step=1.0):
+    """Return the ROCIT link and the header message of the ratio of two DOs in an output segment.
+
+    Parameters
+    ----------
+    data : ndarray
+        Ratio data (timetags, delta, flag).
+    do_a : str
+        Name of DO A.
+    do_b : str
+        Name of DO B.
+    s : Series
+        Output setup of DO A in the segment.
+    this_setup_a : DataFrame
+        Input setups of DO A in the segment.
+    this_setup_b : DataFrame
+        Input setups of DO B in the segment.
+    step : float, optional
+        Time step of the data in s, by default 1.
+
+    Returns
+    -------
+    link : Link
+        Link DO B/DO A with the ratio data.
+    message : str
+        Description of the segment.
+    """
+    nominal_a = s["nominal"].strip("'")
+    nominal_b = this_setup_b["nominal"].iloc[-1].strip("'")
+    if this_setup_b["nominal"].nunique() > 1:
+        tqdm.write(f"Nominal frequency of {do_b} changes in segment {s['name']}, using {nominal_b}.")
+        log_event("nominal_changed", do=do_b, segment=s["name"], nominal=nominal_b)
+
+    A = rl.Oscillator("INRIM_" + do_a, nominal_a)
+    B = rl.Oscillator("INRIM_" + do_b, nominal_b)
+
+    message = "\n".join(
+        [
+            f"Ratio {do_b}/{do_a} measured on " + format_possibly_changing_info(this_setup_a, "comb"),
+            f"# {do_a} = " + format_possibly_changing_info(this_setup_a, "physical"),
+            f"# {do_b} = " + format_possibly_changing_info(this_setup_b, "physical"),
+            f"# Nominal ratio = {nominal_b}/{nominal_a}",
+        ]
+    )
+
+    link = rl.Link(data=data, oscA=A, oscB=B, step=step)
+    return link, message
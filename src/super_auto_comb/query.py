@@ -0,0 +1,294 @@
+"""
+Time-range queries of processed outputs.
+A sidecar index in each link directory, updated as outputs are saved, records, for each daily file, its time span, number of rows
+and the byte offsets of the first row after regular time marks.
+Queries only read the byte ranges of the files that overlap the requested range.
+
+"""
+
+import glob
+import io
+import json
+import os
+import re
+
+import numpy as np
+
+from super_auto_comb.utils import MJD_EPOCH
+
+INDEX_FILE = ".super-auto-index.json"
+INDEX_MARK = 3600.0
+
+
+def time_format(field):
+    """Return the time format ('mjd', 'unix' or 'iso') of a timetag of a ROCIT file."""
+    if "T" in field:
+        return "iso"
+    # unix timetags are much larger than MJD
+    return "unix" if float(field) > 1e6 else "mjd"
+
+
+def _to_mjd(field, fmt):
+    if fmt == "iso":
+        import tintervals as ti
+
+        return float(ti.iso2mjd(field))
+    x = float(field)
+    return x / 86400.0 + MJD_EPOCH if fmt == "unix" else x
+
+
+def index_file(file, mark=INDEX_MARK, entry=None):
+    """Index a ROCIT daily file.
+
+    Parameters
+    ----------
+    file : str
+        ROCIT file.
+    mark : float, optional
+        Interval in s between indexed time marks, by default 3600.
+    entry : dict, optional
+        Previous entry of the file, by default None.
+        If the file was only appended since (it is not shorter and the mark interval is the same), only new lines are indexed.
+
+    Returns
+    -------
+    dict
+        Size and modification time of the file, mark interval, time format, time span (MJD of first and last row), number of rows,
+        and marks as (MJD, byte offset) of the first row after each time mark.
+    """
+    stat = os.stat(file)
+
+    if entry is not None and entry["mark"] == mark and entry["size"] <= stat.st_size:
+        entry = dict(entry, marks=list(entry["marks"]))
+        offset = entry["size"]
+    else:
+        entry = {"mark": mark, "format": None, "rows": 0, "start": None, "stop": None, "marks": []}
+        offset = 0
+    entry["size"] = stat.st_size
+    entry["mtime"] = stat.st_mtime
+
+    with open(file, "rb") as f:
+        f.seek(offset)
+        content = f.read(stat.st_size - offset)
+
+    last_mark = np.floor(entry["stop"] * 86400.0 / mark) if entry["stop"] is not None else None
+    for line in content.splitlines(keepends=True):
+        if line.strip() and not line.startswith(b"#"):
+            field = line.split(None, 1)[0].decode()
+            if entry["format"] is None:
+                entry["format"] = time_format(field)
+            t = _to_mjd(field, entry["format"])
+            this_mark = np.floor(t * 86400.0 / mark)
+            if this_mark != last_mark:
+                entry["marks"] += [[t, offset]]
+                last_mark = this_mark
+            if entry["start"] is None:
+                entry["start"] = t
+            entry["stop"] = t
+            entry["rows"] += 1
+        offset += len(line)
+
+    return entry
+
+
+def _load_index(index_path):
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_index(index_path, index):
+    temp = index_path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(index, f)
+    os.replace(temp, index_path)
+
+
+def update_index(link_dir, mark=INDEX_MARK):
+    """Update the sidecar index of a link directory, indexing only new or changed files (by size and modification time).
+
+    Parameters
+    ----------
+    link_dir : str
+        Link directory (with ROCIT daily files).
+    mark : float, optional
+        Interval in s between indexed time marks, by default 3600.
+
+    Returns
+    -------
+    dict
+        Index as {filename: entry} (see index_file).
+    """
+    index_path = os.path.join(link_dir, INDEX_FILE)
+    index = _load_index(index_path)
+
+    files = sorted(os.path.basename(x) for x in glob.glob(os.path.join(link_dir, "*.dat")))
+    changed = set(index) != set(files)
+
+    new = {}
+    for file in files:
+        path = os.path.join(link_dir, file)
+        stat = os.stat(path)
+        entry = index.get(file)
+        if entry is None or (entry["size"], entry["mtime"], entry["mark"]) != (stat.st_size, stat.st_mtime, mark):
+            entry = index_file(path, mark=mark)
+            changed = True
+        new[file] = entry
+
+    if changed:
+        _save_index(index_path, new)
+
+    return new
+
+
+def index_files(link_dir, status, mark=INDEX_MARK):
+    """Update the entries of the sidecar index of a link directory for files just written, as they are saved.
+
+    Parameters
+    ----------
+    link_dir : str
+        Link directory (with ROCIT daily files).
+    status : dict
+        Status of the written files as {filename: status}, with status 'created', 'replaced', 'appended' or 'unchanged'
+        (see save_files.update_file). Appended files are only indexed from their previous size.
+    mark : float, optional
+        Interval in s between indexed time marks, by default 3600.
+    """
+    written = {k: v for k, v in status.items() if v != "unchanged"}
+    if not written:
+        return
+
+    index_path = os.path.join(link_dir, INDEX_FILE)
+    index = _load_index(index_path)
+    for file, st in written.items():
+        previous = index.get(file) if st == "appended" else None
+        index[file] = index_file(os.path.join(link_dir, file), mark=mark, entry=previous)
+    _save_index(index_path, index)
+
+
+def link_name(do):
+    """Return the name of the link of a DO output (e.g. INRIM_HM-INRIM_LoYb), or do itself if it is already a link name
+    (e.g. INRIM_B-INRIM_A for the ratio of two DOs)."""
+    return do if "-" in do else "INRIM_HM-INRIM_" + do
+
+
+def link_dirs(dir, do, base=None):
+    """Return the link directories of a DO in all output segments.
+
+    Parameters
+    ----------
+    dir : str
+        Output directory.
+    do : str
+        DO name, or link name (see link_name).
+    base : int, optional
+        Bin size in s of decimated outputs, by default None (not decimated outputs)
+
+    Returns
+    -------
+    list of str
+        Link directories.
+    """
+    found = glob.glob(os.path.join(dir, "**", link_name(do)), recursive=True)
+
+    res = []
+    for x in found:
+        parent = os.path.basename(os.path.dirname(os.path.normpath(x)))
+        decimated = re.fullmatch(r"\d+s", parent)
+        if (base is None and not decimated) or (base is not None and parent == f"{base}s"):
+            res += [x]
+    return sorted(res)
+
+
+def read_range(file, entry, mjd_start, mjd_stop):
+    """Read the rows of an indexed file in a time range, only reading the byte range between the enclosing marks.
+
+    Parameters
+    ----------
+    file : str
+        ROCIT file.
+    entry : dict
+        Index entry of the file.
+    mjd_start : float
+        Start of the range as MJD.
+    mjd_stop : float
+        Stop of the range as MJD.
+
+    Returns
+    -------
+    ndarray
+        Data (t as MJD, y, flag and extra columns) in the range.
+    """
+    marks = np.array(entry["marks"]).reshape(-1, 2)
+    times = marks[:, 0]
+
+    i = max(np.searchsorted(times, mjd_start, side="right") - 1, 0)
+    j = np.searchsorted(times, mjd_stop, side="left")
+    begin = int(marks[i, 1])
+    end = int(marks[j, 1]) if j < len(marks) else entry["size"]
+
+    with open(file, "rb") as f:
+        f.seek(begin)
+        chunk = f.read(end - begin)
+
+    fmt = entry["format"]
+    converters = {0: lambda x: _to_mjd(x, fmt)} if fmt == "iso" else None
+    data = np.loadtxt(io.BytesIO(chunk), comments="#", converters=converters, ndmin=2)
+    if fmt == "unix":
+        data[:, 0] = data[:, 0] / 86400.0 + MJD_EPOCH
+    data = data[(data[:, 0] >= mjd_start) & (data[:, 0] < mjd_stop)]
+    return data
+
+
+def query(do, mjd_start, mjd_stop, flagged_only=True, dir="./Outputs", base=None):
+    """Return processed data of a DO in a time range.
+
+    Parameters
+    ----------
+    do : str
+        DO name, or link name (e.g. INRIM_B-INRIM_A for the ratio of two DOs saved with --ratio).
+    mjd_start : float
+        Start of the range as MJD.
+    mjd_stop : float
+        Stop of the range as MJD.
+    flagged_only : bool, optional
+        If True, only return data with flag > 0, by default True
+    dir : str, optional
+        Output directory, by default './Outputs'
+    base : int, optional
+        Bin size in s of decimated outputs to be read, by default None (not decimated outputs)
+
+    Returns
+    -------
+    t : ndarray
+        Timetags as MJD.
+    y : ndarray
+        Fractional frequency data.
+    flag : ndarray
+        Data flags.
+
+    Examples
+    --------
+    >>> t, y, flag = query("LoYb", 59659.0, 59659.5, dir="./Outputs")
+    >>> t, y, flag = query("INRIM_LoYb-INRIM_Sr", 59659.0, 59659.5, dir="./Outputs")
+    """
+    chunks = []
+    for link_dir in link_dirs(dir, do, base=base):
+        index = update_index(link_dir)
+        for file, entry in index.items():
+            if entry["rows"] == 0 or entry["stop"] < mjd_start or entry["start"] >= mjd_stop:
+                continue
+            chunks += [read_range(os.path.join(link_dir, file), entry, mjd_start, mjd_stop)]
+
+    chunks = [c for c in chunks if len(c) > 0]
+    if not chunks:
+        return np.empty(0), np.empty(0), np.empty(0)
+
+    data = np.concatenate([c[:, :3] for c in chunks])
+    data = data[np.argsort(data[:, 0], kind="stable")]
+    if flagged_only:
+        data = data[data[:, 2] > 0]
+
+    return data[:, 0], data[:, 1], data[:, 2]
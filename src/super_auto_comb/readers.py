@@ -0,0 +1,135 @@
+"""
+Registry of comb data readers.
+Each reader matches comb files by a filename pattern and returns the same regularized data layout
+(timetags as seconds from the epoch in the first column, then a column for each channel).
+Readers of K+K text files and of binary counter logs (see load_files.loadbin) are registered by default.
+
+"""
+
+import fnmatch
+import os
+
+import numpy as np
+
+from super_auto_comb.load_files import BINLOG_HEADER, genfrombin, genfromkk, loadbin, loadkk, read_file
+
+READERS = {}
+
+
+def register_reader(name, pattern, load, raw, rows, read=read_file, local_time=False):
+    """Register a comb data reader.
+
+    Parameters
+    ----------
+    name : str
+        Name of the reader (as for --reader).
+    pattern : str
+        Filename pattern of a day of data, with strftime codes for the date (e.g. '%y%m%d_?_Frequ.txt').
+    load : callable
+        Function load(fname, max_columns=12, gate_time=1.0, usecols=None, **kwargs) returning regularized data
+        (with NaN for channels not in usecols).
+        Readers with local_time also get fix_summer_time and tz (timezone of the timetags).
+    raw : callable
+        Function raw(fname, max_columns=12, usecols=None) returning data without regularized timetags (used to join counters).
+        Readers with local_time also get tz.
+    rows : callable
+        Function rows(fname, max_columns=12) returning the (estimated) number of rows of a file, without reading its data.
+    read : callable, optional
+        Function reading a file before loading it (e.g. in memory while prefetching), by default load_files.read_file
+    local_time : bool, optional
+        True if the timetags of the files are in local time (and may need a fix of summer time), by default False
+    """
+    READERS[name] = {
+        "pattern": pattern,
+        "load": load,
+        "raw": raw,
+        "rows": rows,
+        "read": read,
+        "local_time": local_time,
+    }
+
+
+def reader_patterns(name=None):
+    """Return the filename patterns of a reader, or of all readers if name is None."""
+    if name is not None:
+        return [READERS[name]["pattern"]]
+    return [r["pattern"] for r in READERS.values()]
+
+
+def reader_for(fname, name=None):
+    """Return the reader of a comb file.
+
+    Parameters
+    ----------
+    fname : file or str
+        File or filename.
+    name : str, optional
+        Name of the reader to be used, by default None (selected by the filename pattern)
+
+    Returns
+    -------
+    dict
+        The registered reader.
+    """
+    if name is not None:
+        return READERS[name]
+
+    base = os.path.basename(str(getattr(fname, "name", fname)))
+    for reader in READERS.values():
+        # any date matches
+        if fnmatch.fnmatch(base, reader["pattern"].replace("%y%m%d", "[0-9]" * 6)):
+            return reader
+
+    raise ValueError(f"{base}: no reader matches this file.")
+
+
+def load_comb(fname, reader=None, fix_summer_time=False, max_columns=12, gate_time=1.0, tz=None, usecols=None):
+    """Load a comb file with its reader.
+
+    Parameters
+    ----------
+    fname : file or str
+        File or filename to be read.
+    reader : str, optional
+        Name of the reader, by default None (selected by the filename pattern)
+    fix_summer_time : bool, optional
+        If true, it will try to fix discontinuities due to summer time for readers of local timetags, by default False
+    max_columns : int, optional
+        Number of channels returned, by default 12
+    gate_time : float, optional
+        Gate time of the counter in s, by default 1.
+    tz : str, optional
+        Timezone of the timetags for readers of local timetags (e.g. "Europe/Rome"), by default None (system local timezone)
+    usecols : list of int, optional
+        Channels to be parsed, by default None (all channels)
+
+    Returns
+    -------
+    out : ndarray
+        Data read, with regularized timetags. Channels not in usecols are NaN.
+    """
+    r = reader_for(fname, reader)
+    kwargs = {"fix_summer_time": fix_summer_time, "tz": tz} if r["local_time"] else {}
+    return r["load"](fname, max_columns=max_columns, gate_time=gate_time, usecols=usecols, **kwargs)
+
+
+def _kk_rows(fname, max_columns=12):
+    from super_auto_comb.planner import estimate_rows
+
+    return estimate_rows(fname, max_columns)
+
+
+def _bin_rows(fname, max_columns=12):
+    with open(fname, "rb") as f:
+        header = np.frombuffer(f.read(BINLOG_HEADER.itemsize), dtype=BINLOG_HEADER)[0]
+    record = 8 * (1 + int(header["channels"]))
+    return (os.path.getsize(fname) - BINLOG_HEADER.itemsize) // record
+
+
+def _path(fname):
+    # binary logs are memory-mapped when loaded, so they are not read in advance
+    return fname
+
+
+register_reader("kk", "%y%m%d_?_Frequ.txt", genfromkk, loadkk, _kk_rows, local_time=True)
+register_reader("bin", "%y%m%d_?_Frequ.bin", genfrombin, loadbin, _bin_rows, read=_path)
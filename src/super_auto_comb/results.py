@@ -0,0 +1,199 @@
+"""
+Compact in-memory representation of processed data.
+Timetags are stored as runs of contiguous gates (a start time and the stride for regular data), flags as uint8 and deglitching masks as packed bits,
+so that processed data of long runs takes less than half of the memory of (timetags, y, flag) float arrays.
+
+"""
+
+import numpy as np
+
+
+class Results:
+    """Processed data (timetags, y, flag) of a DO, with optional deglitching masks.
+
+    Parameters
+    ----------
+    t : ndarray
+        Timetags in s, at integer multiples of step.
+    y : ndarray
+        Fractional frequency data.
+    flag : ndarray
+        Data flags.
+    step : float, optional
+        Time step (gate time) in s, by default 1.
+    masks : ndarray, optional
+        Boolean deglitching masks of shape (m, len(t)), by default None
+
+    Notes
+    -----
+    Timetags are stored as runs of contiguous gates (first gate and position of each run),
+    so that regular data only store a start time and the stride.
+    Slicing returns Results sharing y, flag and (for slices starting at multiples of 8) masks with the original ones.
+    """
+
+    __slots__ = ("flag", "n_masks", "packed_masks", "runs", "step", "y")
+
+    def __init__(self, t, y, flag, step=1.0, masks=None):
+        self.step = step
+        self.y = np.asarray(y, dtype=float)
+        self.flag = np.asarray(flag).astype(np.uint8)
+        self.runs = gate_runs(np.round(np.asarray(t) / step).astype(np.int64))
+
+        if masks is None:
+            self.packed_masks = None
+            self.n_masks = 0
+        else:
+            masks = np.atleast_2d(np.asarray(masks, dtype=bool))
+            self.packed_masks = np.packbits(masks, axis=-1)
+            self.n_masks = len(masks)
+
+    @classmethod
+    def from_parts(cls, runs, step, y, flag, packed_masks=None, n_masks=0):
+        """Return Results from their stored parts (e.g. as saved in figure records), without copying them.
+
+        Parameters
+        ----------
+        runs : ndarray
+            Runs of contiguous gates as rows (first gate, position of the first gate).
+        step : float
+            Gate time in s.
+        y : ndarray
+            Fractional frequency.
+        flag : ndarray
+            Flags (uint8).
+        packed_masks : ndarray, optional
+            Bit-packed masks (see numpy.packbits), by default None (no masks)
+        n_masks : int, optional
+            Number of masks, by default 0
+
+        Returns
+        -------
+        Results
+        """
+        res = cls.__new__(cls)
+        res.runs = runs
+        res.step = step
+        res.y = y
+        res.flag = flag
+        res.packed_masks = packed_masks
+        res.n_masks = n_masks
+        return res
+
+    def __len__(self):
+        return len(self.y)
+
+    @property
+    def regular(self):
+        """True if timetags are contiguous gates."""
+        return len(self.runs) <= 1
+
+    @property
+    def gates(self):
+        """Timetags as integer numbers of gates from the epoch."""
+        lengths = np.diff(np.r_[self.runs[:, 1], len(self)])
+        return np.repeat(self.runs[:, 0] - self.runs[:, 1], lengths) + np.arange(len(self), dtype=np.int64)
+
+    @property
+    def t(self):
+        """Timetags in s."""
+        return self.gates * self.step
+
+    @property
+    def masks(self):
+        """Boolean deglitching masks of shape (m, len), or None."""
+        if self.packed_masks is None:
+            return None
+        return np.unpackbits(self.packed_masks, axis=-1, count=len(self)).astype(bool)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("Results can only be sliced.")
+        i, j, k = key.indices(len(self))
+        if k != 1:
+            raise ValueError("Results can only be sliced with step 1.")
+        j = max(i, j)
+
+        if self.packed_masks is None or i % 8 == 0:
+            packed = None if self.packed_masks is None else self.packed_masks[:, i // 8 : (j + 7) // 8]
+        else:
+            # bits not aligned to bytes have to be packed again
+            packed = np.packbits(self.masks[:, i:j], axis=-1)
+
+        # runs overlapping the slice, with the first one starting at the slice
+        pos = self.runs[:, 1]
+        r0 = max(np.searchsorted(pos, i, side="right") - 1, 0)
+        r1 = np.searchsorted(pos, j, side="left")
+        runs = self.runs[r0:r1].copy() if j > i else np.empty((0, 2), dtype=np.int64)
+        if len(runs) > 0:
+            runs[0, 0] += i - runs[0, 1]
+            runs[0, 1] = i
+            runs[:, 1] -= i
+
+        return self.from_parts(runs, self.step, self.y[i:j], self.flag[i:j], packed, self.n_masks)
+
+    def between(self, tstart, tstop):
+        """Return the data with tstart <= t < tstop (a slice if timetags are sorted)."""
+        gates = self.gates
+        lo, hi = np.ceil(tstart / self.step - 1e-9), np.ceil(tstop / self.step - 1e-9)
+        # sorted if each run starts after the end of the previous one
+        lengths = np.diff(np.r_[self.runs[:, 1], len(self)])
+        if np.all(self.runs[1:, 0] >= self.runs[:-1, 0] + lengths[:-1]):
+            return self[np.searchsorted(gates, lo) : np.searchsorted(gates, hi)]
+
+        mask = (gates >= lo) & (gates < hi)
+        masks = None if self.packed_masks is None else self.masks[:, mask]
+        return Results(gates[mask] * self.step, self.y[mask], self.flag[mask], step=self.step, masks=masks)
+
+    @property
+    def nbytes(self):
+        """Memory used by the data, in bytes."""
+        masks = 0 if self.packed_masks is None else self.packed_masks.nbytes
+        return self.runs.nbytes + self.y.nbytes + self.flag.nbytes + masks
+
+    def to_array(self):
+        """Return the data as a float array with columns (timetags, y, flag)."""
+        return np.column_stack((self.t, self.y, self.flag))
+
+
+def gate_runs(gates):
+    """Return the runs of contiguous gates as rows (first gate, position of the first gate)."""
+    if len(gates) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    pos = np.r_[0, np.flatnonzero(np.diff(gates) != 1) + 1]
+    return np.column_stack((gates[pos], pos)).astype(np.int64)
+
+
+def concatenate(results):
+    """Concatenate Results with the same step, keeping the compact representation when possible.
+
+    Parameters
+    ----------
+    results : list of Results
+        Results to be concatenated.
+
+    Returns
+    -------
+    Results
+        Concatenated results. Masks are dropped unless all results have the same number of masks.
+    """
+    if len(results) == 1:
+        return results[0]
+
+    step = results[0].step
+    y = np.concatenate([r.y for r in results])
+    flag = np.concatenate([r.flag for r in results])
+
+    n_masks = {r.n_masks for r in results}
+    masks = None
+    if len(n_masks) == 1 and n_masks != {0}:
+        masks = np.concatenate([r.masks for r in results], axis=-1)
+
+    # runs of each result shifted by its position, joining runs that continue across results
+    offsets = np.cumsum([0] + [len(r) for r in results[:-1]])
+    runs = np.concatenate([r.runs + [0, o] for r, o in zip(results, offsets)])
+    if len(runs) > 1:
+        keep = np.r_[True, runs[1:, 0] - runs[:-1, 0] != runs[1:, 1] - runs[:-1, 1]]
+        runs = runs[keep]
+
+    packed = None if masks is None else np.packbits(masks, axis=-1)
+    return Results.from_parts(runs, step, y, flag, packed, len(masks) if masks is not None else 0)
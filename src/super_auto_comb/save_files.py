@@ -0,0 +1,351 @@
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+from super_auto_comb.query import index_files
+
+
+def append_table(file, rows):
+    """Append rows to a tab-separated table, writing the header if the file does not exist.
+
+    Parameters
+    ----------
+    file : str
+        Output file.
+    rows : list of dict
+        Rows to be appended, as dictionaries of column name -> value.
+    """
+    if not rows:
+        return
+
+    import pandas as pd
+
+    df = pd.DataFrame(rows)
+    df.to_csv(file, sep="\t", mode="a", header=not os.path.exists(file), index=False)
+
+
+def append_file(src, dst):
+    """Append the content of a file to another."""
+    with open(src, "rb") as f, open(dst, "ab") as g:
+        shutil.copyfileobj(f, g)
+
+
+def append_table_file(src, dst):
+    """Append the content of a table file to another, skipping the header line if it is repeated."""
+    with open(src) as f:
+        lines = f.readlines()
+
+    if os.path.exists(dst):
+        with open(dst) as f:
+            header = f.readline()
+        if lines and lines[0] == header:
+            lines = lines[1:]
+
+    with open(dst, "a") as f:
+        f.writelines(lines)
+
+
+# The following functions write links in the same format of tintervals.rocitlinks.save_link_to_dir,
+# but allow to update existing daily files instead of rewriting them.
+
+# header lines of ROCIT files that change at each run
+VOLATILE_HEADERS = ("# File generated on", "# With the script")
+
+
+def _epoch2iso_ms(t):
+    """Convert seconds from the epoch to ISO format with milliseconds (e.g. 2022-03-21T00:00:00.100Z)."""
+    return datetime.fromtimestamp(t, timezone.utc).isoformat(timespec="milliseconds")[:-6] + "Z"
+
+
+def _time_formatter(time_format, step=1.0):
+    """Return the timetag converter and format string used for a ROCIT time format.
+    For steps shorter than 1 s, timetags are written with enough digits to resolve the step.
+    """
+    import tintervals as ti
+
+    # additional digits required to resolve steps shorter than 1 s
+    digits = max(0, int(np.ceil(-np.log10(step))))
+
+    if time_format == "iso":
+        return (_epoch2iso_ms if digits else ti.epoch2iso), "{}"
+    elif time_format == "mjd":
+        return ti.epoch2mjd, f"{{:.{6 + digits}f}}"
+    elif time_format == "unix":
+        return (lambda x: x), f"{{:.{digits}f}}" if digits else "{}"
+    else:
+        raise ValueError("Unrecognized time_format. Valid formats are 'iso', 'mjd' and 'unix'.")
+
+
+def link_days(link):
+    """Return the filenames and masks of the daily files of a link.
+
+    Parameters
+    ----------
+    link : Link
+        Input link.
+
+    Returns
+    -------
+    list of tuples
+        (filename, mask) for each day with data.
+    """
+    import tintervals as ti
+
+    mjd = ti.epoch2mjd(link.t)
+    days = []
+    for day in np.unique(np.floor(mjd)):
+        date = ti.iso_from_mjd(day)[:10]
+        mask = (mjd >= day) & (mjd < day + 1)
+        days += [(date + "_" + link.name + ".dat", mask)]
+
+    return days
+
+
+def format_link(link, mask=None, extra_names=None, message="", time_format="mjd", yfmt="{:.10e}"):
+    """Format link data as in ROCIT daily files.
+
+    Parameters
+    ----------
+    link : Link
+        Link to be formatted.
+    mask : ndarray, optional
+        Mask of the data to be formatted, by default all data.
+    extra_names : list, optional
+        Names of extra data columns (if more than 3), by default None (no extra columns)
+    message : str, optional
+        Message to be written in the header, by default ''
+    time_format : ['mjd', 'iso', 'unix'], optional
+        Output time format, by default 'mjd'
+    yfmt : str, optional
+        Format of the link delta, by default '{:.10e}'
+
+    Returns
+    -------
+    header : str
+        File header.
+    body : str
+        Formatted data lines.
+    """
+    import tintervals.rocitlinks as rl
+
+    time_converter, tfmt = _time_formatter(time_format, link.step)
+    ffmt = "{:.0f}" if link.step <= 1 else "{:.6f}"
+
+    data = link.data if mask is None else link.data[mask]
+
+    now = datetime.now().astimezone().replace(microsecond=0).isoformat()
+    header = rl.HEADER_STD.format(linkname=link.name, now=now, command=" ".join(sys.argv))
+    if message:
+        header += rl.HEADER_MESSAGE.format(message)
+
+    names = ["t", "ΔA→B", "flag"] + list(extra_names or [])
+    fmtlst = [tfmt, yfmt, ffmt] + ["{}"] * (data.shape[1] - 3)
+    fmt = "\t".join(fmtlst) + "\n"
+
+    if len(data) > 0:
+        col_len = [len(tfmt.format(time_converter(data[0][0])))] + [
+            len(f.format(d)) for f, d in zip(fmtlst[1:], data[0, 1:])
+        ]
+        col_tit = [x.ljust(y) for x, y in zip(names, col_len)]
+        header += "# \n# " + "\t".join(col_tit) + "\n"
+
+    body = "".join(fmt.format(time_converter(d[0]), *d[1:]) for d in data)
+
+    return header, body
+
+
+def save_link_metadata(dir, link):
+    """Save the yaml metadata of a link in its directory, leaving the file untouched if unchanged.
+
+    Parameters
+    ----------
+    dir : str
+        Output directory.
+    link : Link
+        Input link.
+
+    Returns
+    -------
+    bool
+        True if the metadata file was written.
+    """
+    import tintervals.rocitlinks as rl
+
+    sub = os.path.join(dir, link.name)
+    metafile = os.path.join(sub, link.name + ".yml")
+
+    # tintervals writes the metadata also for a link without data
+    empty = rl.Link(data=np.empty((0, 3)), r0=link.r0, oscA=link.oscA, oscB=link.oscB, sB=link.sB, step=link.step)
+    empty.name = link.name
+    with tempfile.TemporaryDirectory() as temp:
+        rl.save_link_to_dir(temp, empty)
+        with open(os.path.join(temp, link.name, link.name + ".yml"), "rb") as f:
+            new = f.read()
+
+    if os.path.exists(metafile):
+        with open(metafile, "rb") as f:
+            if f.read() == new:
+                return False
+    elif not os.path.exists(sub):
+        os.makedirs(sub)
+
+    with open(metafile, "wb") as f:
+        f.write(new)
+    return True
+
+
+def append_link_to_dir(dir, link, extra_names=None, message="", time_format="mjd", yfmt="{:.10e}"):
+    """Append link data to the daily files in a directory, creating them if needed, and update their entries in the query index.
+
+    Parameters
+    ----------
+    dir : str
+        Output directory.
+    link : Link
+        Link to be saved (data should be later than data already saved).
+    extra_names : list, optional
+        Names of extra data columns (if more than 3), by default None (no extra columns)
+    message : str, optional
+        Message to be written in the header of new files, by default ''
+    time_format : ['mjd', 'iso', 'unix'], optional
+        Output time format, by default 'mjd'
+    yfmt : str, optional
+        Format of the link delta, by default '{:.10e}'
+    """
+    save_link_metadata(dir, link)
+    sub = os.path.join(dir, link.name)
+
+    status = {}
+    for filename, mask in link_days(link):
+        header, body = format_link(
+            link, mask, extra_names=extra_names, message=message, time_format=time_format, yfmt=yfmt
+        )
+        file = os.path.join(sub, filename)
+        with open(file, "a", encoding="UTF-8") as f:
+            if f.tell() == 0:
+                status[filename] = "created"
+                f.write(header)
+            else:
+                status[filename] = "appended"
+            f.write(body)
+
+    index_files(sub, status)
+
+
+def _stable(text):
+    """Return the content of an output file without the header lines that change at each run."""
+    return "".join(line for line in text.splitlines(keepends=True) if not line.startswith(VOLATILE_HEADERS))
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("UTF-8")).hexdigest()
+
+
+def _write_atomic(file, text):
+    temp = file + ".tmp"
+    with open(temp, "w", encoding="UTF-8") as f:
+        f.write(text)
+    os.replace(temp, file)
+
+
+def update_file(file, text):
+    """Update an output file only if its content changed, appending new lines if possible.
+
+    Parameters
+    ----------
+    file : str
+        Output file.
+    text : str
+        New content of the file.
+
+    Returns
+    -------
+    str
+        'created', 'unchanged', 'appended' or 'replaced'.
+
+    Notes
+    -----
+    Contents are compared by hash, ignoring the header lines with the generation time and command.
+    If the old content is the beginning of the new one, only the new lines are appended (and the old header is kept).
+    Otherwise, the file is atomically replaced.
+    """
+    if not os.path.exists(file):
+        _write_atomic(file, text)
+        return "created"
+
+    with open(file, encoding="UTF-8") as f:
+        old = _stable(f.read())
+    new = _stable(text)
+
+    if _digest(old) == _digest(new):
+        return "unchanged"
+
+    if len(new) > len(old) and _digest(new[: len(old)]) == _digest(old):
+        with open(file, "a", encoding="UTF-8") as f:
+            f.write(new[len(old) :])
+        return "appended"
+
+    _write_atomic(file, text)
+    return "replaced"
+
+
+def replace_if_changed(src, dst):
+    """Move a file to a destination, leaving the destination untouched if it has the same content.
+
+    Returns
+    -------
+    bool
+        True if the destination was replaced.
+    """
+    if os.path.exists(dst):
+        with open(src, "rb") as f, open(dst, "rb") as g:
+            if _stable(f.read().decode("UTF-8")) == _stable(g.read().decode("UTF-8")):
+                os.remove(src)
+                return False
+
+    os.replace(src, dst)
+    return True
+
+
+def update_link_to_dir(dir, link, extra_names=None, message="", time_format="mjd", yfmt="{:.10e}"):
+    """Save link data to daily files in a directory, as tintervals.rocitlinks.save_link_to_dir,
+    but only writing files whose content changed (see update_file) and updating their entries in the query index.
+    Timetags are written with a resolution adequate to the link step (also shorter than 1 s).
+
+    Parameters
+    ----------
+    dir : str
+        Output directory.
+    link : Link
+        Link to be saved.
+    extra_names : list, optional
+        Names of extra data columns (if more than 3), by default None (no extra columns)
+    message : str, optional
+        Message to be written in the header, by default ''
+    time_format : ['mjd', 'iso', 'unix'], optional
+        Output time format, by default 'mjd'
+    yfmt : str, optional
+        Format of the link delta, by default '{:.10e}'
+
+    Returns
+    -------
+    dict
+        Status of each daily file (see update_file).
+    """
+    save_link_metadata(dir, link)
+    sub = os.path.join(dir, link.name)
+
+    status = {}
+    for filename, mask in link_days(link):
+        header, body = format_link(
+            link, mask, extra_names=extra_names, message=message, time_format=time_format, yfmt=yfmt
+        )
+        status[filename] = update_file(os.path.join(sub, filename), header + body)
+
+    index_files(sub, status)
+    return status
@@ -0,0 +1,214 @@
+"""
+Resumable processing of long date ranges.
+The start-stop range is split in shards (days or Circular T months) that are processed independently.
+Each shard writes its outputs in a staging directory and its completion is recorded in a manifest file.
+Completed shards are merged in the final output directory only at the end, so that an interrupted run can be resumed from the first incomplete shard.
+
+"""
+
+import copy
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from tqdm import tqdm
+
+from super_auto_comb.query import INDEX_FILE, index_files
+from super_auto_comb.save_files import append_file, append_table_file, replace_if_changed
+from super_auto_comb.uptime import COVERAGE_SUFFIXES, UPTIME_SUFFIX, load_intervals, update_uptime
+
+SHARD_DIR = ".shards"
+MANIFEST = "manifest.json"
+
+
+def generate_shards(start, stop, mode="day"):
+    """Split a date range in shards.
+
+    Parameters
+    ----------
+    start : float
+        Start date as MJD.
+    stop : float
+        Stop date as MJD.
+    mode : str, optional
+        'day' for daily shards or 'cirt' for Circular T months, by default 'day'
+
+    Returns
+    -------
+    list of tuples
+        (label, start, stop) for each shard, with start and stop as MJD.
+    """
+    import tintervals as ti
+
+    if mode == "day":
+        edges = np.arange(np.floor(start), stop, 1.0)
+        vals = np.column_stack((edges, edges + 1))
+        labels = [ti.mjd2iso(x)[:10] for x in vals[:, 0]]
+    elif mode == "cirt":
+        vals = ti.cirtvals(start, stop)
+        labels = ["{}-{:02d}".format(*ti.mjd2cirt(x)) for x in vals[:, 0]]
+    else:
+        raise ValueError("Unrecognized shard mode. Valid modes are 'day' and 'cirt'.")
+
+    shards = []
+    for label, (s, e) in zip(labels, vals):
+        s = max(start, s)
+        e = min(stop, e)
+        if e > s:
+            shards += [(label, float(s), float(e))]
+
+    return shards
+
+
+def load_manifest(file, shards):
+    """Return the labels of completed shards from a manifest file.
+    The manifest is ignored if it was written for a different list of shards.
+    """
+    try:
+        with open(file) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+
+    if [tuple(s) for s in manifest.get("shards", [])] != shards:
+        return []
+
+    return manifest.get("done", [])
+
+
+def save_manifest(file, shards, done, failed=None):
+    """Atomically save the list of shards and completed shards in a manifest file.
+    Failed shards are also recorded with their error (as {label: error}), for information only.
+    """
+    temp = file + ".tmp"
+    with open(temp, "w") as f:
+        json.dump({"shards": shards, "done": done, "failed": failed or {}}, f, indent=1)
+    os.replace(temp, file)
+
+
+def merge_shard_dir(shard_dir, dir, span=None):
+    """Move all files from a shard staging directory to the final output directory.
+    Shards never overlap in time, so that daily output files from a shard replace any existing file (if changed).
+    Files in the top level of the shard directory are tables for the whole run and are appended instead.
+    Uptime intervals replace the existing ones in the span of the shard (and coverage tables are recalculated).
+    Query indexes are updated for the replaced files.
+
+    Parameters
+    ----------
+    shard_dir : str
+        Shard staging directory.
+    dir : str
+        Output directory.
+    span : tuple, optional
+        (start, stop) MJD range of the shard, by default None (uptime intervals are only joined).
+    """
+    for root, dirs, files in os.walk(shard_dir):
+        rel = os.path.relpath(root, shard_dir)
+        out_root = os.path.normpath(os.path.join(dir, rel))
+        if files and not os.path.exists(out_root):
+            os.makedirs(out_root)
+
+        status = {}
+        for file in files:
+            if rel == "." and file.endswith(".jsonl"):
+                # JSON lines (e.g. events) have no header, all lines are appended
+                append_file(os.path.join(root, file), os.path.join(out_root, file))
+            elif rel == ".":
+                append_table_file(os.path.join(root, file), os.path.join(out_root, file))
+            elif file.endswith(UPTIME_SUFFIX):
+                update_uptime(out_root, file[: -len(UPTIME_SUFFIX)], load_intervals(os.path.join(root, file)), span)
+            elif file.endswith(tuple(COVERAGE_SUFFIXES.values())) or file == INDEX_FILE:
+                continue
+            elif replace_if_changed(os.path.join(root, file), os.path.join(out_root, file)) and file.endswith(".dat"):
+                status[file] = "replaced"
+
+        index_files(out_root, status)
+
+    shutil.rmtree(shard_dir)
+
+
+def shard_args(args, label, start, stop):
+    """Return a copy of the arguments for processing a single shard."""
+    new = copy.copy(args)
+    new.start = repr(start)
+    new.stop = repr(stop)
+    new.dir = os.path.join(args.dir, SHARD_DIR, label)
+    new.auto = False
+    new.shard = None
+    return new
+
+
+def run_shards(args, start, stop, process):
+    """Process a date range in shards, resuming from a previous interrupted run if possible.
+    The exception of a failed shard is re-raised after recording the failure in the manifest (pending shards are not started).
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed CLI arguments.
+    start : float
+        Start date as MJD.
+    stop : float
+        Stop date as MJD.
+    process : callable
+        Function processing a single shard from its arguments and the whole (start, stop) range (typically cli.main).
+
+    Returns
+    -------
+    bool
+        True if all shards were processed and merged.
+    """
+    shards = generate_shards(start, stop, args.shard)
+
+    stage_dir = os.path.join(args.dir, SHARD_DIR)
+    if not os.path.exists(stage_dir):
+        os.makedirs(stage_dir)
+    manifest = os.path.join(stage_dir, MANIFEST)
+
+    done = load_manifest(manifest, shards)
+    todo = [s for s in shards if s[0] not in done]
+    if done:
+        tqdm.write(f"Resuming from shard {todo[0][0] if todo else '-'} ({len(done)}/{len(shards)} shards completed).")
+
+    # discard partial outputs of interrupted shards
+    for label, s, e in todo:
+        shutil.rmtree(os.path.join(stage_dir, label), ignore_errors=True)
+
+    # a failed shard stops the run (after recording it in the manifest), that can be resumed after fixing the failure
+    if args.jobs > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = {executor.submit(process, shard_args(args, *s), (start, stop)): s[0] for s in todo}
+            for future in as_completed(futures):
+                label = futures[future]
+                try:
+                    future.result()
+                except BaseException as e:
+                    for f in futures:
+                        f.cancel()
+                    save_manifest(manifest, shards, done, failed={label: repr(e)})
+                    tqdm.write(f"Shard {label} failed: {e!r}; rerun to resume.")
+                    raise
+                done += [label]
+                save_manifest(manifest, shards, done)
+    else:
+        for s in todo:
+            try:
+                process(shard_args(args, *s), (start, stop))
+            except BaseException as e:
+                save_manifest(manifest, shards, done, failed={s[0]: repr(e)})
+                tqdm.write(f"Shard {s[0]} failed: {e!r}; rerun to resume.")
+                raise
+            done += [s[0]]
+            save_manifest(manifest, shards, done)
+
+    # merge in order, so that later shards take precedence in shared metadata files
+    for label, s, e in shards:
+        shard_dir = os.path.join(stage_dir, label)
+        if os.path.exists(shard_dir):
+            merge_shard_dir(shard_dir, args.dir, (s, e))
+
+    shutil.rmtree(stage_dir)
+
+    return True
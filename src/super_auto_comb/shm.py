@@ -0,0 +1,204 @@
+"""
+Publishing of processed data in shared memory ring buffers, for downstream consumers on the same host.
+Each DO has a fixed-size ring buffer of (t, y, flag) records preceded by a small header with the write index, the DO name and its nominal frequency.
+The writer also publishes the index it is writing up to before writing records (as a seqlock), so that readers can discard records overwritten while they copy them.
+Buffers outlive the writer process, so that consumers can still read the latest data between runs (use RingWriter.unlink to remove them).
+
+"""
+
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+HEADER = np.dtype([("index", "<i8"), ("writing", "<i8"), ("size", "<i8"), ("do", "S32"), ("nominal", "S64")])
+RECORD = np.dtype([("t", "<f8"), ("y", "<f8"), ("flag", "<i8")])
+
+
+def shm_name(prefix, do):
+    """Return the name of the shared memory ring buffer of a DO."""
+    return f"{prefix}_{do}"
+
+
+def _open(name, create=False, size=0):
+    # shared memory is unlinked by the resource tracker when the process that opened it exits
+    # (even if only attached, before Python 3.13), so it is not tracked
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, create=create, size=size, track=False)
+
+    shm = shared_memory.SharedMemory(name, create=create, size=size)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _unlink(shm):
+    if sys.version_info < (3, 13):
+        # unlink also unregisters from the resource tracker
+        resource_tracker.register(shm._name, "shared_memory")
+    shm.unlink()
+
+
+def _views(shm):
+    header = np.ndarray((), dtype=HEADER, buffer=shm.buf)
+    records = np.ndarray((int(header["size"]),), dtype=RECORD, buffer=shm.buf, offset=HEADER.itemsize)
+    return header, records
+
+
+class RingWriter:
+    """Writer of processed data of a DO to a shared memory ring buffer.
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory block.
+    do : str
+        DO name.
+    size : int, optional
+        Number of records in the ring buffer, by default 86400 (one day of 1 s data)
+    nominal : str, optional
+        Nominal frequency of the DO, by default ''
+
+    Notes
+    -----
+    An existing buffer with the same name is reused (and its write index continued) if it has the same size.
+    There should be a single writer for each buffer.
+    """
+
+    def __init__(self, name, do, size=86400, nominal=""):
+        try:
+            self.shm = _open(name, create=True, size=HEADER.itemsize + size * RECORD.itemsize)
+            header = np.ndarray((), dtype=HEADER, buffer=self.shm.buf)
+            header["index"] = 0
+            header["writing"] = 0
+            header["size"] = size
+        except FileExistsError:
+            self.shm = _open(name)
+
+        self.header, self.records = _views(self.shm)
+        if len(self.records) != size:
+            size = len(self.records)
+            self.close()
+            raise ValueError(f"Shared memory {name} already exists with a different size ({size} records).")
+
+        self.header["do"] = do.encode()
+        self.header["nominal"] = nominal.encode()
+
+    @property
+    def size(self):
+        return len(self.records)
+
+    def write(self, data, nominal=None):
+        """Write processed data to the ring buffer.
+
+        Parameters
+        ----------
+        data : ndarray
+            Processed data (timetags, y, flag) as columns.
+        nominal : str, optional
+            Nominal frequency of the DO, by default None (unchanged)
+        """
+        if nominal is not None:
+            self.header["nominal"] = nominal.encode()
+
+        n = len(data)
+        if n == 0:
+            return
+
+        # only the last records fit in the buffer
+        index = int(self.header["index"]) + n
+        data = data[-self.size :]
+        # records before index - size are overwritten from now on
+        self.header["writing"] = index
+        pos = (index - len(data) + np.arange(len(data))) % self.size
+        self.records["t"][pos] = data[:, 0]
+        self.records["y"][pos] = data[:, 1]
+        self.records["flag"][pos] = data[:, 2]
+
+        # publish the new index only after the records are written
+        self.header["index"] = index
+
+    def close(self):
+        """Close the access to the ring buffer (the buffer is not removed)."""
+        self.header = self.records = None
+        self.shm.close()
+
+    def unlink(self):
+        """Remove the ring buffer."""
+        _unlink(self.shm)
+
+
+def open_writers(prefix, dos, size=86400):
+    """Return a dict of RingWriter for each DO, with buffers named PREFIX_DO."""
+    return {do: RingWriter(shm_name(prefix, do), do, size=size) for do in dos}
+
+
+class RingReader:
+    """Reader of processed data of a DO from a shared memory ring buffer.
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory block.
+
+    Examples
+    --------
+    >>> reader = RingReader("super_auto_comb_LoYb")
+    >>> index = 0
+    >>> records, index, lost = reader.read(index)
+    >>> records["y"]
+    """
+
+    def __init__(self, name):
+        self.shm = _open(name)
+        self.header, self.records = _views(self.shm)
+
+    @property
+    def do(self):
+        return self.header["do"].item().decode()
+
+    @property
+    def nominal(self):
+        return self.header["nominal"].item().decode()
+
+    @property
+    def index(self):
+        return int(self.header["index"])
+
+    def read(self, since=0):
+        """Read records written since a given write index.
+
+        Parameters
+        ----------
+        since : int, optional
+            Write index of the last read, by default 0 (all records still in the buffer)
+
+        Returns
+        -------
+        records : ndarray
+            Structured array of records with fields t, y and flag (a copy of the buffer).
+        index : int
+            Current write index, to be used in the next read.
+        lost : int
+            Number of records written since the given index that are not returned, as they were overwritten by the writer
+            (before or while reading). Reading more often or a larger buffer avoid losing records.
+        """
+        index = self.index
+        size = len(self.records)
+        since = max(since, 0)
+        first = max(since, index - size)
+
+        start = first % size
+        stop = start + index - first
+        if stop <= size:
+            records = self.records[start:stop].copy()
+        else:
+            records = np.concatenate((self.records[start:], self.records[: stop - size]))
+
+        # records overwritten while copying them, if the writer started a new write in the meantime
+        valid = min(max(first, int(self.header["writing"]) - size), index)
+        return records[valid - first :], index, valid - since
+
+    def close(self):
+        """Close the access to the ring buffer."""
+        self.header = self.records = None
+        self.shm.close()
@@ -0,0 +1,129 @@
+"""
+Summary statistics of processed data (counts, uptime, mean and Allan deviation).
+These are calculated during processing for each DO and output segment, so that they do not require to reload the outputs.
+
+"""
+
+import numpy as np
+
+# octave averaging times in units of the data step
+OCTAVES = 2 ** np.arange(17)
+
+
+def window_means(y, valid, m):
+    """Return the mean of data in sliding windows of m points, using cumulative sums.
+
+    Parameters
+    ----------
+    y : ndarray
+        Input data on a regular grid.
+    valid : ndarray of bool
+        Mask of valid data.
+    m : int
+        Number of points in the window.
+
+    Returns
+    -------
+    means : ndarray
+        Mean of each window (starting at each point of the grid).
+    full : ndarray of bool
+        True for windows where all data is valid.
+    """
+    cs = np.concatenate(([0.0], np.cumsum(np.where(valid, y, 0.0))))
+    cn = np.concatenate(([0], np.cumsum(valid)))
+
+    means = (cs[m:] - cs[:-m]) / m
+    full = (cn[m:] - cn[:-m]) == m
+    return means, full
+
+
+def adev(t, y, flag, taus=OCTAVES, step=1.0):
+    """Overlapping Allan deviation of fractional frequency data with gaps.
+
+    Parameters
+    ----------
+    t : ndarray
+        Timetags in s.
+    y : ndarray
+        Fractional frequency data.
+    flag : ndarray
+        Data flags (data with flag = 0 is discarded).
+    taus : array_like, optional
+        Averaging times in units of step, by default octaves from 1 to 2**16
+    step : float, optional
+        Time step of the data in s, by default 1.
+
+    Returns
+    -------
+    ndarray
+        Overlapping Allan deviation for each tau (nan if no pair of adjacent windows is fully valid).
+
+    Notes
+    -----
+    Data is placed on a regular grid where missing and flagged points are gaps.
+    Window averages are calculated from cumulative sums and only adjacent windows without gaps are compared.
+    """
+    taus = np.atleast_1d(taus).astype(int)
+    out = np.full(taus.shape, np.nan)
+
+    valid = flag > 0
+    if not valid.any():
+        return out
+
+    idx = np.around((t - t[0]) / step).astype(int)
+    n = idx[-1] + 1
+
+    # remove the mean for better numerical precision of the cumulative sums
+    grid_y = np.zeros(n)
+    grid_y[idx[valid]] = y[valid] - np.mean(y[valid])
+    grid_valid = np.zeros(n, dtype=bool)
+    grid_valid[idx[valid]] = True
+
+    for i, m in enumerate(taus):
+        if 2 * m > n:
+            break
+        means, full = window_means(grid_y, grid_valid, m)
+        pairs = full[:-m] & full[m:]
+        if pairs.any():
+            diff = means[m:][pairs] - means[:-m][pairs]
+            out[i] = np.sqrt(0.5 * np.mean(diff**2))
+
+    return out
+
+
+def summary(t, y, flag, taus=OCTAVES, step=1.0):
+    """Return a summary of processed data.
+
+    Parameters
+    ----------
+    t : ndarray
+        Timetags in s.
+    y : ndarray
+        Fractional frequency data.
+    flag : ndarray
+        Data flags (data with flag = 0 is discarded).
+    taus : array_like, optional
+        Averaging times for the Allan deviation in units of step, by default octaves from 1 to 2**16
+    step : float, optional
+        Time step of the data in s, by default 1.
+
+    Returns
+    -------
+    dict
+        Number of points, valid points, uptime, mean y and Allan deviation at each tau.
+    """
+    valid = flag > 0
+    nvalid = int(np.sum(valid))
+
+    res = {
+        "points": len(t),
+        "valid": nvalid,
+        "uptime": nvalid * step / (t[-1] - t[0] + step) if len(t) > 0 else 0.0,
+        "mean": np.mean(y[valid]) if nvalid > 0 else np.nan,
+    }
+
+    dev = adev(t, y, flag, taus=taus, step=step) if len(t) > 0 else np.full(len(taus), np.nan)
+    for tau, d in zip(taus, dev):
+        res[f"adev_{tau * step:g}"] = d
+
+    return res
@@ -0,0 +1,261 @@
+"""
+Live ingest of comb data from a K+K counter streaming its lines on a TCP socket.
+Lines are processed in micro-batches with the same timetag regularization, deglitching and conversion of comb files,
+and results are appended to the daily output files.
+A local simulator replaying K+K files allows to test and benchmark the stream offline.
+
+"""
+
+import argparse
+import copy
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from tqdm import tqdm
+
+from super_auto_comb.events import flush_events
+from super_auto_comb.load_files import fix_summer_time_folds, loadkk, regularize_timetags
+from super_auto_comb.shm import open_writers
+
+
+class KKSimulator:
+    """A local TCP server replaying K+K files line by line, optionally at an accelerated rate.
+
+    Parameters
+    ----------
+    fnames : str or list of str
+        K+K files to be replayed (in order) to each client.
+    host : str, optional
+        Host address, by default 'localhost'
+    port : int, optional
+        Port, by default 0 (any free port, see the port attribute)
+    rate : float, optional
+        Lines sent per second, by default 1. (real time for 1 s gate time). If 0, send as fast as possible.
+
+    Examples
+    --------
+    >>> with KKSimulator("220321_1_Frequ.txt", rate=100) as sim:
+    ...     for lines in read_kk_stream("localhost", sim.port):
+    ...         pass
+    """
+
+    def __init__(self, fnames, host="localhost", port=0, rate=1.0):
+        if isinstance(fnames, str):
+            fnames = [fnames]
+        self.fnames = fnames
+        self.rate = rate
+
+        sim = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                sim.replay(self.wfile)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def replay(self, wfile):
+        """Write the lines of the files to a file-like object, pacing them at the simulator rate."""
+        t0 = time.perf_counter()
+        sent = 0
+        try:
+            for fname in self.fnames:
+                with open(fname, "rb") as f:
+                    for line in f:
+                        if self.rate > 0:
+                            wait = t0 + sent / self.rate - time.perf_counter()
+                            if wait > 0:
+                                time.sleep(wait)
+                        wfile.write(line)
+                        sent += 1
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def start(self):
+        """Start serving in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def read_kk_stream(host, port, batch=60, timeout=None):
+    """Read lines from a K+K TCP stream in micro-batches.
+
+    Parameters
+    ----------
+    host : str
+        Host address.
+    port : int
+        Port.
+    batch : int, optional
+        Number of lines in each micro-batch, by default 60
+    timeout : float, optional
+        Socket timeout in s, by default None (wait forever)
+
+    Yields
+    ------
+    list of str
+        Lines read. The last batch may be shorter when the stream is closed.
+    """
+    with (
+        socket.create_connection((host, port), timeout=timeout) as sock,
+        sock.makefile("r", encoding="UTF-8") as f,
+    ):
+        lines = []
+        for line in f:
+            # K+K files start with an empty line
+            if not line.strip():
+                continue
+            lines += [line]
+            if len(lines) >= batch:
+                yield lines
+                lines = []
+        if lines:
+            yield lines
+
+
+def kk_stream(batches, fix_summer_time=False, max_columns=12, name="stream", gate_time=1.0, tz=None):
+    """Parse micro-batches of K+K lines, regularizing timetags continuously across batches.
+
+    Parameters
+    ----------
+    batches : iterable of list of str
+        Micro-batches of lines, as from read_kk_stream.
+    fix_summer_time : bool, optional
+        If true, it will try to fix discontinuities due to summer time, by default False
+    max_columns : int, optional
+        max number of columns to read, by default 12
+    name : str, optional
+        Name of the stream used in messages, by default 'stream'
+    gate_time : float, optional
+        Gate time of the counter in s, by default 1.
+    tz : str, optional
+        Timezone of the timetags (e.g. "Europe/Rome"), by default None (system local timezone)
+
+    Yields
+    ------
+    ndarray
+        Data of each micro-batch, in the same layout as genfromkk.
+    """
+    previous = None
+    for lines in batches:
+        alldata = loadkk(lines, max_columns=max_columns, skip_header=0, tz=tz)
+        if alldata.size == 0:
+            continue
+
+        t = alldata[:, 0]
+        if fix_summer_time:
+            # fixed here, so that the next batch continues from the fixed raw timetag
+            t = fix_summer_time_folds(t, tz=tz, previous=None if previous is None else previous[0], name=name)
+        raw_last = t[-1]
+        t2, idx = regularize_timetags(t, name=name, previous=previous, gate_time=gate_time)
+        alldata = alldata[idx]
+        if len(alldata) == 0:
+            continue
+        alldata[:, 0] = t2
+        previous = (raw_last, t2[-1])
+
+        yield alldata
+
+
+def run_stream(args, start, stop):
+    """Process a K+K stream, appending results to the outputs.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed CLI arguments (args.stream as HOST:PORT).
+    start : float
+        Start date as MJD (earlier data is discarded).
+    stop : float
+        Stop date as MJD (later data is discarded).
+
+    Returns
+    -------
+    int
+        Number of lines processed.
+
+    Notes
+    -----
+    Deglitching is applied to each micro-batch, so that the batch should be longer than the median filter window.
+    """
+    from super_auto_comb.process import load_setups, process_data, publish_outputs, save_outputs
+    from super_auto_comb.save_files import append_link_to_dir
+
+    host, port = args.stream.rsplit(":", 1)
+
+    if args.decimate:
+        # bins would be split between micro-batches
+        tqdm.write("Decimated outputs are not saved when streaming.")
+        args = copy.copy(args)
+        args.decimate = None
+
+    in_setups, out_setups = load_setups(args, (start, stop))
+    writers = open_writers(args.shm, args.do, size=args.shm_size) if args.shm else {}
+
+    batches = read_kk_stream(host, int(port), batch=args.stream_batch)
+    bar = tqdm(desc=f"Streaming from {args.stream}", unit=" lines")
+    for alldata in kk_stream(
+        batches,
+        fix_summer_time=not args.do_not_fix_summer_time,
+        max_columns=args.max_columns,
+        name=args.stream,
+        gate_time=args.gate_time,
+        tz=args.timezone,
+    ):
+        data_out = process_data(alldata, args, in_setups, start, stop)
+        save_outputs(data_out, args, in_setups, out_setups, start, stop, save=append_link_to_dir)
+        if writers:
+            publish_outputs(data_out, args, in_setups, writers)
+        bar.update(len(alldata))
+        # events of a stream are written as they come
+        flush_events()
+
+    bar.close()
+    for writer in writers.values():
+        writer.close()
+    return bar.n
+
+
+def simulator():
+    """Entry point for a K+K stream simulator replaying files."""
+    parser = argparse.ArgumentParser(description="Replay K+K files on a TCP socket.")
+    parser.add_argument("files", nargs="+", help="K+K files to be replayed.")
+    parser.add_argument("--host", default="localhost", help="Host address.")
+    parser.add_argument("--port", type=int, default=5025, help="Port.")
+    parser.add_argument("--rate", type=float, default=1.0, help="Lines per second (0 = as fast as possible).")
+    args = parser.parse_args()
+
+    files = [os.path.abspath(f) for f in args.files]
+    sim = KKSimulator(files, host=args.host, port=args.port, rate=args.rate)
+    print(f"Replaying {len(files)} files on {args.host}:{sim.port} at {args.rate} lines/s.")
+    try:
+        sim.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.server.server_close()
+
+
+if __name__ == "__main__":
+    simulator()
@@ -0,0 +1,222 @@
+"""
+Sweep of deglitching parameters, for tuning thresholds of new DOs.
+Each comb file is read once and the deglitching masks are evaluated for a grid of parameters,
+reusing the quantities that do not depend on them (beat notes, y, peak-to-peak of double counting, rolling medians).
+Rejected points, mean and Allan deviation of each DO for each grid point are saved in a single table.
+
+"""
+
+import itertools
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from super_auto_comb.deglitch import (
+    deglitch_from_bounds,
+    deglitch_from_double_counting,
+    deglitch_from_f0,
+    deglitch_from_median_filter,
+    rolling_median,
+)
+from super_auto_comb.stats import summary
+
+SWEEP_FILE = "super-auto-sweep.txt"
+
+
+def sweep_grid(args):
+    """Return the grid of deglitching parameters to be evaluated.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed CLI arguments. Values of args.sweep_* options are swept, other parameters are as in args.
+
+    Returns
+    -------
+    list of dict
+        Parameters median_window (s, None without median filter), median_threshold (Hz), f0_threshold (Hz),
+        glitch_ext (points) and threshold (double counting in Hz, None for the value in the DO setup).
+    """
+    from super_auto_comb.process import F0_THRESHOLD, default_glitch_ext
+
+    median = args.median_filter or args.sweep_median_window or args.sweep_median_threshold
+    windows = (args.sweep_median_window or [args.median_filter_window]) if median else [None]
+    thresholds = (args.sweep_median_threshold or [args.median_filter_threshold]) if median else [None]
+
+    grid = itertools.product(
+        windows,
+        thresholds,
+        args.sweep_f0_threshold or [F0_THRESHOLD],
+        args.sweep_glitch_ext or [default_glitch_ext(args.gate_time)],
+        args.sweep_threshold or [None],
+    )
+    keys = ["median_window", "median_threshold", "f0_threshold", "glitch_ext", "threshold"]
+    return [dict(zip(keys, x)) for x in grid]
+
+
+def sweep_segment(q, grid, gate_time=1.0):
+    """Evaluate deglitching masks of a segment for a grid of parameters.
+
+    Parameters
+    ----------
+    q : dict
+        Quantities of the segment, as returned by process.segment_inputs.
+    grid : list of dict
+        Deglitching parameters, as returned by sweep_grid.
+    gate_time : float, optional
+        Gate time of the counter in s, by default 1.
+
+    Returns
+    -------
+    list of ndarray
+        For each grid point, the masks (mask1, mask2, mask3, mask4) as a boolean array of shape (4, n).
+    """
+    mask1 = deglitch_from_bounds(q["red_data"], q["bounds"])
+    ones = np.ones_like(mask1)
+
+    # intermediate results shared by grid points
+    masks2 = {}
+    rolled = {}
+
+    res = []
+    for p in grid:
+        threshold = q["threshold"] if p["threshold"] is None else p["threshold"]
+        key2 = (threshold, p["glitch_ext"])
+        if key2 not in masks2:
+            masks2[key2] = deglitch_from_double_counting(q["los_data"], threshold, glitch_ext=p["glitch_ext"])
+        mask2 = masks2[key2]
+
+        mask3 = deglitch_from_f0(q["f0_meas"], f0_nominal=q["f0_nominal"], threshold=p["f0_threshold"])
+
+        mask4 = ones
+        if p["median_window"] is not None:
+            premask = mask1 & mask2 & mask3
+            window = max(1, round(p["median_window"] / gate_time))
+            key4 = key2 + (p["f0_threshold"], window)
+            if key4 not in rolled:
+                rolled[key4] = rolling_median(q["f_beat"], premask, window)
+            mask4 = deglitch_from_median_filter(
+                q["f_beat"],
+                premask=premask,
+                median_window=window,
+                median_threshold=p["median_threshold"],
+                glitch_ext=p["glitch_ext"],
+                rolled=rolled[key4],
+            )
+
+        res += [np.vstack((mask1, mask2, mask3, mask4))]
+
+    return res
+
+
+def sweep_rows(do, grid, t, y, masks, step=1.0):
+    """Return the rows of the sweep table of a DO.
+
+    Parameters
+    ----------
+    do : str
+        DO name.
+    grid : list of dict
+        Deglitching parameters.
+    t : ndarray
+        Timetags in s.
+    y : ndarray
+        Fractional frequency data.
+    masks : iterable of ndarray
+        For each grid point, the masks (mask1, mask2, mask3, mask4) as a boolean array of shape (4, n).
+    step : float, optional
+        Time step of the data in s, by default 1.
+
+    Returns
+    -------
+    list of dict
+        Parameters, points rejected by each mask (a point may be rejected by more masks), and summary statistics of valid data.
+    """
+    rows = []
+    for p, m in zip(grid, masks):
+        rejected = {
+            "rejected_bounds": int(np.sum(~m[0])),
+            "rejected_double_counting": int(np.sum(~m[1])),
+            "rejected_f0": int(np.sum(~m[2])),
+            "rejected_median": int(np.sum(~m[3])),
+        }
+        rows += [{"do": do, **p, **rejected, **summary(t, y, m.all(axis=0), step=step)}]
+    return rows
+
+
+def run_sweep(args, start, stop):
+    """Evaluate a grid of deglitching parameters on comb data from start to stop, saving a table in the output directory.
+
+    Parameters
+    ----------
+    args : Namespace
+        Parsed CLI arguments.
+    start : float
+        Start date as MJD.
+    stop : float
+        Stop date as MJD.
+
+    Returns
+    -------
+    list of dict
+        Rows of the table.
+    """
+    import pandas as pd
+
+    from super_auto_comb.cli import comb_loader, find_comb_files, group_comb_files
+    from super_auto_comb.load_files import prefetch
+    from super_auto_comb.process import compact_setups, load_setups, segment_inputs, setup_channels, setup_segments
+    from super_auto_comb.readers import reader_patterns
+    from super_auto_comb.utils import generate_dates
+
+    files = find_comb_files(args.comb_dir, generate_dates(start, stop), reader_patterns(args.reader))
+    if not files:
+        tqdm.write("No files to be processed.")
+        return []
+
+    grid = sweep_grid(args)
+    in_setups, _ = load_setups(args, (start, stop))
+
+    # for each DO, timetags, y and bit-packed masks for each grid point
+    ts = [[] for d in args.do]
+    ys = [[] for d in args.do]
+    masks = [[[] for p in grid] for d in args.do]
+
+    names, fnames = group_comb_files(args, files)
+    channels = setup_channels(in_setups)
+    in_setups = compact_setups(in_setups, channels)
+    read, load = comb_loader(args, channels)
+    file_bar = tqdm(names)
+    for fili, content in zip(file_bar, prefetch(read, fnames, depth=args.prefetch)):
+        file_bar.set_description(f"Sweeping {len(grid)} parameters on {os.path.basename(fili)[:-4]}")
+        alldata = load(content)
+
+        for doi, do in enumerate(args.do):
+            for s, data in setup_segments(alldata, in_setups[doi], start, stop):
+                if len(data) == 0:
+                    continue
+                q = segment_inputs(data, s)
+                ts[doi] += [data[:, 0].copy()]
+                ys[doi] += [q["y"]]
+                # masks are kept bit-packed until the end of the sweep
+                for i, m in enumerate(sweep_segment(q, grid, gate_time=args.gate_time)):
+                    masks[doi][i] += [(np.packbits(m, axis=-1), len(data))]
+
+    rows = []
+    for doi, do in enumerate(args.do):
+        if not ts[doi]:
+            continue
+        # masks of a grid point are unpacked only when needed
+        unpacked = (
+            np.concatenate([np.unpackbits(m, axis=-1, count=n).astype(bool) for m, n in segments], axis=-1)
+            for segments in masks[doi]
+        )
+        rows += sweep_rows(do, grid, np.concatenate(ts[doi]), np.concatenate(ys[doi]), unpacked, step=args.gate_time)
+
+    if rows:
+        if not os.path.exists(args.dir):
+            os.makedirs(args.dir)
+        pd.DataFrame(rows).to_csv(os.path.join(args.dir, SWEEP_FILE), sep="\t", index=False)
+
+    return rows
@@ -0,0 +1,221 @@
+"""
+Uptime of processed data as intervals of valid data.
+For each link, intervals are saved next to the outputs (in MJD, as [start, stop] in the tintervals convention),
+together with coverage tables with the uptime for each day and Circular T month.
+Uptime queries and overlaps between links can then be calculated without loading the data.
+
+"""
+
+import os
+
+import numpy as np
+
+UPTIME_SUFFIX = "_uptime.txt"
+COVERAGE_SUFFIXES = {"day": "_coverage_day.txt", "cirt": "_coverage_cirt.txt"}
+
+
+def valid_intervals(t, flag, step=1.0):
+    """Return the intervals of valid data.
+
+    Parameters
+    ----------
+    t : ndarray
+        Timetags in s (sorted).
+    flag : ndarray
+        Data flags (data with flag = 0 is not valid).
+    step : float, optional
+        Time step of the data in s, by default 1.
+        Each timetag is valid from t to t + step.
+
+    Returns
+    -------
+    ndarray
+        Intervals (start, stop) in s of contiguous valid data.
+    """
+    tv = t[flag > 0]
+    if len(tv) == 0:
+        return np.empty((0, 2))
+
+    # a new interval starts after a gap of missing or invalid data
+    breaks = np.flatnonzero(np.diff(tv) > 1.5 * step)
+    starts = tv[np.r_[0, breaks + 1]]
+    stops = tv[np.r_[breaks, len(tv) - 1]] + step
+
+    return np.column_stack((starts, stops))
+
+
+def merge_intervals(a, tol=0.0):
+    """Merge sorted intervals, joining touching or overlapping intervals.
+
+    Parameters
+    ----------
+    a : ndarray
+        Intervals (start, stop), sorted by start.
+    tol : float, optional
+        Intervals separated by less than tol are also joined, by default 0.
+
+    Returns
+    -------
+    ndarray
+        Merged intervals.
+    """
+    if len(a) == 0:
+        return np.empty((0, 2))
+
+    # running maximum of stops, so that intervals contained in previous ones are also merged
+    stops = np.maximum.accumulate(a[:, 1])
+    new = np.r_[True, a[1:, 0] > stops[:-1] + tol]
+    starts = a[new, 0]
+    ends = stops[np.r_[np.flatnonzero(new)[1:] - 1, len(a) - 1]]
+    return np.column_stack((starts, ends))
+
+
+def update_intervals(old, new, span=None, tol=0.0):
+    """Update intervals with new ones, replacing old intervals in the span of the new data.
+
+    Parameters
+    ----------
+    old : ndarray
+        Existing intervals (start, stop).
+    new : ndarray
+        New intervals (start, stop).
+    span : tuple, optional
+        (start, stop) range of the new data, by default None (intervals are only joined).
+    tol : float, optional
+        Intervals separated by less than tol are joined, by default 0.
+
+    Returns
+    -------
+    ndarray
+        Updated and merged intervals.
+    """
+    old = np.asarray(old, dtype=float).reshape(-1, 2)
+    new = np.asarray(new, dtype=float).reshape(-1, 2)
+
+    if span is not None:
+        # cut old intervals at the edges of the span
+        before = np.column_stack((old[:, 0], np.minimum(old[:, 1], span[0])))
+        after = np.column_stack((np.maximum(old[:, 0], span[1]), old[:, 1]))
+        old = np.concatenate((before, after))
+        old = old[old[:, 1] > old[:, 0]]
+
+    res = np.concatenate((old, new))
+    res = res[np.argsort(res[:, 0], kind="stable")]
+    return merge_intervals(res, tol=tol)
+
+
+def uptime(a, bins):
+    """Return the uptime of intervals in bins.
+
+    Parameters
+    ----------
+    a : ndarray
+        Non-overlapping intervals (start, stop), sorted.
+    bins : ndarray
+        Bins (start, stop).
+
+    Returns
+    -------
+    ndarray
+        Total length of the intervals in each bin.
+    """
+    a = np.asarray(a, dtype=float).reshape(-1, 2)
+    bins = np.asarray(bins, dtype=float).reshape(-1, 2)
+    if len(a) == 0:
+        return np.zeros(len(bins))
+
+    lengths = a[:, 1] - a[:, 0]
+    cum = np.r_[0.0, np.cumsum(lengths)]
+
+    def up_to(x):
+        # uptime from the first interval up to x
+        k = np.searchsorted(a[:, 0], x, side="right") - 1
+        kk = np.maximum(k, 0)
+        partial = np.clip(x - a[kk, 0], 0, lengths[kk])
+        return np.where(k >= 0, cum[kk] + partial, 0.0)
+
+    return up_to(bins[:, 1]) - up_to(bins[:, 0])
+
+
+def coverage(a, mode="day"):
+    """Return the coverage of intervals for each day or Circular T month.
+
+    Parameters
+    ----------
+    a : ndarray
+        Non-overlapping intervals (start, stop) in MJD, sorted.
+    mode : str, optional
+        'day' or 'cirt', by default 'day'
+
+    Returns
+    -------
+    ndarray
+        Rows (start, stop, uptime, fraction) with start and stop in MJD and uptime in s, for each day or month with data.
+    """
+    import tintervals as ti
+
+    if len(a) == 0:
+        return np.empty((0, 4))
+
+    if mode == "day":
+        bins = ti.regvals(a[0, 0], a[-1, 1], base=1.0)
+    elif mode == "cirt":
+        bins = ti.cirtvals(a[0, 0], a[-1, 1])
+    else:
+        raise ValueError("Unrecognized coverage mode. Valid modes are 'day' and 'cirt'.")
+
+    up = uptime(a, bins) * 86400.0
+    res = np.column_stack((bins, up, up / (86400.0 * (bins[:, 1] - bins[:, 0]))))
+    return res[up > 0]
+
+
+def load_intervals(file):
+    """Load intervals in MJD from a file, returning an empty array if the file does not exist."""
+    if not os.path.exists(file):
+        return np.empty((0, 2))
+    return np.loadtxt(file, ndmin=2)
+
+
+def update_uptime(dir, name, intervals, span=None):
+    """Update the uptime intervals and coverage tables of a link.
+
+    Parameters
+    ----------
+    dir : str
+        Output directory.
+    name : str
+        Link name.
+    intervals : ndarray
+        New intervals (start, stop) in MJD.
+    span : tuple, optional
+        (start, stop) MJD range of the new data, replacing existing intervals, by default None (intervals are only joined).
+
+    Returns
+    -------
+    ndarray
+        Updated intervals.
+    """
+    file = os.path.join(dir, name + UPTIME_SUFFIX)
+    # intervals are saved with a resolution of 1e-8 days
+    res = update_intervals(load_intervals(file), intervals, span, tol=1e-8)
+
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+
+    temp = file + ".tmp"
+    np.savetxt(
+        temp, res, fmt="%.8f", delimiter="\t", header=f"Intervals of valid data for {name}\nstart (MJD)\tstop (MJD)"
+    )
+    os.replace(temp, file)
+
+    for mode, suffix in COVERAGE_SUFFIXES.items():
+        what = "Circular T month" if mode == "cirt" else mode
+        np.savetxt(
+            os.path.join(dir, name + suffix),
+            coverage(res, mode),
+            fmt=["%.6f", "%.6f", "%.3f", "%.6f"],
+            delimiter="\t",
+            header=f"Coverage of {name} for each {what}\nstart (MJD)\tstop (MJD)\tuptime (s)\tfraction",
+        )
+
+    return res
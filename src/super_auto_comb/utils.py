@@ -1,8 +1,21 @@
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 
 import numpy as np
 import pytz
-import tintervals as ti
+
+# MJD of the unix epoch, as in tintervals
+# (tintervals is not imported here as it is slow to import and these utilities are needed also for no-op runs)
+MJD_EPOCH = 40587.0
+
+
+def _datetime2mjd(d):
+    """Same as tintervals.datetime2mjd."""
+    return d.timestamp() / 86400.0 + MJD_EPOCH
+
+
+def _mjd2datetime(mjd):
+    """Same as tintervals.mjd2datetime."""
+    return datetime.fromtimestamp((mjd - MJD_EPOCH) * 86400.0, tz=timezone.utc)
 
 
 # smart start/stop interpretation
@@ -27,7 +40,7 @@ def parse_input_date(s):
     except ValueError:
         # cannot convert to float -> try date
         # round to the nearest integer MJD (probably quicker than messing up with timezones)
-        d = np.round(ti.datetime2mjd(datetime.strptime(s, "%Y-%m-%d")))
+        d = np.round(_datetime2mjd(datetime.strptime(s, "%Y-%m-%d")))
         return d
 
     if d > 1:
@@ -35,7 +48,7 @@ def parse_input_date(s):
         return d
     else:
         # negative, 0 or 1 -> previous days
-        return np.floor(ti.datetime2mjd(datetime.today())) + d
+        return np.floor(_datetime2mjd(datetime.today())) + d
 
 
 def generate_dates(start, stop):
@@ -53,36 +66,137 @@ def generate_dates(start, stop):
     list of Datetime
 
     """
-    start = ti.mjd2datetime(start)
-    stop = ti.mjd2datetime(stop)
+    start = _mjd2datetime(start)
+    stop = _mjd2datetime(stop)
     date_generated = [start + timedelta(days=-1) + timedelta(days=x) for x in range(0, (stop - start).days + 1)]
     return date_generated
 
 
-def is_summer_time_changing_between(date1, date2, timezone="Europe/Rome"):
-    """Check for summer time changes by comparing the timezone infos of two dates.
+# interval between checks of the UTC offset of the system local timezone, whose transitions are not known
+# (transitions of the system local timezone less than a day apart are missed)
+TRANSITION_SCAN = 86400.0
+
+
+def utc_offset(t, tz=None):
+    """Return the UTC offset in s of a timezone at a time.
+
+    Parameters
+    ----------
+    t : float
+        Time as seconds from the epoch.
+    tz : str, optional
+        Timezone name (e.g. "Europe/Rome"), by default None (system local timezone)
+
+    Returns
+    -------
+    float
+        UTC offset in s (local time - UTC).
+    """
+    d = datetime.fromtimestamp(t, timezone.utc)
+    local = d.astimezone() if tz is None else d.astimezone(pytz.timezone(tz))
+    return local.utcoffset().total_seconds()
+
+
+def _scan_transitions(start, stop, tz=None):
+    # UTC offsets are checked every TRANSITION_SCAN and transitions are found by bisection to the second
+    grid = np.r_[np.arange(np.floor(start), stop, TRANSITION_SCAN), np.ceil(stop)]
+    offsets = [utc_offset(x, tz) for x in grid]
+
+    res = []
+    for lo, hi, a, b in zip(grid[:-1], grid[1:], offsets[:-1], offsets[1:]):
+        if a == b:
+            continue
+        while hi - lo > 1:
+            mid = np.floor((lo + hi) / 2)
+            if utc_offset(mid, tz) == a:
+                lo = mid
+            else:
+                hi = mid
+        res += [(hi, a, b)]
+    return res
+
+
+def tz_transitions(start, stop, tz=None):
+    """Return the transitions of the UTC offset of a timezone in a time range.
+    Transitions of named timezones are read from the tz database (as in pytz, up to 2037).
+    Transitions of the system local timezone are found checking its offset every day (see TRANSITION_SCAN).
 
     Parameters
     ----------
-    date1 : datetime
-        First datetime.
-    date2 : datetime
-        Second datetime.
-    timezone : str
-        Timezone name, by default "Europe/Rome".
+    start : float
+        Start of the range as seconds from the epoch.
+    stop : float
+        Stop of the range as seconds from the epoch.
+    tz : str, optional
+        Timezone name (e.g. "Europe/Rome"), by default None (system local timezone)
 
     Returns
     -------
-    bool
-        True if the two dates as different times.
+    times : ndarray
+        Times of the transitions (first second with the new offset) as seconds from the epoch.
+    before : ndarray
+        UTC offsets in s before each transition.
+    after : ndarray
+        UTC offsets in s after each transition.
     """
-    # https://stackoverflow.com/questions/69483502/is-there-a-way-to-infer-in-python-if-a-date-is-the-actual-day-in-which-the-dst
-    # check for summertime change
+    if tz is None:
+        res = _scan_transitions(start, stop)
+    else:
+        zone = pytz.timezone(tz)
+        # timezones with a fixed offset (e.g. UTC) have no transitions
+        utc_times = getattr(zone, "_utc_transition_times", [])
+        info = getattr(zone, "_transition_info", [])
+
+        res = []
+        for i in range(1, len(utc_times)):
+            a = info[i - 1][0].total_seconds()
+            b = info[i][0].total_seconds()
+            t = utc_times[i].replace(tzinfo=timezone.utc).timestamp()
+            # transitions of the name or of the dst flag only do not change the offset
+            if a != b and start <= t < stop:
+                res += [(t, a, b)]
+
+    times, before, after = np.array(res, dtype=float).reshape(-1, 3).T
+    return times, before, after
+
+
+def local_to_utc(naive, tz=None):
+    """Convert local times to seconds from the epoch, with the UTC offset of each time from the transitions of the timezone.
 
-    local_start = pytz.timezone(timezone).localize(date1)
-    local_end = pytz.timezone(timezone).localize(date2)
-    summertime_changed = local_start.tzinfo != local_end.tzinfo
-    return summertime_changed
+    Parameters
+    ----------
+    naive : ndarray
+        Local times as seconds from the epoch (as if local time was UTC).
+    tz : str, optional
+        Timezone name (e.g. "Europe/Rome"), by default None (system local timezone)
+
+    Returns
+    -------
+    ndarray
+        Seconds from the epoch.
+
+    Notes
+    -----
+    Local times repeated when the offset decreases (end of summer time) are converted as their first occurrence,
+    and local times skipped when the offset increases with the offset before the transition (as datetime with fold=0).
+    """
+    naive = np.asarray(naive, dtype=float)
+    if len(naive) == 0:
+        return naive
+
+    lo, hi = np.min(naive) - 86400.0, np.max(naive) + 86400.0
+    times, before, after = tz_transitions(lo, hi, tz)
+    offsets = np.r_[utc_offset(lo, tz), after]
+    if len(times) == 0:
+        return naive - offsets[0]
+
+    # interval between transitions with the latest local start before each time
+    k = np.searchsorted(times + after, naive, side="right")
+    # ... or the previous one, if the time is also before its local end
+    prev = np.maximum(k - 1, 0)
+    k = np.where((k > 0) & (naive < times[prev] + before[prev]), k - 1, k)
+
+    return naive - offsets[k]
 
 
 def today():
@@ -1,4 +1,6 @@
-from super_auto_comb.calc import beat2y
+import numpy as np
+
+from super_auto_comb.calc import beat2y, decimate
 
 
 def test_beat2y():
@@ -13,3 +15,16 @@ def test_beat2y():
         )
         == 0.0
     )
+
+
+def test_decimate():
+    t = np.arange(1000.0, 1250.0)
+    y = np.ones_like(t)
+    flag = np.ones_like(t)
+    flag[:5] = 0
+    y[:5] = 1e3
+
+    res = decimate(np.column_stack((t, y, flag)), 100)
+    assert np.array_equal(res[:, 0], [1000.0, 1100.0, 1200.0])
+    assert np.array_equal(res[:, 1], [1.0, 1.0, 1.0])
+    assert np.array_equal(res[:, 3], [95, 100, 50])
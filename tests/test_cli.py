@@ -1,9 +1,14 @@
+import json
+import os
 import shutil
+import subprocess
+import sys
 
 import numpy as np
+import pandas as pd
 import tintervals.rocitlinks as rl
 
-from super_auto_comb.cli import main, parse_args
+from super_auto_comb.cli import comb_loader, main, parse_args
 
 
 def test_parse_args():
@@ -63,6 +68,18 @@ def test_main_with_median_filter():
     assert rocit_data.oscA.name == "INRIM_LoYb"
 
 
+def test_main_with_prefetch_parse():
+    # delete previous results
+    try:
+        shutil.rmtree("./tests/Outputs/")
+    except FileNotFoundError:
+        pass
+    args = parse_args("-c ./tests/samples/super-auto-comb.txt --prefetch-parse --prefetch 1".split(" "))
+    main(args)
+    rocit_data = rl.load_link_from_dir("./tests/Outputs/INRIM_HM-INRIM_LoYb")
+    assert len(rocit_data.t) == 3600
+
+
 def test_main_auto():
     # delete previous results
     try:
@@ -98,3 +115,357 @@ def test_main_with_invalid():
     rocit_data = rl.load_link_from_dir("./tests/Outputs/INRIM_HM-INRIM_LoYb_with_invalid")
     assert len(rocit_data.t) == 1801
     assert rocit_data.oscA.name == "INRIM_LoYb_with_invalid"
+
+
+def test_main_sharded():
+    # delete previous results
+    try:
+        shutil.rmtree("./tests/Outputs/")
+    except FileNotFoundError:
+        pass
+    args = parse_args("-c ./tests/samples/super-auto-comb.txt --shard day".split(" "))
+    main(args)
+    assert not os.path.exists("./tests/Outputs/.shards")
+    rocit_data = rl.load_link_from_dir("./tests/Outputs/INRIM_HM-INRIM_LoYb")
+    assert len(rocit_data.t) == 3600
+    assert rocit_data.oscA.name == "INRIM_LoYb"
+
+
+def test_main_with_stats():
+    # delete previous results
+    try:
+        shutil.rmtree("./tests/Outputs/")
+    except FileNotFoundError:
+        pass
+    args = parse_args("-c ./tests/samples/super-auto-comb.txt --stats".split(" "))
+    main(args)
+    stats = pd.read_csv("./tests/Outputs/super-auto-stats.txt", sep="\t")
+    assert list(stats["do"]) == ["LoYb"]
+    assert list(stats["valid"]) == [3600]
+
+
+def test_import_time():
+    # heavy modules should be imported only by the processing stages that need them
+    code = "import sys, super_auto_comb.cli; print(' '.join(sys.modules))"
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    modules = res.stdout.split()
+    for heavy in ["matplotlib", "pandas", "scipy", "tintervals"]:
+        assert heavy not in modules
+
+
+def test_main_auto_no_new_data(tmp_path):
+    auto_file = tmp_path / "super-auto-last.txt"
+    np.savetxt(auto_file, ["2022-03-25"], fmt="%s")
+    code = f"""import sys
+from super_auto_comb.cli import comb_loader, main, parse_args
+args = parse_args("--do LoYb --auto --auto-file {auto_file} --comb-dir ./tests/samples --setup-dir ./tests/samples --dir {tmp_path}".split(" "))
+main(args)
+print(' '.join(sys.modules))"""
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    modules = res.stdout.split()
+    for heavy in ["matplotlib", "pandas", "scipy", "tintervals"]:
+        assert heavy not in modules
+    # the last processed date is not updated
+    assert list(np.atleast_1d(np.loadtxt(auto_file, dtype=str))) == ["2022-03-25"]
+
+
+def test_main_with_ratio(tmp_path):
+    args = parse_args(
+        f"--do LoYb LoYb_with_invalid --ratio LoYb LoYb_with_invalid --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {tmp_path}/Figures --comb-dir ./tests/samples --setup-dir ./tests/samples".split(
+            " "
+        )
+    )
+    main(args)
+    rocit_data = rl.load_link_from_dir(os.path.join(tmp_path, "INRIM_LoYb_with_invalid-INRIM_LoYb"))
+    assert rocit_data.oscA.name == "INRIM_LoYb"
+    assert rocit_data.oscB.name == "INRIM_LoYb_with_invalid"
+
+    single = rl.load_link_from_dir(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb_with_invalid"))
+    assert len(rocit_data.t) == len(single.t)
+
+    # both DOs measure the same beatnote, so that the ratio deviates from the nominal ratio by -0.03 Hz/nominal
+    assert np.allclose(rocit_data.delta, -0.03 / 518_295_836_590_863.6, rtol=1e-3, atol=0)
+
+    # the header has the nominal ratio B/A
+    fname = os.path.join(
+        tmp_path, "INRIM_LoYb_with_invalid-INRIM_LoYb", "2022-03-21_INRIM_LoYb_with_invalid-INRIM_LoYb.dat"
+    )
+    with open(fname) as f:
+        header = f.read()
+    assert "# Ratio LoYb_with_invalid/LoYb measured on" in header
+    assert "# Nominal ratio = 518_295_836_590_863.63/518_295_836_590_863.6\n" in header
+
+
+def test_main_with_decimate(tmp_path):
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {tmp_path}/Figures --comb-dir ./tests/samples --setup-dir ./tests/samples --decimate 100 86400".split(
+            " "
+        )
+    )
+    main(args)
+    rocit_data = rl.load_link_from_dir(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb"))
+    valid = rocit_data.flag > 0
+    fname = os.path.join("INRIM_HM-INRIM_LoYb", "2022-03-21_INRIM_HM-INRIM_LoYb.dat")
+
+    dec = np.genfromtxt(os.path.join(tmp_path, "100s", fname))
+    assert len(dec) == len(np.unique(np.floor(rocit_data.t[valid] / 100)))
+    assert dec[:, 3].sum() == np.sum(valid)
+
+    daily = np.atleast_2d(np.genfromtxt(os.path.join(tmp_path, "86400s", fname)))
+    assert len(daily) == 1
+    assert np.isclose(daily[0, 1], np.mean(rocit_data.delta[valid]), rtol=1e-8, atol=0)
+
+
+def test_main_with_gate_time(tmp_path):
+    # resample the sample file to 100 ms gate time
+    with open("./tests/samples/220321_1_Frequ.txt") as f:
+        lines = f.read().splitlines()
+    with open(os.path.join(tmp_path, "220321_1_Frequ.txt"), "w") as f:
+        f.write(lines[0] + "\n")
+        f.writelines(
+            f"220321*{i // 36000:02d}{i // 600 % 60:02d}{i // 10 % 60:02d}.{i % 10}01" + line[17:] + "\n"
+            for i, line in enumerate(lines[1:])
+        )
+
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {tmp_path}/Figures --comb-dir {tmp_path} --setup-dir ./tests/samples --gate-time 0.1".split(
+            " "
+        )
+    )
+    main(args)
+    data = np.genfromtxt(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb", "2022-03-21_INRIM_HM-INRIM_LoYb.dat"))
+    assert len(data) == 3600
+    assert np.allclose(np.diff(data[:, 0]) * 86400, 0.1, atol=0.01)
+
+
+def test_main_with_uptime(tmp_path):
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {tmp_path}/Figures --comb-dir ./tests/samples --setup-dir ./tests/samples --uptime".split(
+            " "
+        )
+    )
+    main(args)
+    rocit_data = rl.load_link_from_dir(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb"))
+    intervals = np.loadtxt(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb_uptime.txt"), ndmin=2)
+    assert np.isclose(np.sum(np.diff(intervals)) * 86400, np.sum(rocit_data.flag > 0), atol=0.01)
+
+    days = np.loadtxt(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb_coverage_day.txt"), ndmin=2)
+    assert np.allclose(days[:, :2], [[59659, 59660]])
+    assert np.isclose(days[0, 2], np.sum(rocit_data.flag > 0), atol=0.01)
+
+    # processing again leaves the same intervals
+    main(args)
+    assert np.array_equal(np.loadtxt(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb_uptime.txt"), ndmin=2), intervals)
+
+
+def test_main_plan(tmp_path):
+    plan_file = os.path.join(tmp_path, "plan.json")
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59661 --dir {tmp_path}/Outputs --comb-dir ./tests/samples --setup-dir ./tests/samples --shard day --figures --plan {plan_file}".split(
+            " "
+        )
+    )
+    main(args)
+    with open(plan_file) as f:
+        plan = json.load(f)
+
+    assert [f["file"] for f in plan["files"]] == ["220321_1_Frequ.txt"]
+    assert plan["rows"] == 3600
+    assert plan["figures"] == 1
+    assert plan["dos"]["LoYb"]["output_segments"] == [""]
+    assert len(plan["shards"]) == 3
+    assert sum(s["rows"] for s in plan["shards"]) == 3600
+    assert np.isclose(sum(s["fraction"] for s in plan["stages"].values()), 1, atol=0.01)
+    # nothing is processed
+    assert not os.path.exists(os.path.join(tmp_path, "Outputs"))
+
+
+def test_main_with_merge_counters(tmp_path):
+    # LoYb beat notes counted by a second counter (a copy of the first one)
+    comb_dir = tmp_path / "comb"
+    setup_dir = tmp_path / "setup"
+    comb_dir.mkdir()
+    setup_dir.mkdir()
+    shutil.copy("./tests/samples/220321_1_Frequ.txt", comb_dir / "220321_1_Frequ.txt")
+    shutil.copy("./tests/samples/220321_1_Frequ.txt", comb_dir / "220321_2_Frequ.txt")
+    shutil.copy("./tests/samples/comb2.dat", setup_dir / "comb2.dat")
+    setup = pd.read_csv("./tests/samples/LoYb.dat", sep="\t", dtype=str)
+    setup["counter1"] = "23"
+    setup["counter2"] = "24"
+    setup.to_csv(setup_dir / "LoYb.dat", sep="\t", index=False)
+
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path}/Merged --fig-dir {tmp_path}/Figures --comb-dir {comb_dir} --setup-dir {setup_dir} --merge-counters".split(
+            " "
+        )
+    )
+    main(args)
+    merged = rl.load_link_from_dir(os.path.join(tmp_path, "Merged", "INRIM_HM-INRIM_LoYb"))
+
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path}/Single --fig-dir {tmp_path}/Figures --comb-dir ./tests/samples --setup-dir ./tests/samples".split(
+            " "
+        )
+    )
+    main(args)
+    single = rl.load_link_from_dir(os.path.join(tmp_path, "Single", "INRIM_HM-INRIM_LoYb"))
+
+    assert np.array_equal(merged.data, single.data)
+    assert os.path.exists(os.path.join(tmp_path, "Figures", "LoYb", "220321_1+2_Frequ.npz"))
+
+    # the plan joins the files of the counters, reading both
+    plan_file = os.path.join(tmp_path, "plan.json")
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --comb-dir {comb_dir} --setup-dir {setup_dir} --merge-counters --plan {plan_file}".split(
+            " "
+        )
+    )
+    main(args)
+    with open(plan_file) as f:
+        plan = json.load(f)
+    (planned,) = plan["files"]
+    assert planned["file"] == "220321_1+2_Frequ.txt"
+    assert planned["read"] == ["220321_1_Frequ.txt", "220321_2_Frequ.txt"]
+    assert plan["rows"] == 3600
+    assert plan["stages"]["parse"]["units"] == 7200
+
+
+def test_main_batch(tmp_path, monkeypatch):
+    import super_auto_comb.cli
+    import super_auto_comb.readers
+
+    configs = []
+    for name, extra in [("Operational", "flag = 2\nstats = True"), ("Experimental", "median-filter = True")]:
+        config = tmp_path / f"{name}.txt"
+        config.write_text(
+            f"do = [LoYb]\nstart = 59658\nstop = 59660\ndir = {tmp_path}/{name}\nfig-dir = {tmp_path}/Figures\n"
+            f"comb-dir = ./tests/samples\nsetup-dir = ./tests/samples\n{extra}\n"
+        )
+        configs += [str(config)]
+
+    parsed = []
+
+    def load_comb(*args, **kwargs):
+        parsed.append(args[0])
+        return super_auto_comb.readers.load_comb(*args, **kwargs)
+
+    monkeypatch.setattr(super_auto_comb.cli, "load_comb", load_comb)
+    main(parse_args(["--batch"] + configs))
+
+    # the comb file is parsed once for both configurations
+    assert len(parsed) == 1
+    operational = rl.load_link_from_dir(os.path.join(tmp_path, "Operational", "INRIM_HM-INRIM_LoYb"))
+    experimental = rl.load_link_from_dir(os.path.join(tmp_path, "Experimental", "INRIM_HM-INRIM_LoYb"))
+    assert np.array_equal(operational.data[:, 0], experimental.data[:, 0])
+    assert np.all(operational.flag == 2) and np.all(experimental.flag == 1)
+    assert os.path.exists(os.path.join(tmp_path, "Operational", "super-auto-stats.txt"))
+    assert not os.path.exists(os.path.join(tmp_path, "Experimental", "super-auto-stats.txt"))
+
+
+def test_main_sweep(tmp_path):
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path} --comb-dir ./tests/samples --setup-dir ./tests/samples --sweep --sweep-median-window 30 60 --sweep-f0-threshold 0.25 0.001".split(
+            " "
+        )
+    )
+    main(args)
+    sweep = pd.read_csv(os.path.join(tmp_path, "super-auto-sweep.txt"), sep="\t")
+    assert len(sweep) == 4
+    assert set(sweep["median_window"]) == {30, 60}
+    strict = sweep[sweep["f0_threshold"] == 0.001]
+    loose = sweep[sweep["f0_threshold"] == 0.25]
+    assert (strict["rejected_f0"].values >= loose["rejected_f0"].values).all()
+    # nothing is saved
+    assert not os.path.exists(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb"))
+
+    # the same result of processing with the same parameters
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {tmp_path}/Figures --comb-dir ./tests/samples --setup-dir ./tests/samples --median-filter --median-filter-window 30".split(
+            " "
+        )
+    )
+    main(args)
+    rocit_data = rl.load_link_from_dir(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb"))
+    row = loose[loose["median_window"] == 30].iloc[0]
+    assert row["valid"] == len(rocit_data.t)
+    assert np.isclose(row["mean"], np.mean(rocit_data.data[:, 1]), rtol=1e-6)
+
+
+def test_main_with_diagnostics(tmp_path):
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {tmp_path}/Figures --comb-dir ./tests/samples --setup-dir ./tests/samples --diagnostics".split(
+            " "
+        )
+    )
+    main(args)
+    rocit_data = rl.load_link_from_dir(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb"))
+    diagnostics = pd.read_csv(os.path.join(tmp_path, "super-auto-diagnostics.txt"), sep="\t")
+
+    assert len(diagnostics) == 1
+    row = diagnostics.iloc[0]
+    assert row["file"] == "220321_1_Frequ"
+    assert row["valid"] == len(rocit_data.t)
+    assert row["points"] - row["valid"] <= row["rejected_bounds"] + row["rejected_double_counting"] + row["rejected_f0"]
+    assert row["rejected_median"] == 0
+    assert np.isclose(row["mean_y"], np.mean(rocit_data.data[:, 1]), rtol=1e-6)
+    assert row["ch_dev"] < 0.2
+    assert row["time"] > 0
+
+
+def test_main_with_binary_logs(tmp_path):
+    from super_auto_comb.load_files import loadkk, savebin
+
+    comb_dir = tmp_path / "comb"
+    comb_dir.mkdir()
+    savebin(str(comb_dir / "220321_1_Frequ.bin"), loadkk("./tests/samples/220321_1_Frequ.txt"))
+
+    for name, comb in [("Text", "./tests/samples"), ("Binary", comb_dir)]:
+        args = parse_args(
+            f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path}/{name} --fig-dir {tmp_path}/Figures --comb-dir {comb} --setup-dir ./tests/samples".split(
+                " "
+            )
+        )
+        main(args)
+
+    text = rl.load_link_from_dir(os.path.join(tmp_path, "Text", "INRIM_HM-INRIM_LoYb"))
+    binary = rl.load_link_from_dir(os.path.join(tmp_path, "Binary", "INRIM_HM-INRIM_LoYb"))
+    assert np.array_equal(text.data, binary.data)
+
+
+def test_main_events(tmp_path):
+    comb_dir = tmp_path / "comb"
+    comb_dir.mkdir()
+    shutil.copy("./tests/samples/220321_1_Frequ.txt", comb_dir / "220321_1_Frequ (conflicted).txt")
+
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path}/Outputs --fig-dir {tmp_path}/Figures --comb-dir {comb_dir} --setup-dir ./tests/samples".split(
+            " "
+        )
+    )
+    main(args)
+
+    with open(os.path.join(tmp_path, "Outputs", "super-auto-events.jsonl")) as f:
+        events = [json.loads(line) for line in f]
+    assert [e["type"] for e in events] == ["conflict_resolved"]
+    assert events[0]["file"] == "220321_1_Frequ (conflicted).txt"
+    assert events[0]["merged"] is False
+
+
+def test_comb_loader_channels():
+    from super_auto_comb.process import compact_setups, load_setups, segment_inputs, setup_channels, setup_segments
+
+    args = parse_args(
+        "--do LoYb --start 59658 --stop 59660 --comb-dir ./tests/samples --setup-dir ./tests/samples".split(" ")
+    )
+    in_setups, _ = load_setups(args, (59658, 59660))
+    channels = setup_channels(in_setups)
+    compact = compact_setups(in_setups, channels)
+
+    fname = "./tests/samples/220321_1_Frequ.txt"
+    full = comb_loader(args)[1](fname)
+    alldata = comb_loader(args, channels)[1](fname)
+    # only the used channels are kept, with the same results
+    assert alldata.shape == (len(full), 1 + len(channels))
+    ((s, data),) = setup_segments(full, in_setups[0], 59658, 59660)
+    ((c, compact_data),) = setup_segments(alldata, compact[0], 59658, 59660)
+    assert np.array_equal(segment_inputs(data, s)["y"], segment_inputs(compact_data, c)["y"])
@@ -0,0 +1,63 @@
+import json
+import threading
+
+import numpy as np
+
+from super_auto_comb.events import event_log, log_event, thread_event_log
+from super_auto_comb.load_files import regularize_timetags
+
+
+def read_events(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_event_log(tmp_path):
+    path = tmp_path / "events.jsonl"
+    # no log open
+    log_event("test")
+
+    with event_log(str(path), buffer_size=2) as log:
+        log_event("test", "a.txt", do="LoYb", count=np.int64(1))
+        assert not path.exists()
+        # nested runs share the outer log
+        with event_log(str(tmp_path / "other.jsonl")) as inner:
+            assert inner is log
+            log_event("test", "b.txt")
+        assert len(read_events(path)) == 2
+        log_event("test", "c.txt")
+
+    events = read_events(path)
+    assert [e["file"] for e in events] == ["a.txt", "b.txt", "c.txt"]
+    assert events[0]["do"] == "LoYb" and events[0]["count"] == 1
+    assert not (tmp_path / "other.jsonl").exists()
+
+
+def test_thread_event_log(tmp_path):
+    path = tmp_path / "events.jsonl"
+    other = tmp_path / "other.jsonl"
+    with event_log(str(path)):
+        log_event("test", "a.txt")
+        # events of this thread go to a separate file, events of other threads to the run log
+        with thread_event_log(str(other)):
+            log_event("test", "b.txt")
+            thread = threading.Thread(target=log_event, args=("test", "c.txt"))
+            thread.start()
+            thread.join()
+        log_event("test", "d.txt")
+
+    assert [e["file"] for e in read_events(path)] == ["a.txt", "c.txt", "d.txt"]
+    assert [e["file"] for e in read_events(other)] == ["b.txt"]
+
+
+def test_regularize_timetags_events(tmp_path):
+    path = tmp_path / "events.jsonl"
+    t = np.array([0.0, 1.0, 1.1, 2.0, 3.0])
+    with event_log(str(path)):
+        regularize_timetags(t, name="test.txt")
+
+    (event,) = read_events(path)
+    assert event["type"] == "not_unique_timetags"
+    assert event["file"] == "test.txt"
+    assert event["count"] == 1 and event["removed"] == 1
+    assert event["first"] == 1.0
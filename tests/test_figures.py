@@ -0,0 +1,43 @@
+import os
+from datetime import datetime
+
+from super_auto_comb.cli import main, parse_args
+from super_auto_comb.figures import figure_cli, find_records, load_record, render_figure
+
+
+def test_render_figure(tmp_path):
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {tmp_path}/Figures --comb-dir ./tests/samples --setup-dir ./tests/samples --median-filter --figures".split(
+            " "
+        )
+    )
+    main(args)
+
+    (record,) = find_records(os.path.join(tmp_path, "Figures"), "LoYb", datetime(2022, 3, 21))
+    results, f_beat, title, median_label = load_record(record)
+    assert len(results) == len(f_beat) == 3600
+    assert results.masks.shape == (4, 3600)
+    assert title == "220321_1_Frequ - comb2 - LoYb"
+    assert median_label == "60 s/250.0 Hz"
+
+    # the figure rendered from the record is the same rendered while processing
+    eager = record[:-4] + ".png"
+    lazy = render_figure(record, str(tmp_path / "lazy.png"))
+    with open(eager, "rb") as f, open(lazy, "rb") as g:
+        assert f.read() == g.read()
+
+
+def test_figure_cli(tmp_path):
+    fig_dir = os.path.join(tmp_path, "Figures")
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {fig_dir} --comb-dir ./tests/samples --setup-dir ./tests/samples".split(
+            " "
+        )
+    )
+    main(args)
+    # figures are not rendered while processing
+    assert not any(f.endswith(".png") for _, _, files in os.walk(fig_dir) for f in files)
+
+    (figname,) = figure_cli(["LoYb", "2022-03-21", "--fig-dir", fig_dir])
+    assert os.path.exists(figname)
+    assert figure_cli(["LoYb", "2022-03-22", "--fig-dir", fig_dir]) == []
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from super_auto_comb.fix_files import find_files, fix_files, merge_kk_files
+from super_auto_comb.load_files import KK_TIME_WIDTH, loadkk
+
+
+def test_fix_files(tmp_path):
+    with open("./tests/samples/220321_1_Frequ.txt", "rb") as f:
+        header = f.readline()
+        lines = f.readlines()[:150]
+
+    original = header + b"".join(lines[:100])
+    (tmp_path / "220321_1_Frequ.txt").write_bytes(original)
+    (tmp_path / "220321_1_Frequ (conflicted).txt").write_bytes(header + b"".join(lines[50:]))
+    (tmp_path / "220321_2_Frequ (conflicted).txt").write_bytes(header + b"".join(lines[:10]))
+
+    con_files, counts = fix_files(str(tmp_path), datetime(2022, 3, 21), return_counts=True)
+    counts = dict(zip(con_files, counts))
+    assert counts["220321_1_Frequ (conflicted).txt"] == {"original": 50, "conflicted": 50, "common": 50, "truncated": 0}
+    # no original file to merge with
+    assert counts["220321_2_Frequ (conflicted).txt"] is None
+
+    assert (tmp_path / "220321_1_Frequ.txt").read_bytes() == header + b"".join(lines)
+    assert (tmp_path / "wasconflicted_220321_1_Frequ.txt").read_bytes() == original
+    assert (tmp_path / "wasconflicted_220321_1_Frequ (conflicted).txt").exists()
+    assert (tmp_path / "220321_2_Frequ.txt").read_bytes() == header + b"".join(lines[:10])
+    assert sorted(find_files(str(tmp_path), datetime(2022, 3, 21))) == ["220321_1_Frequ.txt", "220321_2_Frequ.txt"]
+
+
+def test_merge_kk_files_truncated(tmp_path):
+    with open("./tests/samples/220321_1_Frequ.txt", "rb") as f:
+        header = f.readline()
+        lines = f.readlines()[:20]
+
+    # original truncated in the middle of its last line, conflicted truncated without line ending
+    (tmp_path / "original.txt").write_bytes(header + b"".join(lines[:8]) + lines[8][:40])
+    (tmp_path / "conflicted.txt").write_bytes(header + b"".join(lines[10:15]) + lines[15].rstrip(b"\r\n"))
+    count = merge_kk_files(str(tmp_path / "original.txt"), str(tmp_path / "conflicted.txt"), str(tmp_path / "out.txt"))
+    assert count == {"original": 9, "conflicted": 6, "common": 0, "truncated": 2}
+
+    out = (tmp_path / "out.txt").read_bytes().split(b"\r\n")
+    assert out[1:] == [x.rstrip(b"\r\n") for x in lines[:8]] + [lines[8][:40]] + [
+        x.rstrip(b"\r\n") for x in lines[10:16]
+    ] + [b""]
+    # the truncated line is discarded when parsed, and no sample is lost
+    assert len(loadkk(str(tmp_path / "out.txt"))) == 14
+
+    # a truncated line of the conflicted file is replaced by the complete line of the original file
+    (tmp_path / "conflicted.txt").write_bytes(header + b"".join(lines[5:7]) + lines[7][:40])
+    merge_kk_files(str(tmp_path / "original.txt"), str(tmp_path / "conflicted.txt"), str(tmp_path / "out.txt"))
+    assert (tmp_path / "out.txt").read_bytes().startswith(header + b"".join(lines[:8]))
+
+
+def test_merge_kk_files_summer_time(tmp_path):
+    with open("./tests/samples/220321_1_Frequ.txt", "rb") as f:
+        header = f.readline()
+        tail = f.readline()[KK_TIME_WIDTH:]
+
+    # end of summer time: local timetags go back from 02:59:59 to 02:00:00
+    times = ["025957", "025958", "025959", "020000", "020001", "020002", "025957", "025958"]
+    lines = [f"221030*{x}.500".encode() + tail for x in times]
+
+    # a line of the first 02:59:57 only in the original, and of the second one only in the conflicted
+    (tmp_path / "original.txt").write_bytes(header + b"".join(lines[:5]))
+    (tmp_path / "conflicted.txt").write_bytes(header + b"".join(lines[1:3] + lines[4:]))
+    count = merge_kk_files(str(tmp_path / "original.txt"), str(tmp_path / "conflicted.txt"), str(tmp_path / "out.txt"))
+    assert count == {"original": 2, "conflicted": 3, "common": 3, "truncated": 0}
+    assert (tmp_path / "out.txt").read_bytes() == header + b"".join(lines)
@@ -1,7 +1,144 @@
+import threading
+import time
 from datetime import datetime
 
-from super_auto_comb.load_files import genfromkk
+import numpy as np
+
+from super_auto_comb.load_files import (
+    fix_summer_time_folds,
+    genfrombin,
+    genfromkk,
+    genfromkk_counters,
+    loadbin,
+    loadkk,
+    merge_counters,
+    prefetch,
+    read_file,
+    regularize_timetags,
+    savebin,
+)
+from super_auto_comb.utils import local_to_utc
 
 
 def test_genfromkk():
     assert genfromkk("./tests/samples/220321_1_Frequ.txt").shape == (3600, 13)
+
+
+def test_loadkk_skips_malformed_lines():
+    with open("./tests/samples/220321_1_Frequ.txt") as f:
+        lines = f.read().splitlines()[1:5]
+    bad = lines[2][:39] + "abc".rjust(22) + lines[2][61:]
+    data = loadkk([lines[0], "Measurement interval (re-)synchronized!", lines[1][:100], bad, lines[3]], skip_header=0)
+    assert data.shape == (2, 13)
+
+
+def test_regularize_timetags_with_gate_time():
+    rng = np.random.default_rng(0)
+    t = 1647820800.0 + np.arange(1000) * 0.1 + rng.normal(0, 0.005, 1000)
+    t = np.delete(t, [10, 11, 500])
+    t2, _ = regularize_timetags(t, gate_time=0.1)
+    assert len(t2) == 997
+    assert np.allclose(t2 - t, 0, atol=0.03)
+    assert np.array_equal(np.around((t2 - t2[0]) / 0.1), np.delete(np.arange(1000), [10, 11, 500]))
+
+
+def test_regularize_timetags_summer_time():
+    # end of summer time in Rome (2022-10-30 01:00 UTC), with a gap of 1.5 h after the transition
+    transition = 1667091600.0
+    true = np.r_[np.arange(transition - 1800, transition + 1800), np.arange(transition + 7200, transition + 9000)]
+    naive = true + np.where(true < transition, 7200.0, 3600.0)
+    t = local_to_utc(naive, "Europe/Rome")
+
+    t2, _ = regularize_timetags(t, fix_summer_time=True, tz="Europe/Rome")
+    assert np.array_equal(t2, true)
+
+    # a stream split in batches continues after the transition
+    previous = None
+    for part in np.array_split(naive, 7):
+        t = fix_summer_time_folds(local_to_utc(part, "Europe/Rome"), tz="Europe/Rome", previous=previous)
+        previous = t[-1]
+    assert previous == true[-1]
+
+
+def test_loadkk_usecols():
+    fname = "./tests/samples/220321_1_Frequ.txt"
+    full = loadkk(fname)
+    data = loadkk(fname, usecols=[1, 11])
+    assert np.array_equal(data[:, [0, 1, 11]], full[:, [0, 1, 11]])
+    assert np.isnan(data[:, 2]).all()
+
+
+def test_merge_counters():
+    a = np.column_stack((np.arange(10.0), np.ones((10, 2))))
+    b = np.column_stack((np.arange(10.0) + 0.3, 2 * np.ones((10, 2))))
+    b = np.delete(b, 4, axis=0)
+    data = merge_counters([a, b], [1, 3], max_columns=2, tolerance=0.5)
+    assert data.shape == (10, 7)
+    assert np.array_equal(data[:, 0], np.arange(10.0))
+    assert (data[:, 1:3] == 1).all()
+    assert np.isnan(data[:, 3:5]).all()
+    # the row missing from b is kept, with NaN channels of b
+    assert np.isnan(data[4, 5:]).all()
+    assert (np.delete(data, 4, axis=0)[:, 5:] == 2).all()
+
+    # timetags not within tolerance are not joined
+    data = merge_counters([a, b], [1, 2], max_columns=2, tolerance=0.1)
+    assert len(data) == 19
+    assert np.array_equal(np.isnan(data[:, 1]), ~np.isnan(data[:, 3]))
+
+    # an empty counter does not remove data of the others
+    data = merge_counters([a, b[:0]], [1, 2], max_columns=2)
+    assert np.array_equal(data[:, :3], a)
+    assert np.isnan(data[:, 3:]).all()
+
+
+def test_genfromkk_counters(tmp_path):
+    fname = "./tests/samples/220321_1_Frequ.txt"
+    with open(fname, "rb") as f:
+        content = f.read()
+    (tmp_path / "220321_2_Frequ.txt").write_bytes(content)
+
+    data = genfromkk_counters([fname, str(tmp_path / "220321_2_Frequ.txt")], usecols=[1, 23, 24])
+    full = genfromkk(fname)
+    assert data.shape == (len(full), 25)
+    assert np.array_equal(data[:, [0, 1, 23, 24]], full[:, [0, 1, 11, 12]])
+
+
+def test_genfromkk_from_read_file():
+    fname = "./tests/samples/220321_1_Frequ.txt"
+    assert np.array_equal(genfromkk(read_file(fname)), genfromkk(fname))
+
+
+def test_genfrombin(tmp_path):
+    fname = "./tests/samples/220321_1_Frequ.txt"
+    binname = str(tmp_path / "220321_1_Frequ.bin")
+    savebin(binname, loadkk(fname))
+    # a partially written record is ignored
+    with open(binname, "ab") as f:
+        f.write(b"\0" * 20)
+
+    assert np.array_equal(genfrombin(binname), genfromkk(fname))
+    assert np.array_equal(genfrombin(read_file(binname)), genfromkk(fname))
+
+    data = loadbin(binname, usecols=[2], max_columns=4)
+    assert data.shape == (3600, 5)
+    assert np.all(np.isnan(data[:, [1, 3, 4]]))
+
+
+def test_prefetch():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def fun(x):
+        with lock:
+            running.append(x)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(x)
+        return x**2
+
+    assert list(prefetch(fun, range(10), depth=3)) == [x**2 for x in range(10)]
+    assert max(peak) <= 3
+    assert list(prefetch(fun, range(10), depth=0)) == [x**2 for x in range(10)]
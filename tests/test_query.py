@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import tintervals as ti
+import tintervals.rocitlinks as rl
+
+from super_auto_comb.cli import main, parse_args
+from super_auto_comb.query import INDEX_FILE, index_file, query, update_index
+
+
+def test_query(tmp_path):
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {tmp_path}/Figures --comb-dir ./tests/samples --setup-dir ./tests/samples --decimate 100".split(
+            " "
+        )
+    )
+    main(args)
+    link_dir = os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb")
+    rocit_data = rl.load_link_from_dir(link_dir)
+    mjd = ti.epoch2mjd(rocit_data.t)
+
+    # the index is saved next to the data as it is written
+    assert os.path.exists(os.path.join(link_dir, INDEX_FILE))
+
+    # reindex with marks every 10 min
+    index = update_index(link_dir, mark=600.0)
+    (entry,) = index.values()
+    assert entry["rows"] == len(rocit_data.t)
+    assert len(entry["marks"]) > 1
+
+    start, stop = mjd[0] + 1000.5 / 86400, mjd[0] + 2000.5 / 86400
+    t, y, flag = query("LoYb", start, stop, flagged_only=False, dir=str(tmp_path))
+    sel = (mjd >= start) & (mjd < stop)
+    assert np.allclose(t, mjd[sel], rtol=0, atol=1e-6)
+    assert np.array_equal(y, rocit_data.data[sel, 1])
+    assert np.all(flag > 0)
+
+    t, y, flag = query("LoYb", 59600, 59610, dir=str(tmp_path))
+    assert len(t) == 0
+
+    # decimated outputs
+    t, y, flag = query("LoYb", 59658, 59660, dir=str(tmp_path), base=100)
+    assert 36 <= len(t) <= 37
+
+    # the index does not interfere with loading the links
+    assert len(rl.load_link_from_dir(link_dir).t) == len(rocit_data.t)
+
+
+def test_index_appended(tmp_path):
+    file = os.path.join(tmp_path, "2022-03-21_INRIM_HM-INRIM_LoYb.dat")
+    with open(file, "w") as f:
+        f.write("# header\n")
+        f.writelines(f"{59659 + i / 86400:.6f}\t1e-16\t1\n" for i in range(0, 1800, 10))
+    entry = index_file(file, mark=600.0)
+
+    with open(file, "a") as f:
+        f.writelines(f"{59659 + i / 86400:.6f}\t1e-16\t1\n" for i in range(1800, 3600, 10))
+
+    # appended lines are indexed as if the whole file was
+    assert index_file(file, mark=600.0, entry=entry) == index_file(file, mark=600.0)
+
+
+def test_query_ratio(tmp_path):
+    args = parse_args(
+        f"--do LoYb LoYb_with_invalid --ratio LoYb LoYb_with_invalid --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {tmp_path}/Figures --comb-dir ./tests/samples --setup-dir ./tests/samples".split(
+            " "
+        )
+    )
+    main(args)
+    name = "INRIM_LoYb_with_invalid-INRIM_LoYb"
+    rocit_data = rl.load_link_from_dir(os.path.join(tmp_path, name))
+
+    t, y, flag = query(name, 59658, 59660, flagged_only=False, dir=str(tmp_path))
+    assert len(t) == len(rocit_data.t)
+    assert np.allclose(y, rocit_data.delta, rtol=1e-9, atol=0)
+    assert np.array_equal(flag, rocit_data.flag)
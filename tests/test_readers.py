@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from super_auto_comb.load_files import genfromkk, loadkk, savebin
+from super_auto_comb.readers import load_comb, reader_for
+
+
+def test_reader_for():
+    assert reader_for("220321_1_Frequ.txt")["local_time"]
+    assert not reader_for("/data/220321_1_Frequ.bin")["local_time"]
+    assert reader_for("220321_1_Frequ.txt", "bin") is reader_for("220321_1_Frequ.bin")
+    with pytest.raises(ValueError):
+        reader_for("220321_1_Frequ.csv")
+
+
+def test_load_comb(tmp_path):
+    fname = "./tests/samples/220321_1_Frequ.txt"
+    savebin(tmp_path / "220321_1_Frequ.bin", loadkk(fname))
+    assert np.array_equal(load_comb(str(tmp_path / "220321_1_Frequ.bin")), genfromkk(fname))
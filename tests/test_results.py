@@ -0,0 +1,41 @@
+import numpy as np
+
+from super_auto_comb.results import Results, concatenate
+
+
+def test_results():
+    t = 1647820800.0 + np.delete(np.arange(100.0), [10, 11, 50])
+    y = np.arange(len(t)) * 1e-16
+    flag = np.ones(len(t))
+    masks = np.random.default_rng(0).random((4, len(t))) > 0.5
+
+    res = Results(t, y, flag, masks=masks)
+    assert len(res.runs) == 3
+    assert res.flag.dtype == np.uint8
+    assert np.array_equal(res.t, t)
+    assert np.array_equal(res.masks, masks)
+    assert np.array_equal(res.to_array(), np.column_stack((t, y, flag)))
+    # less than half the memory of the float array (and of the boolean masks)
+    assert res.nbytes < 0.5 * (res.to_array().nbytes + masks.nbytes)
+
+    # slices are views
+    part = res[5:60]
+    assert np.shares_memory(part.y, res.y)
+    assert np.array_equal(part.t, t[5:60])
+    assert np.array_equal(part.masks, masks[:, 5:60])
+
+    part = res.between(t[20], t[30] + 0.5)
+    assert np.array_equal(part.t, t[20:31])
+
+    joined = concatenate([res[:30], res[30:]])
+    assert len(joined.runs) == 3
+    assert np.array_equal(joined.t, t)
+    assert np.array_equal(joined.masks, masks)
+
+
+def test_results_with_gate_time():
+    t = np.round((1647820800.0 + np.arange(50) * 0.1) / 0.1) * 0.1
+    res = Results(t, np.zeros(50), np.ones(50), step=0.1)
+    assert res.regular
+    assert np.array_equal(res.t, t)
+    assert len(res.between(t[10], t[20])) == 10
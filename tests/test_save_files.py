@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+import tintervals.rocitlinks as rl
+
+from super_auto_comb.save_files import update_link_to_dir
+
+
+def test_update_link_to_dir(tmp_path):
+    # two days of data, from 2022-03-20T23:00 UTC
+    t = 1647817200.0 + np.arange(7200.0)
+    data = np.column_stack((t, np.linspace(0, 1e-15, len(t)), np.ones_like(t)))
+    link = rl.Link(data=data[:5000], oscA=rl.Oscillator("A", "1000"), oscB=rl.Oscillator("B", "1"))
+
+    assert update_link_to_dir(tmp_path, link) == {
+        "2022-03-20_B-A.dat": "created",
+        "2022-03-21_B-A.dat": "created",
+    }
+    day2 = os.path.join(tmp_path, "B-A", "2022-03-21_B-A.dat")
+    with open(day2) as f:
+        first = f.read()
+
+    assert set(update_link_to_dir(tmp_path, link).values()) == {"unchanged"}
+
+    link.data = data
+    link._set_view()
+    assert update_link_to_dir(tmp_path, link) == {
+        "2022-03-20_B-A.dat": "unchanged",
+        "2022-03-21_B-A.dat": "appended",
+    }
+    with open(day2) as f:
+        appended = f.read()
+    assert appended.startswith(first)
+    assert len(np.genfromtxt(day2)) == 7200 - 3600
+
+    link.data[-1, 2] = 0
+    assert update_link_to_dir(tmp_path, link)["2022-03-21_B-A.dat"] == "replaced"
+    assert np.genfromtxt(day2)[-1, 2] == 0
@@ -0,0 +1,73 @@
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from super_auto_comb.scheduler import (
+    MANIFEST,
+    SHARD_DIR,
+    generate_shards,
+    load_manifest,
+    merge_shard_dir,
+    run_shards,
+    save_manifest,
+)
+from super_auto_comb.uptime import UPTIME_SUFFIX, load_intervals, update_uptime
+
+
+def test_generate_shards():
+    shards = generate_shards(59658, 59660)
+    assert shards == [("2022-03-20", 59658.0, 59659.0), ("2022-03-21", 59659.0, 59660.0)]
+
+    shards = generate_shards(59658, 59700, mode="cirt")
+    assert [s[0] for s in shards] == ["2022-03", "2022-04", "2022-05"]
+    assert shards[0][1] == 59658.0
+    assert shards[-1][2] == 59700.0
+
+
+def test_manifest(tmp_path):
+    shards = generate_shards(59658, 59660)
+    file = str(tmp_path / "manifest.json")
+    assert load_manifest(file, shards) == []
+
+    save_manifest(file, shards, ["2022-03-20"])
+    assert load_manifest(file, shards) == ["2022-03-20"]
+    # a different range invalidates the manifest
+    assert load_manifest(file, generate_shards(59658, 59661)) == []
+
+
+def test_merge_shard_dir_uptime(tmp_path):
+    dir = str(tmp_path / "Outputs")
+    shard_dir = str(tmp_path / "shard")
+    update_uptime(os.path.join(dir, "Segment"), "LINK", [[59658.2, 59658.8], [59659.2, 59659.8]])
+    update_uptime(os.path.join(shard_dir, "Segment"), "LINK", [[59659.5, 59659.6]])
+
+    # intervals of a reprocessed shard replace the stale ones in its span
+    # events of the shard are appended, also if the first one is the same as in the output
+    event = '{"type": "test"}\n'
+    (tmp_path / "Outputs" / "events.jsonl").write_text(event)
+    (tmp_path / "shard" / "events.jsonl").write_text(event * 2)
+
+    merge_shard_dir(shard_dir, dir, (59659.0, 59660.0))
+    res = load_intervals(os.path.join(dir, "Segment", "LINK" + UPTIME_SUFFIX))
+    assert np.allclose(res, [[59658.2, 59658.8], [59659.5, 59659.6]])
+    assert (tmp_path / "Outputs" / "events.jsonl").read_text() == event * 3
+    assert not os.path.exists(shard_dir)
+
+
+def test_run_shards_failed(tmp_path):
+    args = SimpleNamespace(dir=str(tmp_path), shard="day", jobs=1, auto=False)
+
+    def process(args, span):
+        if args.start == repr(59659.0):
+            raise TypeError("bug")
+
+    # the error is not hidden, and the completed shards are recorded
+    with pytest.raises(TypeError):
+        run_shards(args, 59658, 59660, process)
+    with open(os.path.join(tmp_path, SHARD_DIR, MANIFEST)) as f:
+        manifest = json.load(f)
+    assert manifest["done"] == ["2022-03-20"]
+    assert manifest["failed"] == {"2022-03-21": "TypeError('bug')"}
@@ -0,0 +1,64 @@
+import numpy as np
+
+from super_auto_comb.cli import main, parse_args
+from super_auto_comb.shm import RingReader, RingWriter
+
+
+def test_ring_buffer():
+    writer = RingWriter("super_auto_comb_test_ring", "LoYb", size=100, nominal="'518_295_836_590_863.6'")
+    try:
+        reader = RingReader("super_auto_comb_test_ring")
+        assert reader.do == "LoYb"
+        assert reader.nominal == "'518_295_836_590_863.6'"
+
+        data = np.column_stack((np.arange(250.0), np.arange(250.0) * 1e-18, np.ones(250)))
+        writer.write(data[:60])
+        records, index, lost = reader.read()
+        assert index == 60 and lost == 0
+        assert np.array_equal(records["t"], data[:60, 0])
+
+        # wrap around the end of the buffer
+        writer.write(data[60:130])
+        records, index, lost = reader.read(index)
+        assert index == 130 and lost == 0
+        assert np.array_equal(records["t"], data[60:130, 0])
+
+        # older records are lost
+        writer.write(data[130:])
+        records, index, lost = reader.read(index)
+        assert index == 250 and lost == 20
+        assert np.array_equal(records["y"], data[150:, 1])
+
+        # records are copies, not overwritten by later writes
+        writer.write(data[:100])
+        assert np.array_equal(records["y"], data[150:, 1])
+
+        # a write in progress overwrites the oldest records while they are read
+        writer.header["writing"] = 380
+        records, index, lost = reader.read(250)
+        assert index == 350 and lost == 30
+        assert np.array_equal(records["t"], data[30:100, 0])
+        reader.close()
+    finally:
+        writer.close()
+        writer.unlink()
+
+
+def test_main_with_shm(tmp_path):
+    args = parse_args(
+        f"--do LoYb --start 59658 --stop 59660 --dir {tmp_path} --fig-dir {tmp_path}/Figures --comb-dir ./tests/samples --setup-dir ./tests/samples --shm super_auto_comb_test".split(
+            " "
+        )
+    )
+    main(args)
+
+    reader = RingReader("super_auto_comb_test_LoYb")
+    try:
+        records, index, lost = reader.read()
+        assert index == 3600 and lost == 0
+        assert reader.do == "LoYb"
+        assert reader.nominal == "518_295_836_590_863.6"
+        assert np.all(np.diff(records["t"]) > 0)
+        reader.close()
+    finally:
+        RingWriter("super_auto_comb_test_LoYb", "LoYb", size=86400).unlink()
@@ -0,0 +1,33 @@
+import numpy as np
+
+from super_auto_comb.stats import adev, summary
+
+
+def test_adev_white_noise():
+    rng = np.random.default_rng(0)
+    t = np.arange(100_000.0)
+    y = rng.normal(0, 1e-13, t.shape)
+    flag = np.ones_like(t)
+
+    dev = adev(t, y, flag, taus=[1, 100])
+    assert np.allclose(dev, [1e-13, 1e-14], rtol=0.1)
+
+    # gaps and flagged data reduce the statistics but not the result
+    flag[10_000:20_000] = 0
+    keep = np.ones_like(t, dtype=bool)
+    keep[50_000:60_000] = False
+    dev2 = adev(t[keep], y[keep], flag[keep], taus=[1, 100])
+    assert np.allclose(dev2, dev, rtol=0.1)
+
+
+def test_summary():
+    t = np.arange(10.0)
+    y = np.ones(10)
+    flag = np.array([1] * 5 + [0] * 5)
+    res = summary(t, y, flag, taus=[1, 8])
+    assert res["points"] == 10
+    assert res["valid"] == 5
+    assert res["uptime"] == 0.5
+    assert res["mean"] == 1.0
+    assert res["adev_1"] == 0.0
+    assert np.isnan(res["adev_8"])
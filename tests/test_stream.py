@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import tintervals.rocitlinks as rl
+
+from super_auto_comb.cli import parse_args
+from super_auto_comb.load_files import genfromkk
+from super_auto_comb.stream import KKSimulator, kk_stream, read_kk_stream, run_stream
+
+FNAME = "./tests/samples/220321_1_Frequ.txt"
+
+
+def test_kk_stream():
+    with KKSimulator(FNAME, rate=0) as sim:
+        batches = read_kk_stream("localhost", sim.port, batch=100, timeout=10)
+        data = np.concatenate(list(kk_stream(batches)))
+
+    assert np.array_equal(data, genfromkk(FNAME))
+
+
+def test_run_stream(tmp_path):
+    args = parse_args(
+        f"--do LoYb --dir {tmp_path} --setup-dir ./tests/samples --stream-batch 500 --track-cirt".split(" ")
+    )
+    with KKSimulator(FNAME, rate=0) as sim:
+        args.stream = f"localhost:{sim.port}"
+        assert run_stream(args, 59658, 59660) == 3600
+
+    rocit_data = rl.load_link_from_dir(os.path.join(tmp_path, "INRIM_HM-INRIM_LoYb"))
+    assert len(rocit_data.t) == 3600
+    assert rocit_data.oscA.name == "INRIM_LoYb"
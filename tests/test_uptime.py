@@ -0,0 +1,32 @@
+import numpy as np
+
+from super_auto_comb.uptime import coverage, update_intervals, uptime, valid_intervals
+
+
+def test_valid_intervals():
+    t = np.array([0.0, 1, 2, 3, 4, 5, 8, 9, 10])
+    flag = np.array([1, 1, 0, 1, 1, 1, 1, 1, 0])
+    assert np.array_equal(valid_intervals(t, flag), [[0, 2], [3, 6], [8, 10]])
+    assert valid_intervals(t, np.zeros_like(flag)).shape == (0, 2)
+
+
+def test_update_intervals():
+    old = [[0, 10], [20, 30]]
+    # new data from 5 to 25 replaces old intervals in this span
+    res = update_intervals(old, [[6, 8], [22, 26]], span=(5, 25))
+    assert np.array_equal(res, [[0, 5], [6, 8], [22, 30]])
+    # touching intervals are joined
+    assert np.array_equal(update_intervals(old, [[10, 20]]), [[0, 30]])
+
+
+def test_uptime_and_coverage():
+    a = np.array([[59659.5, 59660.25], [59661.0, 59661.5]])
+    assert np.allclose(uptime(a, [[59659, 59660], [59660, 59661], [59659, 59662]]), [0.5, 0.25, 1.25])
+
+    days = coverage(a, "day")
+    assert np.allclose(days[:, 0], [59659, 59660, 59661])
+    assert np.allclose(days[:, 2], [43200, 21600, 43200])
+
+    months = coverage(a, "cirt")
+    assert len(months) == 1
+    assert np.isclose(months[0, 2], 1.25 * 86400)
@@ -1,14 +1,24 @@
-from datetime import datetime
+import numpy as np
 
-from super_auto_comb.utils import is_summer_time_changing_between
+from super_auto_comb.utils import local_to_utc, tz_transitions
 
 
-def test_is_summer_time_changing_between():
-    assert (
-        is_summer_time_changing_between(datetime(2024, 7, 1), datetime(2024, 8, 1))
-        is False
-    )
-    assert (
-        is_summer_time_changing_between(datetime(2023, 10, 1), datetime(2023, 11, 1))
-        is True
-    )
+def test_local_to_utc():
+    # end of summer time in Rome, 2022-10-30 01:00 UTC
+    times, before, after = tz_transitions(1666000000.0, 1668000000.0, "Europe/Rome")
+    assert list(times) == [1667091600.0]
+    assert list(before) == [7200.0] and list(after) == [3600.0]
+
+    naive = np.array([1667088000.0, 1667093400.0, 1667098800.0])  # 00:00, 01:30 and 03:00 local
+    assert list(naive - local_to_utc(naive, "Europe/Rome")) == [7200.0, 7200.0, 3600.0]
+    assert list(local_to_utc(np.array([1667088000.0]), "UTC")) == [1667088000.0]
+
+
+def test_close_transitions():
+    # summer time in Recife started on 2000-10-08 and was cancelled a week later, 2000-10-15 02:00 UTC
+    times, before, after = tz_transitions(970972000.0, 971700000.0, "America/Recife")
+    assert list(times) == [970974000.0, 971575200.0]
+    assert list(before) == [-10800.0, -7200.0] and list(after) == [-7200.0, -10800.0]
+
+    naive = np.array([970900000.0, 971000000.0, 971600000.0])
+    assert np.array_equal(local_to_utc(naive, "America/Recife"), naive + [10800.0, 7200.0, 10800.0])